@@ -0,0 +1,143 @@
+#!/usr/bin/python3.7
+
+#Carryover store: compressed, checksummed HYSPLIT particle dumps passed between forecast cycles
+
+import os
+import glob
+import gzip
+import hashlib
+import logging
+import datetime as dt
+from set_vog_env import *
+
+### Inputs ###
+retention_hrs = 72 		#default age of carryover files kept in carryover_path (hrs)
+compress_level = 4 		#gzip compression level for particle dumps
+chunk_size = 16 * 1024**2 	#read/write block size (bytes)
+local_parinit = 'PARINIT.carryover' 	#single decompressed carryover shared by all members (in hysplit run directory)
+
+
+### Functions ###
+
+def get_carryover_file(carryover_path, date_str, member=None):
+	'''
+	Get path of compressed carryover file for a cycle (and member, if stored per member)
+	'''
+	name = f'PARINIT.{date_str}' if member is None else f'PARINIT.{date_str}.{member:03d}'
+
+	return os.path.join(carryover_path, name + '.gz')
+
+
+def save_file(parfile, store_file):
+	'''
+	Compress particle dump into the store; checksum of the original data is saved alongside (.sha256)
+	'''
+	checksum = hashlib.sha256()
+	with atomic_write(store_file) as tmp_file:
+		with open(parfile, 'rb') as src, gzip.open(tmp_file, 'wb', compresslevel=compress_level) as dst:
+			for chunk in iter(lambda: src.read(chunk_size), b''):
+				checksum.update(chunk)
+				dst.write(chunk)
+	with atomic_write(store_file + '.sha256') as tmp_file, open(tmp_file, 'w') as f:
+		f.write(checksum.hexdigest() + '\n')
+	logging.debug(f'...saved carryover {parfile} as {store_file}')
+
+	return
+
+
+def restore_file(store_file, parfile):
+	'''
+	Decompress carryover file and validate checksum; returns False if file is missing or corrupt
+	'''
+	if not os.path.isfile(store_file):
+		return False
+
+	checksum = hashlib.sha256()
+	try:
+		with atomic_write(parfile) as tmp_file:
+			with gzip.open(store_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+				for chunk in iter(lambda: src.read(chunk_size), b''):
+					checksum.update(chunk)
+					dst.write(chunk)
+			with open(store_file + '.sha256', 'r') as f:
+				expected = f.read().strip()
+			if checksum.hexdigest() != expected:
+				raise ValueError('checksum mismatch')
+	except (OSError, EOFError, ValueError) as err:
+		logging.warning(f'WARNING: unable to restore carryover {store_file}, ignoring: {err}')
+		return False
+
+	return True
+
+
+def save(carryover_path, date_str, members, per_member=False):
+	'''
+	Save carryover for a cycle: first listed member only (default, reproducible) or every listed member
+	(per member mode also saves the first member as shared carryover, used by members without their own file)
+	-members: members with completed output (failed members must be excluded by the caller)
+	-returns False if there is nothing to save
+	'''
+	if not members:
+		logging.warning(f'WARNING: no completed ensemble members, carryover not saved for {date_str}')
+		return False
+
+	os.makedirs(carryover_path, exist_ok=True)
+	if per_member:
+		for member in members:
+			save_file(f'PARDUMP.{member:03d}', get_carryover_file(carryover_path, date_str, member))
+	save_file(f'PARDUMP.{members[0]:03d}', get_carryover_file(carryover_path, date_str))
+
+	return True
+
+
+def restore(carryover_path, date_str, members, per_member=False):
+	'''
+	Link carryover for all members; shared file is decompressed and validated once
+	-per_member: use member's own carryover where available, shared carryover otherwise
+	-returns True if carryover was found for all members
+	'''
+	shared, missing = None, []
+	for member in members:
+		parinit = f'PARINIT.{member:03d}'
+		if per_member and restore_file(get_carryover_file(carryover_path, date_str, member), parinit):
+			continue
+
+		#decompress shared carryover on first use only (legacy uncompressed files are linked directly)
+		if shared is None:
+			legacy_file = os.path.join(carryover_path, f'PARINIT.{date_str}')
+			if restore_file(get_carryover_file(carryover_path, date_str), local_parinit):
+				shared = local_parinit
+			elif os.path.isfile(legacy_file):
+				shared = legacy_file
+			else:
+				shared = ''
+			if shared:
+				logging.debug(f'Linking carryover vog from: {shared}')
+		if not shared:
+			missing.append(member)
+			continue
+		symlink_force(shared, parinit)
+
+	if missing:
+		logging.warning(f'WARNING: no carryover for {date_str} found for members: {missing}')
+
+	return not missing
+
+
+def prune(carryover_path, date_str, keep_hrs=retention_hrs):
+	'''
+	Remove carryover files older than the retention window (relative to given cycle)
+	'''
+	cutoff = dt.datetime.strptime(date_str, '%Y%m%d%H') - dt.timedelta(hours=keep_hrs)
+	removed = 0
+	for path in glob.glob(os.path.join(carryover_path, 'PARINIT.*')):
+		try:
+			file_date = dt.datetime.strptime(os.path.basename(path).split('.')[1], '%Y%m%d%H')
+		except ValueError:
+			continue
+		if file_date < cutoff:
+			os.remove(path)
+			removed = removed + 1
+	logging.debug(f'...removed {removed} carryover files older than {cutoff}')
+
+	return removed
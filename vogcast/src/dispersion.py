@@ -7,15 +7,19 @@ __author__="Nadya Moisseeva (nadya.moisseeva@hawaii.edu)"
 __date__="July 2021"
 
 import os
+import sys
 import logging
 from set_vog_env import *
+import hys_config
+import hys_ensemble
+import carryover
 import glob
 import datetime as dt
 from random import randrange
 
  ### Fucntions ###
 
-def link_hysplit():
+def link_hysplit(hys_settings):
 	'''
 	Link and copy hysplit config files and executables
 	'''
@@ -23,12 +27,10 @@ def link_hysplit():
 	os.chdir(os.environ['hys_rundir'])
 
 	#set up necessary configuration files
-	os.system('rm *.OK VMSDIST* PARDUMP* MESSAGE* WARNING* *.out *.err cdump* CONC.CFG > /dev/null 2>&1')
+	os.system('rm *.OK PARINIT* *.exit ensemble_status.json VMSDIST* PARDUMP* MESSAGE* WARNING* *.out *.err cdump* CONC.CFG > /dev/null 2>&1')
 	hys_config_path = os.path.join(os.environ['vog_root'],'config','hysplit')
-	os.system('cp ' + hys_config_path + '/CONTROL .')
-	os.system('cp ' + hys_config_path + '/SETUP.CFG .')
 
-	#link static config files
+	#link static config files (CONTROL and SETUP.CFG are rendered from templates)
 	symlink_force(hys_config_path + '/CHEMRATE.TXT', 'CHEMRATE.TXT')
 	slurm_config_path = os.path.join(os.environ['vog_root'],'config','slurm')
 	symlink_force(slurm_config_path + '/hysplit.slurm', 'hysplit.slurm')
@@ -40,8 +42,9 @@ def link_hysplit():
 	symlink_force(bdy_path + '/LANDUSE.ASC', 'LANDUSE.ASC')
 	symlink_force(bdy_path + '/ROUGLEN.ASC', 'ROUGLEN.ASC')	
 
-	#link executable
-	hycs_ens = os.path.join(os.environ['hys_path'],'exec','hycs_ens')
+	#link executable (optionally a stand-in, e.g. config/hysplit/hycs_ens.fake, for testing without hysplit)
+	#(relative paths are taken from vog_root)
+	hycs_ens = os.path.join(os.environ['vog_root'], hys_settings.get('hycs_ens', os.path.join(os.environ['hys_path'],'exec','hycs_ens')))
 	symlink_force(hycs_ens,'./hycs_ens')
 	
 	#TODO: this section is for testing existing GFS runs only
@@ -57,101 +60,79 @@ def edit_hys_config(json_data):
 	'''
 	Edit hysplit configuration settings for the run
 	'''
-	#TODO: all this is pretty ugly, look for more elegant ways
-
 	#get settings from run_json
 	user = json_data['user_defined']
+	hys_settings = user['dispersion']
+	hys_config_path = os.path.join(os.environ['vog_root'],'config','hysplit')
 
-	#edit CONTROL: set start time relative to met
-	sed_command('{spinup}', '{:02d}'.format(int(os.environ['spinup'])) , 'CONTROL')
-	#edit CONTROL:source count
-	src_cnt = str(json_data['plumerise']['src_cnt'])
-	sed_command('{src_cnt}', src_cnt, 'CONTROL')
-	logging.debug(f'Number of single cycle emissions strating points (including vertical) is set to: {src_cnt}')
-	#edit CONTROL: hysplit run hours
-	hys_hrs = str(user['runhrs'] - int(os.environ['spinup']))
-	sed_command('{hys_hrs}', hys_hrs, 'CONTROL')
-	logging.debug('Hysplit run hours set to: %s ' %hys_hrs)
-	#edit CONTROL max domain
-	sed_command('{max_dom}', os.environ['max_dom'], 'CONTROL')
-	#copy arl path data into CONTROL
-	sed_command('{arl_cnt}', json_data['arl_cnt'], 'CONTROL')
-	sed_command('{arl_paths}', json_data['arl'], 'CONTROL')
-	#copy all sources into CONTROL
+	#render CONTROL from template
 	sources = json_data['plumerise']['sources']
-	sed_command('{sources}', sources, 'CONTROL')
-	#set vertical motion option
-	sed_command('{vert_motion}', str(user['dispersion']['vert_motion']), 'CONTROL')
-	logging.debug(f"Vertical motion option is set to {user['dispersion']['vert_motion']}")
-	#set vertical levels
-	lvls = user['dispersion']['lvls']
-	num_lvls = str(len(lvls))
-	sed_command('{num_lvls}', num_lvls, 'CONTROL')
-	lvls_str = " ". join([str(i) for i in lvls])
-	sed_command('{lvls}', lvls_str, 'CONTROL')
-
-	#edit SETUP.CFG	
-	sed_command('{freq}', os.environ['freq'], 'SETUP.CFG')
-	sed_command('{min_zi}', str(user['dispersion']['min_zi']), 'SETUP.CFG')
-	sed_command('{numpar}', str(user['dispersion']['numpar']), 'SETUP.CFG')
-
-	#link carryover vog
+	logging.debug(f'Number of single cycle emissions strating points (including vertical) is set to: {len(sources)}')
+	hys_hrs = user['runhrs'] - int(os.environ['spinup'])
+	logging.debug('Hysplit run hours set to: %s ' %hys_hrs)
+	logging.debug(f"Vertical motion option is set to {hys_settings['vert_motion']}")
+	try:
+		with open(os.path.join(hys_config_path, 'CONTROL'), 'r') as f:
+			control = hys_config.render_control(f.read(), os.environ['spinup'], sources, hys_hrs, \
+							hys_settings['vert_motion'], json_data['arl'], hys_settings['lvls'])
+
+		#render SETUP.CFG from template
+		with open(os.path.join(hys_config_path, 'SETUP.CFG'), 'r') as f:
+			setup = hys_config.render_setup(f.read(), os.environ['freq'], hys_settings['min_zi'], hys_settings['numpar'])
+	except ValueError as err:
+		logging.critical(f'ERROR: invalid HYSPLIT configuration: {err}. Aborting!')
+		sys.exit(1)
+	hys_config.write_config('CONTROL', control)
+	hys_config.write_config('SETUP.CFG', setup)
+
+	#link carryover vog (decompressed and validated once, shared by members unless stored per member)
 	fc_date = dt.datetime.strptime(os.environ['forecast'], '%Y%m%d%H')
 	co_date = fc_date - dt.timedelta(hours=int(os.environ['freq']))
 	co_date_str = co_date.strftime('%Y%m%d%H')
-	carryover_file = os.path.join(user['dispersion']['carryover_path'],'PARINIT.{}'.format(co_date_str))
-	if os.path.isfile(carryover_file):
-		#os.symlink(carryover_file, 'PARINIT')
-		logging.debug('Linking carryover vog from: %s' %carryover_file)
-		#loop through ensemble members
-		for i in range(1,28):
-			#os.symlink(carryover_file, 'PARINIT.{:03d}'.format(i))
-			symlink_force(carryover_file, 'PARINIT.{:03d}'.format(i))
-	else:
+	per_member = hys_settings.get('carryover_members', False)
+	if not carryover.restore(hys_settings['carryover_path'], co_date_str, hys_settings['members'], per_member):
 		logging.warning('WARNING: No carryover found from previous cycle')
 
 	return
 	
-def sed_command(old_str, new_str, filename):
-	'''
-	Constructs and runs shell sed command for replacing config tags
-	'''
-	#construct the command
-	sed_cmd = 'sed -i "s/' + old_str + '/' + new_str + '/g" ' + filename
-
-	#run the command
-	os.system(sed_cmd)
-
-	return
-
-def run_ensemble():
+def run_ensemble(hys_settings):
 	'''
 	Start the ensemble run
 	'''
-
-	#start the run
-	logging.info('...submitting hysplit ensemble to slurm')
-	os.system('sbatch -W hysplit.slurm')
-
-	#make sure all members completed
-	#TODO: needs correction - this doesn't actually ensure successful completion
-	member_cnt = len(glob.glob('./hys_member*.OK'))
-	if member_cnt == 27:
+	#start the run with the selected executor (slurm array by default), retrying failed members
+	executor = hys_settings.get('executor', 'slurm')
+	retries = hys_settings.get('retries', hys_ensemble.max_retries)
+	try:
+		members = hys_settings['members']
+		logging.info(f'...running {len(members)} ensemble members: {members}')
+		summary = hys_ensemble.run_tracked(executor, members, hys_settings.get('workers'), retries)
+	except ValueError as err:
+		logging.critical(f'ERROR: {err}. Aborting!')
+		sys.exit(1)
+
+	#make sure all members completed (exit status and outputs checked for each member)
+	if not summary['failed']:
 		os.system('touch dispersion.OK')
 
-def save_carryover(json_data):
+	return summary
+
+def save_carryover(json_data, summary):
 	'''
-	Save carryover smoke for next run cycle
+	Save carryover smoke for next run cycle and prune old carryover files
 	'''
+	hys_settings = json_data['user_defined']['dispersion']
+	carryover_path = hys_settings['carryover_path']
+
+	#only members that completed have particle dumps (outputs of failed members are removed)
+	completed = [member for member in hys_settings['members'] if summary['status'][str(member)]['status'] == 'ok']
 	
-	#always save .001 as carryover (for reproducible runs)
-	parfile = 'PARDUMP.001'
-	savefile = 'PARINIT.{}'.format(os.environ['forecast'])
-	save_path = os.path.join(json_data['user_defined']['dispersion']['carryover_path'], savefile)
+	#save first completed member (.001 for full ensemble) as carryover (for reproducible runs), or all members if requested
+	per_member = hys_settings.get('carryover_members', False)
+	if carryover.save(carryover_path, os.environ['forecast'], completed, per_member):
+		logging.debug('Saving carryover for {} to {}'.format(os.environ['forecast'], carryover_path))
 
-	#make a copy
-	os.system('cp {} {}'.format(parfile,save_path))
-	logging.debug('Saving carryover: %s as %s' %(parfile, save_path))
+	#remove carryover outside of retention window
+	carryover.prune(carryover_path, os.environ['forecast'], hys_settings.get('carryover_retention', carryover.retention_hrs))
 
 	return
 
@@ -170,17 +151,24 @@ def main():
 	for key in config_keys:
 		set_env_var(hys_settings, key)
 
+	#resolve ensemble members (size or explicit list) once for all steps
+	try:
+		hys_settings['members'] = hys_ensemble.get_members(hys_settings)
+	except ValueError as err:
+		logging.critical(f'ERROR: {err}. Aborting!')
+		sys.exit(1)
+
 	#link config and executables
-	link_hysplit()		
+	link_hysplit(hys_settings)		
 	
 	#edit config for the run
 	edit_hys_config(json_data)
 	
 	#start the run
-	run_ensemble()
+	summary = run_ensemble(hys_settings)
 
 	#save carryover smoke
-	save_carryover(json_data)
+	save_carryover(json_data, summary)
 
 	logging.info('Ensemble dispersion run complete')
 
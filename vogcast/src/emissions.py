@@ -5,13 +5,16 @@
 __date__ = 'July 2021'
 __author__ = 'Nadya Moisseeva (nadya.moisseeva@hawaii.edu)'
 
-import requests
 import datetime as dt
 import logging
 import json
 import os
 import sys
 import pandas as pd
+import numpy as np
+import hvo_api
+import emissions_store
+from concurrent.futures import ThreadPoolExecutor
 from set_vog_env import *
 
 
@@ -19,31 +22,32 @@ from set_vog_env import *
 
 ### Inputs ###
 #url = 'https://hvo-api.wr.usgs.gov/api/so2emissions?channel=SUMDFW&starttime='
-url = 'https://hvo-api.wr.usgs.gov/api/v1/'
+url = hvo_api.url
+emission_workers = 8 	#max number of sources pulled concurrently
 
 
 ### Functions ###
 
-def pull_from_api(url,hvo_subdir,days,select_data,keypath):
+def pull_from_api(url,hvo_subdir,days,select_data,keypath,last_day=1):
 	'''
-	Set up api call and pull data
+	Set up api call and pull data (responses are cached on disk by hvo_api)
+	-last_day: most recent day of the window (flyspec only; window covers days back to last_day)
 	'''
 	if hvo_subdir == 'so2emissions':
+		#window is relative to current time, so the response can only be reused for a limited time
 		api_call = url + hvo_subdir + '/' +  str(days) + 'd'
+		permanent = False
 	elif hvo_subdir == 'flyspec':
 		#make specific api call with limited date to avoid massive empty data dump
 		now = dt.datetime.utcnow()
 		em_start = dt.datetime.strftime(now - dt.timedelta(hours=24*days), '%Y%m%d') + '000000'
-		em_end = dt.datetime.strftime(now - dt.timedelta(hours=24*(days-1)), '%Y%m%d') + '000000'
+		em_end = dt.datetime.strftime(now - dt.timedelta(hours=24*(last_day-1)), '%Y%m%d') + '000000'
 		
 		api_call = url + hvo_subdir + '/' + em_start + '/' + em_end
+		permanent = os.environ.get('runtype') != 'realtime'
 		logging.debug(api_call) 
 
-
-	login = read_config(keypath)
-	response = requests.post(api_call,auth=(login['hvo']['user'],login['hvo']['pwd']),data=json.dumps(select_data))
-
-	return response.json()
+	return hvo_api.post(keypath, api_call, select_data, permanent)
 
 def no_data(response):
 	'''
@@ -86,6 +90,20 @@ def get_campaign_data(keypath,hvo_subdir,select_data):
 	'''
 	Run all the steps for pulling campaign emissions form HVO
 	'''
+	channel, series = select_data['channel'], select_data['series'][0]
+	store = emissions_store.open_store()
+
+	#historic runs: use the local store if it already covers the emissions start
+	if 'forecast' in os.environ:
+		em_date = dt.datetime.strptime(os.environ['forecast']+'UTC', '%Y%m%d%H%Z') + dt.timedelta(hours=int(os.environ['spinup']))
+		logging.debug('...emissions start hour in UTC is {}'.format(em_date))
+		if os.environ.get('runtype') != 'realtime':
+			record = emissions_store.get_nearest(store, channel, series, em_date)
+			if record is not None:
+				store.close()
+				logging.info('...nearest record found in local emissions store: {}'.format(record[1]))
+				return int(record[0]), record[1]
+
 	logging.info('...pulling campaign emissions data from HVO-API')
 
 	#check if a forecast date is set in environ
@@ -96,12 +114,13 @@ def get_campaign_data(keypath,hvo_subdir,select_data):
 		logging.debug('...No forecast date set, getting the most recent data')
 		day = 1
 
-	#loop until we find some data
-	while no_data(pull_from_api(url,hvo_subdir,day,select_data,keypath)):
-		day = day + 1
+	#grow the window until we find some data (records from a longer window still include the nearest one)
+	response = hvo_api.search_window(lambda days: pull_from_api(url,hvo_subdir,days,select_data,keypath), \
+					lambda response: not no_data(response), day)
 
-	#get the data we need
-	response = pull_from_api(url,hvo_subdir,day,select_data,keypath)
+	#keep the records for later reruns
+	emissions_store.ingest(store, channel, series, response)
+	store.close()
 
 	#get the correct index of the record (if forecast mode: use most recent)
 	if 'forecast' in os.environ:
@@ -112,8 +131,6 @@ def get_campaign_data(keypath,hvo_subdir,select_data):
 
 		#use pandas to locate nearest record to emission start datetime and get index
 		pdtime = pd.DatetimeIndex(obs_datetimes_utc)
-		em_date = dt.datetime.strptime(os.environ['forecast']+'UTC', '%Y%m%d%H%Z') + dt.timedelta(hours=int(os.environ['spinup']))
-		logging.debug('...emissions start hour in UTC is {}'.format(em_date))
 		record_idx = pdtime.get_loc(em_date, method='nearest')
 	else:
 		#get the most recent record
@@ -125,12 +142,50 @@ def get_campaign_data(keypath,hvo_subdir,select_data):
 
 	return so2, obs_date
 
+def get_run_hours():
+	'''
+	Get UTC datetimes of all run hours
+	'''
+	fc_date = dt.datetime.strptime(os.environ['forecast'], '%Y%m%d%H')
+
+	return [fc_date + dt.timedelta(hours=hr) for hr in range(int(os.environ['runhrs']))]
+
+def get_campaign_series(select_data, so2):
+	'''
+	Interpolate campaign records (already in local store) to run hours; rates persist beyond the last record
+	'''
+	if 'forecast' not in os.environ:
+		return [so2]
+	channel, series = select_data['channel'], select_data['series'][0]
+	run_hours = get_run_hours()
+
+	store = emissions_store.open_store()
+	times, values = emissions_store.get_series(store, channel, series, run_hours[0], run_hours[-1])
+	store.close()
+	if not times:
+		return [so2] * len(run_hours)
+
+	hourly = np.interp([emissions_store.to_epoch(hour) for hour in run_hours], times, values)
+
+	return [int(round(rate)) for rate in hourly]
+
+def get_manual_series(rate):
+	'''
+	Get hourly rates from manual input: single value, or schedule of {run hour: rate} interpolated between hours
+	'''
+	if not isinstance(rate, dict):
+		return rate, [rate] * int(os.environ['runhrs'])
+
+	schedule = sorted((int(hr), value) for hr, value in rate.items())
+	hourly = np.interp(range(int(os.environ['runhrs'])), [hr for hr, value in schedule], [value for hr, value in schedule])
+	hourly = [float(value) for value in hourly]
+
+	return hourly[int(os.environ['spinup'])], hourly
+
 def get_flyspec_data(keypath, hvo_subdir,select_data):
 	'''
 	Run all the steps for pulling flyspec data from HVO
 	'''
-	logging.info('...pulling flyspec emissions data from HVO-API')
-
 	#check if a forecast date is set in environ
 	if 'forecast' in os.environ:
 		day = get_days_offset()
@@ -139,11 +194,27 @@ def get_flyspec_data(keypath, hvo_subdir,select_data):
 		logging.debug('...No forecast date set, getting the most recent data')
 		day = 1
 
-	#loop until we find some data
-	response = pull_from_api(url,hvo_subdir,day,select_data,keypath)
-	while no_data(response) or no_daily_ave(response):
-		day = day + 1
-		response = pull_from_api(url,hvo_subdir,day,select_data,keypath)
+	channel, series = select_data['channel'], select_data['series'][0]
+	store = emissions_store.open_store()
+
+	#historic runs: use the local store if it already covers the end of the search window
+	if os.environ.get('runtype') != 'realtime':
+		em_end = dt.datetime.strptime(dt.datetime.strftime(dt.datetime.utcnow() - dt.timedelta(hours=24*(day-1)), '%Y%m%d'), '%Y%m%d')
+		record = emissions_store.get_latest(store, channel, series, em_end)
+		if record is not None:
+			store.close()
+			logging.info('...nearest record found in local emissions store: {}'.format(record[1]))
+			return int(record[0]), record[1]
+
+	logging.info('...pulling flyspec emissions data from HVO-API')
+
+	#grow the window back in time until we find a daily average (the last valid one is the most recent)
+	response = hvo_api.search_window(lambda days: pull_from_api(url,hvo_subdir,days,select_data,keypath,last_day=day), \
+					lambda response: not (no_data(response) or no_daily_ave(response)), day)
+
+	#keep the records for later reruns
+	emissions_store.ingest(store, channel, series, response)
+	store.close()
 
 	#get the last non-nan value
 	i= -1
@@ -159,6 +230,42 @@ def get_flyspec_data(keypath, hvo_subdir,select_data):
 
 
 
+def get_source_emissions(tag, emis_settings, keypath):
+	'''
+	Get emissions for a single source based on user preferences
+	'''
+	logging.debug('Getting emissions for {}:'.format(tag))
+
+	#get emissions based on user preferences
+	if emis_settings['input'] == 'hvo':
+		#pull from hvo-api
+		if emis_settings['stream'] == 'campaign':
+			hvo_subdir = 'so2emissions'
+			select_data = {'channel': emis_settings['channel'], 'rank': 2, 'timezone': 'UTC', 'series': ['so2']}
+			so2, obs_date = get_campaign_data(keypath, hvo_subdir, select_data)
+			so2_hourly = get_campaign_series(select_data, so2)
+		elif emis_settings['stream'] =='flyspec':
+			hvo_subdir = 'flyspec'
+			select_data = {'channel': 'FLYA', 'timezone': 'UTC', 'series': ['dailybstfluxmean']}
+			so2, obs_date = get_flyspec_data(keypath, hvo_subdir, select_data)
+			#flyspec provides daily averages only, so the rate is held for the whole run
+			so2_hourly = [so2] * int(os.environ.get('runhrs', 1))
+		else:
+			logging.critical('ERROR: unrecognized emissions stream: must specify "flyspec"/"campaign". Aborting. ')
+			sys.exit()
+		logging.info('{} HVO emissions value: {} tonnes/day'.format(tag, so2))
+	elif emis_settings['input'] == 'manual':
+		#assign user defined value
+		so2, so2_hourly = get_manual_series(emis_settings['rate'])
+		obs_date = 'manual update'
+		logging.info('{} manual emissions assignment requested: rate = {} tonnes/day)'.format(tag, so2))
+	else:
+		logging.critical('ERROR: Emissions input not recognized. Availble options are: "hvo","manual"')
+		sys.exit()
+
+	return {'so2' : so2, 'obs_date': obs_date, 'so2_hourly': so2_hourly }
+
+
 def main():
 	'''
 	Main script steps: find most recent day, get data, write out json
@@ -169,44 +276,14 @@ def main():
 	json_data = read_run_json()
 
 	#get number of emissions sources
-	num_src = len(json_data['user_defined']['emissions'])
-	tags = json_data['user_defined']['emissions'].keys()
-	json_data['emissions'] = {}
-
-	#get emissions for each source
-	#for iSrc in range(num_src):
-		#tag = 'src' + str(iSrc + 1)
-	for iSrc, tag in enumerate(tags):
-		emis_settings = json_data['user_defined']['emissions'][tag]
-
-		logging.debug('Getting emissions for {}:'.format(tag))
-
-		#get emissions based on user preferences
-		if emis_settings['input'] == 'hvo':
-			#pull from hvo-api
-			keypath = json_data['user_defined']['keys']
-			if emis_settings['stream'] == 'campaign':
-				hvo_subdir = 'so2emissions'
-				select_data = {'channel': emis_settings['channel'], 'rank': 2, 'timezone': 'UTC', 'series': ['so2']}
-				so2, obs_date = get_campaign_data(keypath, hvo_subdir, select_data)
-			elif emis_settings['stream'] =='flyspec':
-				hvo_subdir = 'flyspec'
-				select_data = {'channel': 'FLYA', 'timezone': 'UTC', 'series': ['dailybstfluxmean']}
-				so2, obs_date = get_flyspec_data(keypath, hvo_subdir, select_data)
-			else:
-				logging.critical('ERROR: unrecognized emissions stream: must specify "flyspec"/"campaign". Aborting. ')
-				sys.exit()
-			logging.info('HVO emissions value: {} tonnes/day'.format(so2))
-		elif emis_settings['input'] == 'manual':
-			#assign user defined value
-			so2 = emis_settings['rate']
-			obs_date = 'manual update'
-			logging.info('Manual emissions assignment requested: rate = {} tonnes/day)'.format(so2))
-		else:
-			logging.critical('ERROR: Emissions input not recognized. Availble options are: "hvo","manual"')
-			sys.exit()
+	tags = list(json_data['user_defined']['emissions'].keys())
+	keypath = json_data['user_defined'].get('keys')
+
+	#get emissions for all sources concurrently (individual requests time out in hvo_api)
+	with ThreadPoolExecutor(max_workers=max(1, min(len(tags), emission_workers))) as pool:
+		pulls = {tag: pool.submit(get_source_emissions, tag, json_data['user_defined']['emissions'][tag], keypath) for tag in tags}
 		#write to main json file
-		json_data['emissions'][tag] = {'so2' : so2, 'obs_date': obs_date }
+		json_data['emissions'] = {tag: pulls[tag].result() for tag in tags}
 
 	#update run json
 	update_run_json(json_data)
@@ -0,0 +1,133 @@
+#!/usr/bin/python3.7
+
+#Local append-only store of HVO emissions records for offline (historic) lookups
+
+import sqlite3
+import datetime as dt
+import logging
+import os
+
+
+### Inputs ###
+store_name = 'emissions.db' 	#store file (within run_dir), shared by all cycles
+db_timeout = 30 		#time to wait for a lock held by a concurrent run (s)
+
+
+### Functions ###
+
+def open_store(store_path=None):
+	'''
+	Open (or create) the emissions store; records are indexed by channel, series and time
+	Ingested windows (time span of each API response) are kept alongside, since records alone do not show gaps
+	'''
+	if store_path is None:
+		store_path = os.path.join(os.environ['run_dir'], store_name)
+	conn = sqlite3.connect(store_path, timeout=db_timeout)
+	conn.execute('CREATE TABLE IF NOT EXISTS records (channel TEXT, series TEXT, time INTEGER, date TEXT, value REAL, \
+			PRIMARY KEY (channel, series, time)) WITHOUT ROWID')
+	conn.execute('CREATE TABLE IF NOT EXISTS windows (channel TEXT, series TEXT, start_time INTEGER, end_time INTEGER)')
+
+	return conn
+
+
+def to_epoch(date):
+	'''
+	Convert HVO-API record date (or datetime) to seconds since epoch
+	'''
+	if isinstance(date, str):
+		date = dt.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S%z')
+	if date.tzinfo is None:
+		date = date.replace(tzinfo=dt.timezone.utc)
+
+	return int(date.timestamp())
+
+
+def ingest(conn, channel, series, response):
+	'''
+	Append records from an HVO-API response (existing records and missing values are skipped)
+	The span of the response is recorded as ingested: the store holds every record between its first and last date
+	'''
+	rows = [(channel, series, to_epoch(rec['date']), rec['date'], rec[series]) for rec in response['results'] \
+			if rec.get(series) is not None]
+	times = [to_epoch(rec['date']) for rec in response['results']]
+	with conn:
+		conn.executemany('INSERT OR IGNORE INTO records VALUES (?,?,?,?,?)', rows)
+		if times:
+			conn.execute('INSERT INTO windows VALUES (?,?,?,?)', (channel, series, min(times), max(times)))
+	logging.debug(f'...ingested {len(rows)} {channel}/{series} records into emissions store')
+
+	return len(rows)
+
+
+def get_record(conn, channel, series, target, order):
+	'''
+	Get the closest record on one side of the target time: order = 'before'/'after' (inclusive)
+	'''
+	if order == 'before':
+		query = 'SELECT time, date, value FROM records WHERE channel=? AND series=? AND time<=? ORDER BY time DESC LIMIT 1'
+	else:
+		query = 'SELECT time, date, value FROM records WHERE channel=? AND series=? AND time>=? ORDER BY time ASC LIMIT 1'
+
+	return conn.execute(query, (channel, series, to_epoch(target))).fetchone()
+
+
+def is_ingested(conn, channel, series, start, end):
+	'''
+	Check if a single ingested window spans start to end times (seconds since epoch), so no records between them are missing
+	'''
+	query = 'SELECT 1 FROM windows WHERE channel=? AND series=? AND start_time<=? AND end_time>=? LIMIT 1'
+
+	return conn.execute(query, (channel, series, start, end)).fetchone() is not None
+
+
+def get_bracket(conn, channel, series, target):
+	'''
+	Get the closest records on both sides of target time; returns None unless both exist and the period between them was ingested
+	'''
+	before = get_record(conn, channel, series, target, 'before')
+	after = get_record(conn, channel, series, target, 'after')
+	if before is None or after is None or not is_ingested(conn, channel, series, before[0], after[0]):
+		return None
+
+	return before, after
+
+
+def get_nearest(conn, channel, series, target):
+	'''
+	Get the record nearest to target time; returns None unless the store covers the period around it
+	'''
+	bracket = get_bracket(conn, channel, series, target)
+	if bracket is None:
+		return None
+
+	before, after = bracket
+
+	t = to_epoch(target)
+	time, date, value = before if (t - before[0]) <= (after[0] - t) else after
+
+	return value, date
+
+
+def get_latest(conn, channel, series, target):
+	'''
+	Get the most recent record before target time; returns None unless the store covers the period around it
+	'''
+	bracket = get_bracket(conn, channel, series, target)
+	if bracket is None:
+		return None
+	before = bracket[0]
+
+	return before[2], before[1]
+
+
+def get_series(conn, channel, series, start, end):
+	'''
+	Get all records between start and end times, plus the closest records outside on either side (for interpolation)
+	'''
+	query = 'SELECT time, value FROM records WHERE channel=? AND series=? AND time BETWEEN \
+			COALESCE((SELECT MAX(time) FROM records WHERE channel=? AND series=? AND time<=?), ?) AND \
+			COALESCE((SELECT MIN(time) FROM records WHERE channel=? AND series=? AND time>=?), ?) ORDER BY time'
+	t0, t1 = to_epoch(start), to_epoch(end)
+	rows = conn.execute(query, (channel, series, channel, series, t0, t0, channel, series, t1, t1)).fetchall()
+
+	return [row[0] for row in rows], [row[1] for row in rows]
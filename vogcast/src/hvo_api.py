@@ -0,0 +1,120 @@
+#!/usr/bin/python3.7
+
+#Client layer for HVO-API requests: pooled sessions, on-disk response cache and bounded window search
+
+import requests
+import logging
+import hashlib
+import json
+import os
+import sys
+import time
+import threading
+from functools import lru_cache
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from set_vog_env import *
+
+
+### Inputs ###
+url = 'https://hvo-api.wr.usgs.gov/api/v1/'
+pool_size = 8 			#max number of pooled connections per session
+request_timeout = 60 		#timeout for individual HVO requests (s)
+cache_dir = 'hvo_cache' 	#folder (within run_dir) for cached api responses
+cache_ttl = 3600 		#lifetime of cached responses for realtime runs (s)
+max_search_days = 365 		#longest lookback window allowed when searching for data (days)
+
+
+### Functions ###
+
+@lru_cache(maxsize=None)
+def get_session(keypath, pool_size=pool_size):
+	'''
+	Create an authenticated session with a connection pool (one per keys file, reused for all calls)
+	'''
+	login = read_config(keypath)
+	session = requests.Session()
+	session.auth = (login['hvo']['user'],login['hvo']['pwd'])
+	adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+
+	return session
+
+
+def get_cache_file(api_call, select_data):
+	'''
+	Get path of the cached response for the given endpoint/window and request data
+	'''
+	key = hashlib.sha1(api_call.encode())
+	key.update(json.dumps(select_data, sort_keys=True).encode())
+
+	cache_path = os.path.join(os.environ['run_dir'], cache_dir)
+	Path(cache_path).mkdir(exist_ok=True)
+
+	return os.path.join(cache_path, f'{key.hexdigest()}.json')
+
+
+def read_cache(cache_file, permanent=False):
+	'''
+	Read cached response if available and not expired (permanent entries never expire)
+	'''
+	if not os.path.isfile(cache_file):
+		return None
+	if not permanent and (time.time() - os.path.getmtime(cache_file)) > cache_ttl:
+		logging.debug(f'...cached response expired: {cache_file}')
+		return None
+	try:
+		return read_json(cache_file)
+	except ValueError:
+		logging.warning(f'WARNING: unreadable cached response, ignoring: {cache_file}')
+		return None
+
+
+def post(keypath, api_call, select_data, permanent=False):
+	'''
+	Pull data from HVO-API, using the on-disk cache when possible
+	-permanent: cache never expires (use only for fixed windows in the past, i.e. historic runs)
+	'''
+	cache_file = get_cache_file(api_call, select_data)
+	response = read_cache(cache_file, permanent)
+	if response is not None:
+		logging.debug(f'...using cached response for: {api_call}')
+		return response
+
+	logging.debug(f'...pulling from HVO-API: {api_call}')
+	session = get_session(keypath)
+	reply = session.post(api_call, data=json.dumps(select_data), timeout=request_timeout)
+
+	#error replies are often html or empty, so check status before parsing
+	if not reply.ok:
+		logging.critical(f'ERROR: HVO-API request failed with status {reply.status_code} ({reply.reason}): {api_call}. Aborting!')
+		sys.exit(1)
+	try:
+		response = reply.json()
+	except ValueError:
+		logging.critical(f'ERROR: HVO-API returned a response that is not valid json: {api_call}. Aborting!')
+		sys.exit(1)
+
+	#only successful responses are cached (identical requests may run concurrently, so temporary files are per thread)
+	with atomic_write(cache_file, f'.{os.getpid()}.{threading.get_ident()}.tmp') as tmp_file:
+		write_json(tmp_file, response)
+
+	return response
+
+
+def search_window(pull, found, days=1):
+	'''
+	Find the shortest lookback window with data, doubling the window each time (bounded by max_search_days)
+	-pull: function returning api response for a window of given number of days
+	-found: function checking if the response contains usable data
+	'''
+	while True:
+		response = pull(days)
+		if found(response):
+			logging.debug(f'...found data within {days} day window')
+			return response
+		if days >= max_search_days:
+			logging.critical(f'ERROR: No data found within {max_search_days} days. Aborting.')
+			sys.exit(1)
+		days = min(days * 2, max_search_days)
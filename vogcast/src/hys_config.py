@@ -0,0 +1,113 @@
+#!/usr/bin/python3.7
+
+#Renders HYSPLIT CONTROL and SETUP.CFG files from templates in config/hysplit
+
+import re
+import logging
+from set_vog_env import atomic_write
+
+### Inputs ###
+placeholder = re.compile(r'\{(\w+)\}') 	#template tags, e.g. {src_cnt}
+
+
+### Functions ###
+
+def fill_template(template, values):
+	'''
+	Replace all template tags with values; tags without a value are an error
+	'''
+	missing = sorted(set(placeholder.findall(template)) - set(values))
+	if missing:
+		raise ValueError(f'No values provided for template tags: {missing}')
+
+	return placeholder.sub(lambda tag: str(values[tag.group(1)]), template)
+
+
+def format_rows(rows):
+	'''
+	Format list of rows (lists of values) as space-separated lines
+	'''
+	return '\n'.join(' '.join(str(val) for val in row) for row in rows)
+
+
+def render_control(template, spinup, sources, hys_hrs, vert_motion, arl_files, lvls, arl_dir='./'):
+	'''
+	Render CONTROL file text
+	-sources: list of [lat, lon, height, rate, area] starting locations
+	-arl_files: list of met file names (all located in arl_dir)
+	-lvls: list of concentration grid levels (m)
+	'''
+	values = {'spinup': f'{int(spinup):02d}',
+		'src_cnt': len(sources),
+		'sources': format_rows(sources),
+		'hys_hrs': int(hys_hrs),
+		'vert_motion': vert_motion,
+		'arl_cnt': len(arl_files),
+		'arl_paths': '\n'.join(f'{arl_dir}\n{arl}' for arl in arl_files),
+		'num_lvls': len(lvls),
+		'lvls': ' '.join(str(lvl) for lvl in lvls)}
+	text = fill_template(template, values)
+	validate_control(text, sources, arl_files, lvls)
+
+	return text
+
+
+def render_setup(template, freq, min_zi, numpar):
+	'''
+	Render SETUP.CFG namelist text
+	'''
+	values = {'freq': int(freq), 'min_zi': min_zi, 'numpar': int(numpar)}
+	text = fill_template(template, values)
+	validate_setup(text)
+
+	return text
+
+
+def validate_control(text, sources, arl_files, lvls):
+	'''
+	Check rendered CONTROL structure: source lines, met file entries and levels
+	'''
+	lines = text.splitlines()
+	if not sources or not arl_files or not lvls:
+		raise ValueError('CONTROL needs at least one source, met file and level')
+
+	#source block: count line followed by one line of 5 numbers per source
+	start = 1
+	if int(lines[start]) != len(sources):
+		raise ValueError(f'CONTROL source count mismatch: {lines[start]} vs {len(sources)}')
+	for line in lines[start+1:start+1+len(sources)]:
+		fields = line.split()
+		if len(fields) != 5:
+			raise ValueError(f'CONTROL source line must have 5 fields (lat lon hgt rate area): {line}')
+		[float(field) for field in fields]
+
+	#met block follows run hours, vertical motion and model top
+	met = start + 1 + len(sources) + 3
+	if int(lines[met]) != len(arl_files):
+		raise ValueError(f'CONTROL met file count mismatch: {lines[met]} vs {len(arl_files)}')
+	if lines[met+2:met+2+2*len(arl_files):2] != list(arl_files):
+		raise ValueError('CONTROL met file entries are out of order')
+
+	return
+
+
+def validate_setup(text):
+	'''
+	Check rendered SETUP.CFG is a complete namelist
+	'''
+	lines = [line.strip() for line in text.splitlines() if line.strip()]
+	if lines[0] != '&SETUP' or lines[-1] != '/':
+		raise ValueError('SETUP.CFG must start with "&SETUP" and end with "/"')
+
+	return
+
+
+def write_config(path, text):
+	'''
+	Write config file in one go
+	'''
+	with atomic_write(path) as tmp_path, open(tmp_path, 'w') as f:
+		f.write(text)
+	logging.debug(f'...wrote HYSPLIT config: {path}')
+
+	return
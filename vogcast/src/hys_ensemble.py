@@ -0,0 +1,159 @@
+#!/usr/bin/python3.7
+
+#Runs HYSPLIT ensemble members with a selectable executor: slurm array or local process pool
+
+import os
+import time
+import logging
+import subprocess
+from set_vog_env import *
+from concurrent.futures import ThreadPoolExecutor
+
+### Inputs ###
+member_cnt = 27 		#number of hycs_ens meteorological ensemble members (full ensemble)
+slurm_script = 'hysplit.slurm' 	#slurm array job script (linked into hysplit run directory)
+max_retries = 1 		#number of times failed members are resubmitted
+summary_file = 'ensemble_status.json' 	#member status summary (in hysplit run directory)
+local_log = 'vp-hysplit.local_{:03d}' 	#per-member log name for local runs (.out/.err)
+
+
+### Functions ###
+
+def get_members(hys_settings):
+	'''
+	Get list of ensemble members to run from dispersion settings
+	-"members": ensemble size (members 1 to N) or explicit list of member numbers (optional, default: all 27)
+	'''
+	members = hys_settings.get('members', member_cnt)
+	members = list(range(1, members + 1)) if isinstance(members, int) else sorted(set(int(m) for m in members))
+	if not members or members[0] < 1 or members[-1] > member_cnt:
+		raise ValueError(f'ensemble members must be between 1 and {member_cnt}, got: {members}')
+
+	return members
+
+
+def run_member(member):
+	'''
+	Run a single ensemble member as a subprocess, logging output and timing
+	'''
+	log = local_log.format(member)
+	start = time.time()
+	with open(log + '.out', 'w') as out, open(log + '.err', 'w') as err:
+		exit_code = subprocess.call(['./hycs_ens', str(member)], stdout=out, stderr=err)
+	walltime = round(time.time() - start, 1)
+
+	#flag completed member (same as slurm script)
+	if exit_code == 0:
+		open(f'hys_member.{member}.OK', 'w').close()
+	else:
+		logging.warning(f'WARNING: ensemble member {member} failed with exit code {exit_code}, see {log}.err')
+	logging.debug(f'...member {member} finished in {walltime} s (exit code {exit_code})')
+
+	return {'exit': exit_code, 'walltime': walltime, 'log': log}
+
+
+def run_local(members, workers=None):
+	'''
+	Run members locally; members are separate processes, at most "workers" at a time (default: number of cores)
+	'''
+	workers = workers or os.cpu_count()
+	logging.info(f'...running {len(members)} hysplit members locally on {workers} workers')
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		results = dict(zip(members, pool.map(run_member, members)))
+
+	return results
+
+
+def read_exit_code(member):
+	'''
+	Read member exit code recorded by the slurm script (None if the member never finished)
+	'''
+	try:
+		with open(f'hys_member.{member}.exit', 'r') as f:
+			return int(f.read().strip())
+	except (OSError, ValueError):
+		return None
+
+
+def run_slurm(members, workers=None):
+	'''
+	Submit members as a slurm array and wait for completion (overrides the array range in the slurm script)
+	'''
+	logging.info(f'...submitting {len(members)} hysplit members to slurm')
+	array = ','.join(str(member) for member in members)
+	start = time.time()
+	os.system(f'sbatch -W --array={array} {slurm_script}')
+	walltime = round(time.time() - start, 1)
+
+	results = {member: {'exit': read_exit_code(member), 'walltime': walltime, \
+			'log': f'vp-hysplit.*_{member}'} for member in members}
+
+	return results
+
+
+#available executors
+executors = {'slurm': run_slurm, 'local': run_local}
+
+
+def run_ensemble(executor='slurm', members=None, workers=None):
+	'''
+	Run ensemble members with the selected executor; returns per-member exit code, wall time and log
+	'''
+	if executor not in executors:
+		raise ValueError(f'unrecognized ensemble executor "{executor}", available options: {list(executors)}')
+	members = members or get_members({})
+
+	return executors[executor](members, workers)
+
+
+def check_member(member, result):
+	'''
+	Check member exit status and outputs (cdump.NNN and PARDUMP.NNN must exist and not be empty)
+	'''
+	outputs = [f'cdump.{member:03d}', f'PARDUMP.{member:03d}']
+	missing = [out for out in outputs if not (os.path.isfile(out) and os.path.getsize(out) > 0)]
+	ok = result['exit'] == 0 and not missing
+
+	return dict(result, status='ok' if ok else 'failed', missing=missing)
+
+
+def clean_member(member):
+	'''
+	Remove flags and outputs of a failed member before it is resubmitted
+	'''
+	for path in [f'hys_member.{member}.OK', f'hys_member.{member}.exit', f'cdump.{member:03d}', f'PARDUMP.{member:03d}']:
+		if os.path.isfile(path):
+			os.remove(path)
+
+	return
+
+
+def run_tracked(executor='slurm', members=None, workers=None, retries=max_retries):
+	'''
+	Run ensemble, check every member and resubmit only the failed ones (up to "retries" times)
+	-returns and saves summary of member status, exit code, wall time, attempts and missing outputs
+	'''
+	members = members or get_members({})
+	status, pending = {}, members
+	for attempt in range(1, retries + 2):
+		if attempt > 1:
+			logging.warning(f'WARNING: resubmitting failed ensemble members {pending} (attempt {attempt})')
+			for member in pending:
+				clean_member(member)
+		results = run_ensemble(executor, pending, workers)
+		for member in pending:
+			status[member] = dict(check_member(member, results[member]), attempts=attempt)
+		pending = [member for member in pending if status[member]['status'] != 'ok']
+		if not pending:
+			break
+
+	failed = [member for member in members if status[member]['status'] != 'ok']
+	summary = {'executor': executor, 'members': len(members), 'completed': len(members) - len(failed), \
+			'failed': failed, 'status': {str(member): status[member] for member in members}}
+	write_json(summary_file, summary)
+	if failed:
+		logging.warning(f'WARNING: {len(failed)} ensemble members failed after {retries} retries: {failed}')
+	else:
+		logging.info(f'...all {len(members)} ensemble members completed')
+
+	return summary
@@ -54,8 +54,8 @@ def convert_to_arl():
 	wrf_rundir = os.path.join(os.environ['run_path'],'meteorology')
 
 	#loop through all domains
-	#lines to write to run json for auto-config of hysplit CONTROL
-	lines = ''
+	#arl files to write to run json for auto-config of hysplit CONTROL
+	arl_files = []
 	for d in range(1,int(os.environ['max_dom'])+1):
 		#clean up old config
 		if d > 1:
@@ -78,15 +78,11 @@ def convert_to_arl():
 		os.system(f'./arw2arl -d {nc_file} > arw2arl_d0{d}.log')		
 		os.rename('ARLDATA.BIN', arl_file)		
 
-		lines = lines + '.\/\\n' + arl_file + '\\n'
-
-	#remove newline character from the last line
-	lines = lines[:-2]
+		arl_files.append(arl_file)
 
 	#append run json with arl file information
 	json_data = read_run_json()
-	json_data['arl_cnt'] = str(d)
-	json_data['arl'] = lines
+	json_data['arl'] = arl_files
 	update_run_json(json_data)
 
 	return
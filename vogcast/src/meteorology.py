@@ -23,13 +23,12 @@ def pull_archived_arl(met_settings):
 		arl_file = '{}_hysplit.t{}z.namsa.HI'.format(os.environ['rundate'],os.environ['cycle'])
 		os.system('wget -N ftp://anonymous@ftp.arl.noaa.gov/archives/nams/{} -P {}'.format(arl_file,met_settings['arl_path']))
 		os.system('ln -sf {} d01.arl'.format(os.path.join(met_settings['arl_path'],arl_file)))
-		control_lines = '.\/\\nd01.arl'
-		arl_cnt = 1
+		arl_files = ['d01.arl']
 	#for multiple days, link the files as separate domains (adding logic in dispersion module to account for that)
 	else:
 		logging.debug('WARNING: multi-day simulation with archived ARL data. Downloading multiple arl files')
 		rundays = int(runhrs/24.) + 1
-		control_lines = ''
+		arl_files = []
 		for d in range(0, rundays):
 			fc_date = dt.datetime.strptime(os.environ['forecast'],'%Y%m%d%H')
 			arl_date = fc_date + dt.timedelta(hours=24*d)
@@ -40,13 +39,9 @@ def pull_archived_arl(met_settings):
 			arl_full_path = os.path.join(met_settings['arl_path'],arl_file)
 			os.system(f'ln -sf {arl_full_path} d{dd:02}.arl')
 
-			control_lines = control_lines + '.\/\\nd' + f'{dd:02}.arl' + '\\n'
+			arl_files.append(f'd{dd:02}.arl')
 
-		#remove newline character from the last line
-		control_lines = control_lines[:-2]
-		arl_cnt = dd
-
-	return control_lines, arl_cnt
+	return arl_files
 
 
 
@@ -101,12 +96,11 @@ def main():
 			arl_file = 'hysplit.t{}z.namsf.HI'.format(os.environ['cycle'])
 			os.system('wget -N https://nomads.ncep.noaa.gov/pub/data/nccf/com/hysplit/prod/hysplit.{}/{}'.format(os.environ['rundate'],arl_file))
 			os.system('ln -sf {} d01.arl'.format(arl_file))
-			control_lines = '.\/\\nd01.arl'
-			arl_cnt = 1
+			arl_files = ['d01.arl']
 
 		elif met_settings['type'] == "archive":
 			logging.info('...pulling archived ARL data from NOAA FTP server')
-			control_lines, arl_cnt  = pull_archived_arl(met_settings)
+			arl_files = pull_archived_arl(met_settings)
 			#arl_file = '{}_hysplit.t{}z.namsa.HI'.format(os.environ['rundate'],os.environ['cycle'])
 			#os.system('wget -N ftp://anonymous@ftp.arl.noaa.gov/archives/nams/{} -P {}'.format(arl_file,met_settings['arl_path']))
 			#os.system('ln -sf {} d01.arl'.format(os.path.join(settings['arl_path'],arl_file))
@@ -120,10 +114,8 @@ def main():
 		
 		#os.system('ln -sf {} d01.arl'.format(arl_file))
 
-		#update arl path
-		#json_data['arl'] = '.\/\\nd01.arl'
-		json_data['arl'] = control_lines
-		json_data['arl_cnt'] = str(arl_cnt)
+		#update arl files (all in hysplit run directory)
+		json_data['arl'] = arl_files
 		update_run_json(json_data)
 
 
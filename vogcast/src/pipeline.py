@@ -0,0 +1,167 @@
+#!/usr/bin/python3.7
+
+#Pipeline scheduler: runs stages in dependency order, skipping stages whose input fingerprint is unchanged
+
+import os
+import glob
+import json
+import hashlib
+import logging
+import datetime as dt
+from set_vog_env import *
+
+### Inputs ###
+state_file = 'pipeline_state.json' 	#stage fingerprints of completed stages (in forecast run directory)
+content_hash_max = 1024**2 		#output files up to this size (bytes) are hashed by content, larger ones by size and mtime
+
+#pipeline stages in execution order
+#-after: upstream stages (their outputs are part of the stage's inputs)
+#-config: run config keys read by the stage (module subtree and shared settings)
+#-code: source and template files of the stage (relative to vog_root)
+#-json/files: stage outputs: run json keys and file patterns (relative to forecast run directory)
+stages = {
+	'meteorology': {'after': [], 'config': ['meteorology', 'runhrs', 'max_dom', 'spinup'],
+			'code': ['src/meteorology.py', 'src/met/*'],
+			'json': ['arl'], 'files': ['hysplit/*.arl', 'wrf/wrfout*', 'meteorology/wrfout*']},
+	'emissions': {'after': [], 'config': ['emissions', 'runhrs', 'spinup', 'keys'],
+			'code': ['src/emissions.py', 'src/emissions_store.py', 'src/hvo_api.py'],
+			'json': ['emissions'], 'files': []},
+	'source': {'after': ['meteorology', 'emissions'], 'config': ['source', 'runhrs', 'spinup', 'max_dom', 'keys'],
+			'code': ['src/source.py', 'src/hvo_api.py', 'src/plumerise/*.py'],
+			'json': ['plumerise', 'vent'], 'files': ['hysplit/EMITIMES']},
+	'dispersion': {'after': ['meteorology', 'source'], 'config': ['dispersion', 'runhrs', 'spinup'],
+			'code': ['src/dispersion.py', 'src/hys_config.py', 'src/hys_ensemble.py', 'src/carryover.py', 'config/hysplit/*', 'config/slurm/*'],
+			'json': [], 'files': ['hysplit/cdump.*', 'hysplit/ensemble_status.json']},
+	'post_process': {'after': ['dispersion'], 'config': ['post_process'],
+			'code': ['src/post_process.py', 'src/pproc/*.py'],
+			'json': [], 'files': ['hysplit/vogcast_*.nc', 'hysplit/hysplit.haw.*']},
+	'extras': {'after': ['post_process'], 'config': ['extras'],
+			'code': ['src/extras.py', 'src/pproc/*.py'],
+			'json': [], 'files': []},
+}
+
+
+### Functions ###
+
+def hash_json(data):
+	'''
+	Hash json-serializable data independent of key order
+	'''
+	return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_code(patterns):
+	'''
+	Hash contents of stage source and template files (code version)
+	'''
+	checksum = hashlib.sha256()
+	for pattern in patterns:
+		for path in sorted(glob.glob(os.path.join(os.environ['vog_root'], pattern))):
+			if os.path.isfile(path):
+				checksum.update(pattern.encode() + os.path.basename(path).encode())
+				with open(path, 'rb') as f:
+					checksum.update(hashlib.sha256(f.read()).digest())
+
+	return checksum.hexdigest()
+
+
+def hash_outputs(stage, json_data):
+	'''
+	Hash stage outputs: run json entries and small files (EMITIMES, status json) by content,
+	large model output (met, cdump, netcdf) by name, size and modification time
+	'''
+	spec = stages[stage]
+	files = []
+	for pattern in spec['files']:
+		for path in sorted(glob.glob(os.path.join(os.environ['run_path'], pattern))):
+			info = os.stat(path)
+			name = os.path.relpath(path, os.environ['run_path'])
+			if info.st_size <= content_hash_max:
+				with open(path, 'rb') as f:
+					files.append([name, hashlib.sha256(f.read()).hexdigest()])
+			else:
+				files.append([name, info.st_size, info.st_mtime_ns])
+
+	return hash_json({'json': {key: json_data.get(key) for key in spec['json']}, 'files': files})
+
+
+def get_inputs(stage, settings, outputs):
+	'''
+	Get input fingerprint of a stage: config subtree, code version and upstream output hashes
+	'''
+	spec = stages[stage]
+
+	return {'config': hash_json({key: settings.get(key) for key in spec['config']}),
+		'code': hash_code(spec['code']),
+		'upstream': {dep: outputs[dep] for dep in spec['after']}}
+
+
+def get_changes(inputs, record):
+	'''
+	Describe which inputs differ from the last completed run of a stage
+	'''
+	if not record:
+		return ['no completed run']
+	changes = [f'{part} changed' for part in ['config', 'code'] if inputs[part] != record['inputs'][part]]
+	changes = changes + [f'{dep} output changed' for dep in inputs['upstream'] if inputs['upstream'][dep] != record['inputs']['upstream'].get(dep)]
+
+	return changes
+
+
+def read_state(state_path):
+	'''
+	Read recorded stage fingerprints (empty if none)
+	'''
+	if not os.path.isfile(state_path):
+		return {}
+
+	return read_json(state_path)
+
+
+def save_state(state_path, state):
+	'''
+	Save stage fingerprints
+	'''
+	with atomic_write(state_path) as tmp_path:
+		write_json(tmp_path, state)
+
+	return
+
+
+def run(stage_funcs, settings, modules=None, force=[], fresh=False):
+	'''
+	Run pipeline stages in order, skipping stages whose inputs are unchanged since their last completed run
+	-stage_funcs: stage entry points by stage name
+	-settings: user run config
+	-modules: stages allowed to run (default: all); other stages are never run but their outputs still feed downstream fingerprints
+	-force: stages to run regardless of fingerprint
+	-fresh: ignore recorded fingerprints (run all allowed stages)
+	'''
+	modules = modules or list(stages)
+	state_path = os.path.join(os.environ['run_path'], state_file)
+	state = {} if fresh else read_state(state_path)
+
+	outputs = {}
+	for stage in stages:
+		inputs = get_inputs(stage, settings, outputs)
+		changes = get_changes(inputs, state.get(stage))
+
+		run_stage = stage in modules and (stage in force or bool(changes))
+		if stage not in modules:
+			logging.info(f'Pipeline: "{stage}" not in requested modules, skipping')
+		elif not run_stage:
+			logging.info(f'Pipeline: "{stage}" inputs unchanged, skipping')
+		else:
+			reason = ', '.join(changes) if changes else 'forced'
+			logging.info(f'Pipeline: running "{stage}" ({reason})')
+			stage_funcs[stage]()
+
+		#stage outputs from disk and run json (stages update the run json as they go)
+		outputs[stage] = hash_outputs(stage, read_run_json())
+
+		#record completed stage (a failed stage exits before this, so it is rerun next time)
+		if run_stage:
+			state[stage] = {'inputs': inputs, 'outputs': outputs[stage], 'completed': dt.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}
+			save_state(state_path, state)
+
+	return state
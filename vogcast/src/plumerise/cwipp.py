@@ -160,7 +160,7 @@ class Plume:
 		else:
 			#obtain iterative solution
 			toSolve = lambda z : z	- b - m*(self.zs + \
-							1/(np.sqrt(g*(self.sounding[int(z/dz)] - self.THs)/(self.THs * (z-self.zs))))	* \
+							1/(np.sqrt(g*(self.sounding[int(np.squeeze(z)/dz)] - self.THs)/(self.THs * (z-self.zs))))	* \
 							(g*self.I*(z-self.zs)/(self.THs * self.zi))**(1/3.))
 
 			#set inital guess for day vs night time
@@ -382,3 +382,303 @@ class Plume:
 			#self.layer_fractions = [0, 0, 0, 1, 0]
 
 		self.profile = profile.squeeze().tolist()
+
+
+def interp_rows(x, y, xnew):
+	"""
+	Row-wise linear interpolation with extrapolation (same as interp1d(fill_value='extrapolate'))
+
+	Parameters
+	----------
+	x : ndarray
+		2D array of increasing coordinates, one row per profile
+	y : ndarray
+		2D array of values at x
+	xnew : ndarray
+		1D array of coordinates to interpolate to (shared by all rows)
+
+	Returns
+	-------
+	ynew : ndarray
+		2D array of interpolated values, one row per profile
+	"""
+	N, nx = np.shape(x)
+	rows = np.arange(N)[:,None]
+
+	#offset each row so the flattened coordinates are globally sorted: allows a single searchsorted for all rows
+	lo = min(np.min(x), np.min(xnew))
+	span = max(np.max(x), np.max(xnew)) - lo + 1
+	offsets = rows * span
+	idx = np.searchsorted((x - lo + offsets).ravel(), xnew[None,:] - lo + offsets) - rows * nx
+
+	#use end segments for extrapolation
+	idx = np.clip(idx, 1, nx - 1)
+	x_lo, x_hi = x[rows, idx - 1], x[rows, idx]
+	y_lo, y_hi = y[rows, idx - 1], y[rows, idx]
+	slope = (y_hi - y_lo) / (x_hi - x_lo)
+
+	return slope * (xnew[None,:] - x_lo) + y_lo
+
+
+def nearest_level(levels, z):
+	"""
+	Get index of the nearest analysis level for each value in z (same as nanargmin(abs(levels - z)))
+	"""
+	return np.argmin(abs(levels[None,:] - np.asarray(z, dtype=float)[:,None]), axis=1)
+
+
+def stack_inputs(inputs, key):
+	"""
+	Get a stacked array of input variable from a list of input dictionaries or a dictionary of arrays
+	"""
+	if isinstance(inputs, dict):
+		return np.asarray(inputs[key], dtype=float)
+	else:
+		return np.array([src[key] for src in inputs], dtype=float)
+
+
+class PlumeBatch:
+	"""
+	Batched Plume class: solves many plumes (e.g. all sources and hours of a run, ensemble members) at once.
+
+	Methods mirror the Plume class and produce the same results, but operate on arrays with
+	one row per plume. Injection heights are found with vectorized bracketed bisection instead of fsolve.
+
+	Attributes
+	----------
+	names : list
+		plume names
+	zi : ndarray
+		boundary layer heights [m]
+	zs : ndarray
+		refernce heights (zi * BLfrac) [m]
+	sounding: ndarray
+		2D potential temperature soundings on interpolated analysis levels [K]
+	THs : ndarray
+		ambient potential tempreature at reference height zs [K]
+	I : ndarray
+		fireline intensity parameter [K m2 s-1]
+	zCL : ndarray
+		parameterized plume injection heights [m]
+	THzCL : ndarray
+		ambient potential temperature at modelled zCL [K]
+	layer_heights : ndarray
+		2D array of emission layer heights [m]
+	layer_fractions : ndarray
+		2D array of emission fractions for each layer
+
+	"""
+
+	def __init__(self, names):
+		"""
+		Constructs the batch object with some inital attributes
+
+		Parameters
+		-----------
+		names: list
+			plume names
+		"""
+		self.names = list(names)
+		self.interpZ = np.arange(0,zmax+1,dz)
+
+	def get_sounding(self, inputs):
+		"""
+		Calculates attributes relating to vertical potential temperature profiles
+
+		Parameters
+		-----------
+		inputs: list or dict
+			list of input dictionaries (as for Plume), or dictionary of stacked 2D arrays 'Z', 'T' and 1D 'PBLH'
+		"""
+		Z, T = stack_inputs(inputs, 'Z'), stack_inputs(inputs, 'T')
+		zi = stack_inputs(inputs, 'PBLH')
+		zs = zi * BLfrac
+
+		#interpolate soundings to analysis levels
+		T0interp = interp_rows(Z, T, self.interpZ)
+		i_zs = nearest_level(self.interpZ, zs)
+		THs = T0interp[np.arange(len(zi)), i_zs]
+
+		self.zi = zi
+		self.zs = zs
+		self.sounding = T0interp
+		self.THs = THs
+
+	def residual(self, z, m, b):
+		"""
+		Evaluate the injection height equation for all plumes (z is 1D with one value per plume, or 2D)
+		"""
+		z2 = np.reshape(z, (len(self.zi), -1))
+		i_z = np.clip((z2/dz).astype(int), 0, len(self.interpZ) - 1)
+		THz = np.take_along_axis(self.sounding, i_z, axis=1)
+		THs, zs, zi, I = self.THs[:,None], self.zs[:,None], self.zi[:,None], self.I[:,None]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			f = z2	- b - m*(zs + \
+					1/(np.sqrt(g*(THz - THs)/(THs * (z2-zs))))	* \
+					(g*I*(z2-zs)/(THs * zi))**(1/3.))
+
+		return np.reshape(f, np.shape(z))
+
+	def iterate(self, biasFit=None, n_iter=40):
+		"""
+		Applies vectorized bracketed bisection to parameterize plume injection heights
+
+		Parameters
+		----------
+		biasFit : array_like, optional
+			bias fit parameters. If none provided defaults to m = 1, b = 0.
+		n_iter : int, optional
+			number of bisection steps (default 40 resolves zCL well below 1 mm)
+
+		Returns
+		-------
+		zCL : ndarray
+			parameterized plume injection heights [m]
+		THzCL : ndarray
+			ambient potential temperature at modelled zCL [K]
+		"""
+		if biasFit:
+			m, b = biasFit[0], biasFit[1]
+		else:
+			m, b = 1, 0
+
+		self.I = np.asarray(self.I, dtype=float)
+		N = len(self.I)
+		rows = np.arange(N)
+		active = self.I > 0
+
+		#deal with 0 intensity fires: set to BL top
+		if (~active).any():
+			logging.warning(f'WARNING: null/negative fireline intensity input for {np.sum(~active)} plumes. Setting to BL height.')
+
+		#set inital guess for day vs night time (same as Plume.iterate)
+		zeroBL = active & (self.zi == 0)
+		if zeroBL.any():
+			logging.warning('WARNING: zi = 0, setting to 200m for cwipp')
+		self.zi = np.where(zeroBL, 200., self.zi)
+		zCL = self.zi.copy()
+		z0 = np.where(zeroBL, 1000., np.maximum(1600, self.zi))
+
+		#evaluate the equation on all analysis levels to locate brackets (sign changes)
+		zgrid = np.broadcast_to(self.interpZ[None,:], (N, len(self.interpZ))).astype(float)
+		fgrid = self.residual(zgrid, m, b)
+		bracket = (fgrid[:,:-1] * fgrid[:,1:] <= 0) & np.isfinite(fgrid[:,:-1]) & np.isfinite(fgrid[:,1:])
+
+		#pick the bracket closest to the initial guess (fsolve converges on the local root)
+		dist = np.where(bracket, abs(self.interpZ[None,:-1] + dz/2. - z0[:,None]), np.inf)
+		k = np.argmin(dist, axis=1)
+		solvable = active & bracket[rows, k]
+		if (active & ~solvable).any():
+			logging.warning(f'WARNING: Failed to find solution for {np.sum(active & ~solvable)} plumes: setting injection to BL top')
+
+		#vectorized bisection
+		lo, hi = self.interpZ[k].astype(float), self.interpZ[k + 1].astype(float)
+		flo = fgrid[rows, k]
+		for _ in range(n_iter):
+			mid = 0.5 * (lo + hi)
+			fmid = self.residual(mid, m, b)
+			left = (flo * fmid <= 0) & np.isfinite(fmid)
+			hi = np.where(left, mid, hi)
+			lo = np.where(left, lo, mid)
+			flo = np.where(left, flo, fmid)
+		zCL = np.where(solvable, 0.5 * (lo + hi), zCL)
+
+		#get related vars
+		i_zCL = nearest_level(self.interpZ, zCL)
+		self.THzCL = self.sounding[rows, i_zCL]
+		self.zCL = zCL
+
+	def classify(self):
+		"""
+
+		Classifies the plumes as penetrative (True) or boundary layer (False)
+
+		Returns
+		--------
+		penetrative : ndarray
+			boolean classification (True if penetrative).
+		"""
+		self.penetrative = ~(self.zCL < (self.zi + (dz)/2))
+
+	def get_uBL(self, inputs):
+		"""
+		Get BL wind magnitude, heat flux
+		"""
+		WSPD = stack_inputs(inputs, 'WSPD')
+		hfx = stack_inputs(inputs, 'HFX')
+
+		#get index of BL top and 1/2 BL (to exclude surface roughness effects on wind)
+		i_zi = nearest_level(self.interpZ, self.zi)
+		i_half_zi = nearest_level(self.interpZ, self.zi*0.5)
+
+		#mean over the same (host model) level slice as Plume.get_uBL
+		cols = np.arange(np.shape(WSPD)[1])[None,:]
+		in_slice = (cols >= i_half_zi[:,None]) & (cols < i_zi[:,None])
+		with np.errstate(divide='ignore', invalid='ignore'):
+			uBL = np.sum(np.where(in_slice, WSPD, 0), axis=1) / np.sum(in_slice, axis=1)
+
+		self.uBL = uBL
+		self.hfx = hfx
+
+	def get_profile(self):
+		"""
+		Parameterization of the full normalized vertical smoke profiles
+
+		Returns
+		-------
+		profile : ndarray
+			2D array of quasi-stationary downwind PM profiles
+		layer_heights: ndarray
+		layer_fraction: ndarray
+		"""
+		rows = np.arange(len(self.zCL))
+		nZ = len(self.interpZ)
+		i_zCL = nearest_level(self.interpZ, self.zCL)
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			#get fire velocity scale
+			self.Tau = 1/np.sqrt(g*(self.THzCL - self.THs)/(self.THs * (self.zCL-self.zs)))
+			self.wf = ((g*self.I*(self.zCL-self.zs))/(self.THs*self.zi))**(1/3.)
+
+			#get Deadorff's velocity for spread
+			wD = (g * self.zi * self.hfx  / self.THs)**(1/3.)
+
+			#formulation of daytime: spread above and below zCL
+			Rw_day = np.where((wD == 0) | (self.wf/wD < 1.5), self.uBL/self.wf, self.uBL/(self.wf - wD))
+			#shallow/nocturnal BL's (no deadorff's velocity effects)
+			Rw_night = self.uBL/self.wf
+
+			daytime = self.zi > 400
+			sigma_top = np.where(daytime, (self.zCL - self.zs)/3., self.zCL/3.)
+			Rw = np.where(daytime, Rw_day, Rw_night)
+
+			#NOTE: adding 0.5 fudge factor for bottom spread, to reduce near-surface bias
+			sigma_bottom = np.where(Rw > 1, Rw * sigma_top*0.5, sigma_top*0.5)
+
+			#prescribe gaussian profile
+			dZ = self.interpZ[None,:] - self.zCL[:,None]
+			top = np.exp(-0.5*(dZ/sigma_top[:,None])**2)
+			bottom = np.exp(-0.5*(dZ/sigma_bottom[:,None])**2)
+			profile = np.where(np.arange(nZ)[None,:] <= i_zCL[:,None], bottom, top)
+
+			#convert to normalized distribution (sum area = 1)
+			profile = profile/np.sum(profile, axis=1)[:,None]
+
+		#allocate to 5 source layers (same as Plume.get_profile)
+		h1 = i_zCL//4
+		h4 = 4*h1
+		h5 = nearest_level(self.interpZ, self.zCL+sigma_top)
+		l1 = (h1*1.5).astype(int)
+		l2 = (h1*2.5).astype(int)
+		l3 = (h1*3.5).astype(int)
+		l4 = ((h4+h5)/2).astype(int)
+
+		#get layer sums from cumulative profile
+		cumprofile = np.concatenate([np.zeros((len(rows),1)), np.cumsum(profile, axis=1)], axis=1)
+		edges = np.stack([np.zeros_like(l1), l1, l2, l3, l4, np.full_like(l1, nZ)], axis=1)
+		edges = np.clip(edges, 0, nZ)
+		starts, ends = edges[:,:-1], np.maximum(edges[:,1:], edges[:,:-1])
+		self.layer_fractions = cumprofile[rows[:,None], ends] - cumprofile[rows[:,None], starts]
+		self.layer_heights = np.stack([self.zCL/4, self.zCL/2, self.zCL*3/4, self.zCL, self.zCL+sigma_top], axis=1)
+
+		self.profile = profile
@@ -0,0 +1,101 @@
+#!/usr/bin/python3.7
+
+#Script writes and reads HYSPLIT EMITIMES files for time-varying emissions
+
+import logging
+import datetime as dt
+import numpy as np
+
+### Inputs ###
+info_lines = 'YYYY MM DD HH DURATION(hhhh) #RECORDS\nYYYY MM DD HH MM DURATION(hhmm) LAT LON HGT(m) RATE(/h) AREA(m2) HEAT(w)\n'
+record_fmt = '{} {:02d}{:02d} {} {} {} {} {} {}\n'		#date prefix, duration, lat, lon, hgt, rate, area, heat
+
+### Functions ###
+
+def as_rows(values):
+	'''
+	Convert (nt, nloc) values to nested lists of python types; lists keep their element types
+	(a numpy array would turn integer areas of one source into floats when another source has float areas)
+	'''
+	if isinstance(values, np.ndarray):
+		return values.tolist()
+
+	return [list(row) for row in values]
+
+
+def write_emitimes(path, times, lat, lon, heights, rates, areas, heat=None, rec_minutes=60, block_hours=1):
+	'''
+	Stream EMITIMES records to file, formatting each block in bulk
+	-times: record start times (nt), may be sub-hourly
+	-lat, lon: source point locations (nloc), e.g. all vent-level combinations
+	-heights, areas, heat: arrays of (nt, nloc)
+	-rates: array of (nt, nloc, nspecies); one record per location and species, in species order
+	'''
+	times = list(times)
+	nt, nloc = len(times), len(lat)
+	rates = np.asarray(rates)
+	if rates.ndim == 2:
+		rates = rates[:,:,None]
+	nspec = rates.shape[2]
+	heat = np.zeros((nt, nloc), dtype=int) if heat is None else heat
+
+	#convert to python types once (keeps string formatting identical to str() of the inputs)
+	lat, lon = list(lat), list(lon)
+	heights, areas, heat = as_rows(heights), as_rows(areas), as_rows(heat)
+	rates = rates.tolist()
+	dur_hh, dur_mm = divmod(int(rec_minutes), 60)
+
+	#group record times into emission cycles (blocks) of block_hours
+	blocks = {}
+	for t, time in enumerate(times):
+		start = time.replace(hour=(time.hour // block_hours) * block_hours, minute=0, second=0, microsecond=0)
+		blocks.setdefault(start, []).append(t)
+	recs_per_time = nloc * nspec
+
+	with open(path, 'w') as emitimes:
+		emitimes.write(info_lines)
+		for start, tidx in blocks.items():
+			header = start.strftime('%Y %m %d %H ') + f'{block_hours:04d} {recs_per_time * len(tidx)} \n'
+
+			#format all records of the block at once and write them in one call
+			lines = []
+			for t in tidx:
+				prefix = times[t].strftime('%Y %m %d %H %M')
+				lines.extend(record_fmt.format(prefix, dur_hh, dur_mm, lat[i], lon[i], int(heights[t][i]), int(rates[t][i][s]), areas[t][i], heat[t][i]) \
+						for i in range(nloc) for s in range(nspec))
+			emitimes.write(header)
+			emitimes.write(''.join(lines))
+	logging.debug(f'...wrote {len(blocks)} EMITIMES blocks with {recs_per_time} records per time: {path}')
+
+	return
+
+
+def read_emitimes(path):
+	'''
+	Read EMITIMES file into arrays of record values (for verification)
+	-returns a dictionary of 1D arrays, one entry per record, and the block headers
+	'''
+	with open(path, 'r') as f:
+		lines = f.read().splitlines()
+
+	#skip the two info lines, then walk the blocks using record counts from headers
+	headers, rec_lines, rec_block = [], [], []
+	i = 2
+	while i < len(lines):
+		if not lines[i].strip():
+			i = i + 1
+			continue
+		hdr = lines[i].split()
+		nrec = int(hdr[5])
+		headers.append({'start': dt.datetime(*[int(v) for v in hdr[:4]]), 'duration': int(hdr[4]), 'records': nrec})
+		rec_lines.extend(lines[i+1:i+1+nrec])
+		rec_block.extend([len(headers) - 1] * nrec)
+		i = i + 1 + nrec
+
+	#convert all records at once
+	names = ['year', 'month', 'day', 'hour', 'minute', 'duration', 'lat', 'lon', 'height', 'rate', 'area', 'heat']
+	values = np.array(' '.join(rec_lines).split(), dtype=float).reshape(-1, len(names))
+	records = {name: values[:,n] for n, name in enumerate(names)}
+	records['block'] = np.array(rec_block, dtype=int)
+
+	return records, headers
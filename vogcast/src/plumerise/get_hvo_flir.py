@@ -12,12 +12,15 @@ import logging
 import json
 from math import cos, sin, tan, atan, radians
 import os
-import glob
+import sys
+import bisect
 import time
-from copy import deepcopy
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from set_vog_env import *
+import hvo_api
 from bs4 import BeautifulSoup
 #import pymatreader as mat
 
@@ -28,51 +31,126 @@ url = 'https://hvovalve.wr.usgs.gov/cams/data/F1cam/images/mat/'
 url_lava = 'https://hvo-api.wr.usgs.gov/api/v1/laserlavalevel/'
 channels_lava = {'channel': 'HMM','rank':1, 'series': ['sealevel']} 	#this is set to summit vent only
 Tactive = 300 		#threshold for "active lava" (deg C)
+lake_quant = 1 		#lake level quantization for cached pixel-area grids (m)
+catalog_name = 'catalog.json' 	#sorted timestamp index of thermal images (stored in flir cache folder)
+mtime_slack = 2 	#directory modification times this close to the last catalog scan are not trusted (s)
+frame_cache_size = 8 	#number of decoded thermal images kept in memory
+download_workers = 8 	#number of concurrent thermal image downloads
+request_timeout = 60 	#timeout for individual HVO requests (s)
+mirror_hrs = 72 	#hours before forecast start to mirror thermal images for (matches 3-day mismatch warning)
+
+#in-memory storage for pixel-area grids, keyed by quantized lake level and image shape
+pixel_area_cache = {}
 
 
 ### Functions ###
-def get_dir_listing(url,keypath,ext=''):
+def get_dir_listing(url,session,ext=''):
 	'''
 	Get a listing of all files in hvo directory
 	'''
-	login = read_config(keypath)
-	page = requests.get(url,auth=(login['hvo']['user'],login['hvo']['pwd']))
-	if page.ok:
+	try:
+		page = session.get(url, timeout=request_timeout)
+	except requests.exceptions.RequestException:
+		page = None
+	if page is not None and page.ok:
 		soup = BeautifulSoup(page.text,'html.parser')
-		listing = [url + '/' + node.get('href') for node in soup.find_all('a') if node.get('href').endswith(ext)]
+		listing = [url + '/' + node.get('href') for node in soup.find_all('a') if (node.get('href') or '').endswith(ext)]
 		
 		return listing
 	else:
 		#TODO add two-min wait
-		return logging.crititcal('ERROR: Cannot reach HVO server. Continuing with whatever data is available locally.')
+		logging.critical('ERROR: Cannot reach HVO server. Continuing with whatever data is available locally.')
+		return []
 
 
-def download_images(listing, keypath, flir_path):
+def get_mirror_window():
 	'''
-	Download all images and save to disk
+	Get the time window of thermal images needed for the forecast
 	'''
+	fc_date = dt.datetime.strptime(os.environ['forecast'] + '+0000', '%Y%m%d%H%z')
+	start = fc_date - dt.timedelta(hours=mirror_hrs)
+	end = fc_date + dt.timedelta(hours=int(os.environ['runhrs']))
+
+	return start, end
 
-	login = read_config(keypath)
+
+def filter_listing(listing, catalog, window=None):
+	'''
+	Select images that are not yet available locally and (optionally) fall within the time window
+	'''
+	local_images = set(catalog['names'])
+	missing = []
 	for item in listing:
-		#allow a 2min wait to avoid issues during server update times (~58min after each hour)
+		filename = os.path.basename(item)
+		if filename in local_images:
+			continue
+		if window:
+			try:
+				img_dt = image_timestamp(filename)
+			except ValueError:
+				logging.debug(f'...skipping unrecognized thermal image name: {filename}')
+				continue
+			if not (window[0] <= img_dt <= window[1]):
+				continue
+		missing.append(item)
+
+	return missing
+
+
+def fetch_image(session, item, flir_path):
+	'''
+	Download a single image (saved under its final name only once complete)
+	'''
+	filename = os.path.basename(item)
+	savepath = os.path.join(flir_path, filename)
+
+	#allow a 2min wait to avoid issues during server update times (~58min after each hour)
+	try:
 		try:
-			response = requests.get(item,auth=(login['hvo']['user'],login['hvo']['pwd']))
-		except:
+			response = session.get(item, timeout=request_timeout)
+		except requests.exceptions.RequestException:
 			logging.warning('...HVO server not available. Retrying in 2 minutes')
 			time.sleep(2)
-			response = requests.get(item,auth=(login['hvo']['user'],login['hvo']['pwd']))
-			
-		#save file data to local disk
-		filename = os.path.basename(item)
-		logging.debug(f'...downloading thermal image {filename}')
-		savepath = os.path.join(flir_path, filename)
-		if os.path.exists(savepath):
-			logging.debug('WARNING: file already exists, skipping...')
-		else:
-			with open(savepath, 'wb') as file:
-				file.write(response.content)
+			response = session.get(item, timeout=request_timeout)
+	except requests.exceptions.RequestException:
+		logging.warning(f'WARNING: failed to download thermal image {filename}, skipping')
+		return None
+	if not response.ok:
+		logging.warning(f'WARNING: HVO server returned {response.status_code} for {filename}, skipping')
+		return None
 
-	return
+	#older urllib3 versions do not raise on a dropped connection, so check the transfer is complete
+	expected = response.headers.get('Content-Length')
+	if expected and 'Content-Encoding' not in response.headers and int(expected) != len(response.content):
+		logging.warning(f'WARNING: incomplete download of thermal image {filename} ({len(response.content)} of {expected} bytes), skipping')
+		return None
+
+	#save file data to local disk
+	logging.debug(f'...downloading thermal image {filename}')
+	with atomic_write(savepath, f'.{os.getpid()}.part') as tmp_path, open(tmp_path, 'wb') as file:
+		file.write(response.content)
+
+	return filename
+
+
+def download_images(listing, session, catalog, window=None):
+	'''
+	Mirror missing images to disk using a bounded pool of download threads
+	'''
+	flir_path = catalog['path']
+	missing = filter_listing(listing, catalog, window)
+	logging.info(f'...{len(missing)} of {len(listing)} listed thermal images need downloading')
+	if not missing:
+		return []
+
+	with ThreadPoolExecutor(max_workers=download_workers) as pool:
+		downloaded = list(pool.map(lambda item: fetch_image(session, item, flir_path), missing))
+	downloaded = [filename for filename in downloaded if filename]
+
+	#add new images to the local catalog
+	update_image_catalog(catalog)
+
+	return downloaded
 
 
 
@@ -91,11 +169,11 @@ def get_lake_level(keypath):
 	api_call = url_lava + dt.datetime.strftime(start_hst,'%Y%m%d%H%M%S') + '/' + dt.datetime.strftime(end_hst,'%Y%m%d%H%M%S')
 	logging.debug(f'...pulling lake level data from: {api_call}')
 
-	login = read_config(keypath)
-	response = requests.post(api_call,auth=(login['hvo']['user'],login['hvo']['pwd']),data=json.dumps(channels_lava))
+	#historic windows don't change, so their response can be kept for good
+	permanent = os.environ['runtype'] != 'realtime'
+	response = hvo_api.post(keypath, api_call, channels_lava, permanent)
 	
 	#if theres no data, set to default
-	response = response.json()
 	if response['nr']==0:
 		#TODO: change default back to 870 for ops runs!!
 		lake_level = [870] * runhrs
@@ -119,82 +197,200 @@ def get_lake_level(keypath):
 
 
 
-def get_nearest_image(source, hr):
+def image_timestamp(img_name):
 	'''
-	Get the nearest file for each forecast hour
+	Convert thermal image filename into a datetime (filenames are in HST)
 	'''
+	img_dt_str = img_name.split('_')[0]
+	img_dt = dt.datetime.strptime(img_dt_str+'-1000','%Y%m%d%H%M%S%z')
 
-	#get the timestamp of the current forecast step
-	fc_date = dt.datetime.strptime(os.environ['forecast'] + '+0000', '%Y%m%d%H%z')
-	fcst_hr = fc_date + dt.timedelta(hours=hr)
- 
-	#get a listing of availble files and convert to a list of datetimes
-	#image_dirlist = os.path.join(source['flir_path'], '*.mat')
-	image_dirlist = os.path.join(source['flir_path'], '*.npy')
-	local_images = glob.glob(image_dirlist)
-	
-	img_dates = []
-	for img in local_images:
-		img_name = os.path.split(img)[-1]
-		img_dt_str = img_name.split('_')[0]
-		# convert to date, assuming filenames are in HST
-		img_dt = dt.datetime.strptime(img_dt_str+'-1000','%Y%m%d%H%M%S%z')
-		img_dates.append(img_dt)
+	return img_dt
 
-	
-	#get closest availble image
-	nearest = min(img_dates, key=lambda x: abs(x - fcst_hr))
-	#nearest_img_name = dt.datetime.strftime(nearest,'%Y%m%d%H%M%S_F1.mat')
-	nearest_img_name = dt.datetime.strftime(nearest,'%Y%m%d%H%M%S_F1.npy')
-	logging.debug(f'...nearest thermal image found: {nearest_img_name}')
-	if (fcst_hr - nearest) > dt.timedelta(days = 3):
-		logging.warning(f'WARNING: time mismatch with thermal image {nearest_img_name} is more than 3 days')
-
-	#get data from file as array
-	img_path = os.path.join(source['flir_path'],nearest_img_name)
+
+def load_image_catalog(flir_path):
+	'''
+	Load sorted timestamp index of local thermal images and bring it up to date
+	'''
+	catalog_file = os.path.join(get_flir_cache_path(flir_path), catalog_name)
+	catalog = {'path': flir_path, 'times': [], 'names': [], 'bad': set(), 'mtime': None, 'scanned': None}
+	if os.path.exists(catalog_file):
+		try:
+			stored = read_json(catalog_file)
+			catalog['times'] = stored['times']
+			catalog['names'] = stored['names']
+			catalog['bad'] = set(stored['bad'])
+			catalog['mtime'] = stored['mtime']
+			catalog['scanned'] = stored.get('scanned')
+		except (ValueError, KeyError):
+			logging.warning(f'WARNING: unreadable thermal image catalog {catalog_file}, rebuilding')
+
+	update_image_catalog(catalog)
+
+	return catalog
+
+
+def update_image_catalog(catalog):
+	'''
+	Add any new images in the thermal image directory to the catalog (only new filenames are parsed)
+	'''
+	#skip directory scan if nothing was added or removed since the last update
+	#(only if the directory was last modified well before that scan: coarse timestamps hide changes made during it)
+	scan_time = time.time()
+	dir_mtime = os.stat(catalog['path']).st_mtime
+	if dir_mtime == catalog['mtime'] and catalog['scanned'] and dir_mtime < catalog['scanned'] - mtime_slack:
+		return
+
+	#image_ext = '.mat'
+	image_ext = '.npy'
+	local_images = set(f for f in os.listdir(catalog['path']) if f.endswith(image_ext))
+	known = set(catalog['names'])
+
+	#drop images that no longer exist
+	if not known.issubset(local_images):
+		keep = [i for i, name in enumerate(catalog['names']) if name in local_images]
+		catalog['times'] = [catalog['times'][i] for i in keep]
+		catalog['names'] = [catalog['names'][i] for i in keep]
+		catalog['bad'] = catalog['bad'] & local_images
+
+	#insert new images, keeping the index sorted by time
+	new_images = local_images - known
+	for img_name in new_images:
+		try:
+			img_time = image_timestamp(img_name).timestamp()
+		except ValueError:
+			logging.debug(f'...skipping unrecognized thermal image name: {img_name}')
+			continue
+		idx = bisect.bisect_right(catalog['times'], img_time)
+		catalog['times'].insert(idx, img_time)
+		catalog['names'].insert(idx, img_name)
+	logging.debug(f'...thermal image catalog: {len(new_images)} new, {len(catalog["names"])} total')
+
+	catalog['mtime'] = dir_mtime
+	catalog['scanned'] = scan_time
+	save_image_catalog(catalog)
+
+	return
+
+
+def save_image_catalog(catalog):
+	'''
+	Write thermal image catalog to disk
+	'''
+	catalog_file = os.path.join(get_flir_cache_path(catalog['path']), catalog_name)
+	stored = {'times': catalog['times'], 'names': catalog['names'], 'bad': sorted(catalog['bad']), 'mtime': catalog['mtime'], 'scanned': catalog['scanned']}
+	with atomic_write(catalog_file) as tmp_file:
+		write_json(tmp_file, stored)
+
+	return
+
+
+def find_nearest_image(catalog, target):
+	'''
+	Bisect the catalog for the image closest in time to target, skipping images flagged as bad
+	'''
+	times, names, bad = catalog['times'], catalog['names'], catalog['bad']
+	t = target.timestamp()
+	idx = bisect.bisect_left(times, t)
+
+	#walk outwards from the insertion point until a good image is found on either side
+	before, after = idx - 1, idx
+	while before >= 0 and names[before] in bad:
+		before = before - 1
+	while after < len(names) and names[after] in bad:
+		after = after + 1
+
+	if before < 0 and after >= len(names):
+		return None
+	elif before < 0:
+		return names[after]
+	elif after >= len(names):
+		return names[before]
+	elif (t - times[before]) <= (times[after] - t):
+		return names[before]
+	else:
+		return names[after]
+
+
+def mark_bad_image(catalog, img_name):
+	'''
+	Flag an image as bad so it is never loaded again
+	'''
+	catalog['bad'].add(img_name)
+	save_image_catalog(catalog)
+
+	return
+
+
+@lru_cache(maxsize=frame_cache_size)
+def load_image(img_path):
+	'''
+	Load thermal image and convert to deg C (decoded frames are cached, do not modify in place)
+	'''
 	#flir_data = mat.read_mat(img_path)['img']
-	raw_flir_data = np.load(img_path)
+	raw_flir_data = np.load(img_path, mmap_mode='r')
 	flir_data = raw_flir_data*0.1 - 273.15
+	flir_data.flags.writeable = False
+
+	return flir_data
+
+
+def valid_image(img_path):
+	'''
+	Check that the bottom row of the image is not negative (only the last row is read from disk)
+	'''
+	raw_flir_data = np.load(img_path, mmap_mode='r')
+	bottom_row = np.asarray(raw_flir_data[-1,:])*0.1 - 273.15
+
+	#return (bottom_row.mean() >= 0) and (len(flir_data[flir_data > Tactive]) >= 100)
+	return bottom_row.mean() >= 0
+
 
-	#TODO: fix this ugly repetitive coding (move to a separate function)
+def get_nearest_image(source, hr, catalog):
+	'''
+	Get the nearest valid file for each forecast hour
+	'''
+
+	#get the timestamp of the current forecast step
+	fc_date = dt.datetime.strptime(os.environ['forecast'] + '+0000', '%Y%m%d%H%z')
+	fcst_hr = fc_date + dt.timedelta(hours=hr)
+
+	#get closest availble image, stepping back in time if the image is invalid
 	loophr = hr + 0
-	while (flir_data[-1,:].mean() < 0):
-	#while (flir_data[-1,:].mean() < 0) or (len(flir_data[flir_data > Tactive]) < 100):
-		#hr = hr - 1
+	while True:
+		nearest_img_name = find_nearest_image(catalog, fcst_hr)
+		if nearest_img_name is None:
+			logging.critical(f'ERROR: no valid thermal images found in {source["flir_path"]}. Aborting!')
+			sys.exit(1)
+		logging.debug(f'...nearest thermal image found: {nearest_img_name}')
+		if (fcst_hr - image_timestamp(nearest_img_name)) > dt.timedelta(days = 3):
+			logging.warning(f'WARNING: time mismatch with thermal image {nearest_img_name} is more than 3 days')
+
+		img_path = os.path.join(source['flir_path'],nearest_img_name)
+		if valid_image(img_path):
+			break
+
+		#flag the image so it's never reloaded, and pull previous image
+		mark_bad_image(catalog, nearest_img_name)
 		loophr = loophr - 1
 		fcst_hr = fc_date + dt.timedelta(hours=loophr)
-		nearest = min(img_dates, key=lambda x: abs(x - fcst_hr))
-		#nearest_img_name = dt.datetime.strftime(nearest,'%Y%m%d%H%M%S_F1.mat')
-		nearest_img_name = dt.datetime.strftime(nearest,'%Y%m%d%H%M%S_F1.npy')
-		
-		#TODO:check we are not at oldest file
-		#if ('previous_name' in locals()) and (previous_name==nearest_img_name):
-			
+		logging.warning(f'WARNING: thermal image {nearest_img_name} contains negative values, pulling previous image')
 
-		img_path = os.path.join(source['flir_path'],nearest_img_name)
-		#flir_data = mat.read_mat(img_path)['img']
-		raw_flir_data = np.load(img_path)
-		logging.warning(f'WARNING: thermal image contains negative values or <100 active pixels, pulling previous image {nearest_img_name}')
-		previous_name = f'{nearest_img_name}'
-	
-	flir_data = raw_flir_data* 0.1 - 273.15
-	return flir_data
+	return img_path
 
 
 def get_lava_temperature(flir_data):
 	'''
 	Get mean temperature of all active lava pixels
 	'''
-	#mask everything below active-lava threshold (set in inputs in the beginning of this module)
-	active_lava = deepcopy(flir_data)
-	active_lava[active_lava < Tactive] = None
+	#select everything above active-lava threshold (set in inputs in the beginning of this module)
+	active_lava = flir_data[flir_data >= Tactive]
 
-	#get nanmean
-	try:
-		mean_lava_temperature = int(np.nanmean(active_lava))
-	except:
+	#get mean
+	if active_lava.size == 0:
 		logging.warning('WARNING: no active lava pixels found, setting T = 50C')
 		mean_lava_temperature = 50.
+	else:
+		mean_lava_temperature = int(active_lava.mean())
 	
 	logging.info(f'...mean lava temperature: {mean_lava_temperature} deg C')
 
@@ -204,12 +400,15 @@ def get_lava_temperature(flir_data):
 def get_pixel_coordinates(lake_level, pY, pX):
 	'''
 	Get horizontal coordinates of pixel relative to camera location
+	-pY and pX can be scalars or numpy arrays of (fractional) pixel indices
 	'''
 	dZ = 1142		#camera heigth (m ASL)
 	fovY, fovX = 33.75, 45	#camera FOV (vertical and horizontal)
 	dipY = 23.7		#camera dip angle
 	dimY, dimX = 640, 480	#image size in pixels
 
+	pY, pX = np.asarray(pY, dtype=float), np.asarray(pX, dtype=float)
+
 	mZ = dZ - lake_level 
 	#get angle below horizon
 	top = dipY - .5*fovY
@@ -222,25 +421,82 @@ def get_pixel_coordinates(lake_level, pY, pX):
 
 	#recall that images are flipped on the sensor
 	#deal with vertical projection
-	dy = abs(ctrY - pY)
-	theta = atan(dy/ly)
-	if pY <= ctrY:
-		theta = -1 * theta
+	dy = np.abs(ctrY - pY)
+	theta = np.arctan(dy/ly)
+	theta = np.where(pY <= ctrY, -1 * theta, theta)
 	gamma = radians(top) + Oy + theta
-	mY = mZ / tan(gamma)
-	L = mZ / sin(gamma)
+	mY = mZ / np.tan(gamma)
+	L = mZ / np.sin(gamma)
 	
 	#deal with horizonal projection
-	dx = abs(ctrX- pX)
-	phi = atan(dx/lx)
-	mX = L * sin(phi)
-	if pX <= ctrX:
-		mX = -1 * mX
+	dx = np.abs(ctrX- pX)
+	phi = np.arctan(dx/lx)
+	mX = L * np.sin(phi)
+	mX = np.where(pX <= ctrX, -1 * mX, mX)
 	
 	#logging.debug(f'...pY = {pY}, pX = {pX}') 
 	#logging.debug(f'...mY = {mY} m; L = {L} m, mX = {mX} m  ')
 
 	return mX, mY
+
+def get_pixel_areas(lake_level, shape):
+	'''
+	Get ground area (m2) of every pixel in the image by projecting all pixel corners at once
+	'''
+	#corner grid: pixel (i,j) is bounded by corners [i,j], [i,j+1], [i+1,j+1], [i+1,j]
+	cY, cX = np.meshgrid(np.arange(shape[0] + 1) - .5, np.arange(shape[1] + 1) - .5, indexing='ij')
+	X, Y = get_pixel_coordinates(lake_level, cY, cX)
+
+	#split into the four corners of each pixel (same order as the original per-pixel loop)
+	x1, y1 = X[:-1,:-1], Y[:-1,:-1]
+	x2, y2 = X[:-1,1:], Y[:-1,1:]
+	x3, y3 = X[1:,1:], Y[1:,1:]
+	x4, y4 = X[1:,:-1], Y[1:,:-1]
+
+	#get area using Shoeslace formula
+	areas = 0.5 * np.abs((x1*y4 + x2*y1 + x3*y2 + x4*y3) - (y1*x4 + y2*x1 + y3*x2 + y4*x3))
+
+	return areas
+
+def get_flir_cache_path(flir_path):
+	'''
+	Get location of the image catalog and pixel-area lookup tables (stored next to the thermal image folder)
+	'''
+	flir_dir = os.path.normpath(flir_path)
+	cache_path = os.path.join(os.path.dirname(flir_dir), os.path.basename(flir_dir) + '_cache')
+	os.makedirs(cache_path, exist_ok=True)
+
+	return cache_path
+
+def quantize_lake_level(lake_level):
+	'''
+	Round lake level to lake_quant to keep the number of stored pixel-area grids small
+	'''
+	return int(round(lake_level / lake_quant) * lake_quant)
+
+def get_pixel_area_grid(lake_level, shape, flir_path):
+	'''
+	Get pixel-area grid for a given lake level: from memory, from disk or computed and saved
+	'''
+	lvl = quantize_lake_level(lake_level)
+	key = (lvl, tuple(shape))
+	if key in pixel_area_cache:
+		return pixel_area_cache[key]
+
+	cache_path = get_flir_cache_path(flir_path)
+	grid_file = os.path.join(cache_path, f'pixel_areas_{lvl}m_{shape[0]}x{shape[1]}.npy')
+	if os.path.exists(grid_file):
+		logging.debug(f'...loading pixel-area grid: {grid_file}')
+		areas = np.load(grid_file)
+	else:
+		logging.debug(f'...creating pixel-area grid for lake level {lvl} m ASL: {grid_file}')
+		areas = get_pixel_areas(lvl, shape)
+		with atomic_write(grid_file, f'.{os.getpid()}.tmp') as tmp_file, open(tmp_file, 'wb') as f:
+			np.save(f, areas)
+
+	pixel_area_cache[key] = areas
+
+	return areas
 	
 def get_pixel_utm_coordinates(lake_level, pxY, pxX):
 	'''
@@ -301,31 +557,17 @@ def get_pixel_utm_coordinates(lake_level, pxY, pxX):
 	return E, N 
 
 
-def get_lava_area(flir_data, lake_level):
+def get_lava_area(flir_data, lake_level, flir_path):
 	'''
 	Get total area of all active lava pixels
 	'''
 	
-	#mask everything below active-lava threshold, this time with 0 to use numpy nonzero
-	active_lava = deepcopy(flir_data)
-	active_lava[active_lava < Tactive] = 0
-	
+	#mask everything below active-lava threshold (set in inputs in the beginning of this module)
+	active_lava = flir_data >= Tactive
 
-	#get list of index-pairs that are non-zero
-	active_pixels = np.nonzero(active_lava)
-
-	pixel_areas = []
-	for pY, pX in zip(*active_pixels):
-		x1, y1 = get_pixel_coordinates(lake_level, pY-.5, pX-.5)
-		x2, y2 = get_pixel_coordinates(lake_level, pY-.5, pX+.5)
-		x3, y3 = get_pixel_coordinates(lake_level, pY+.5, pX+.5)
-		x4, y4 = get_pixel_coordinates(lake_level, pY+.5, pX-.5)
-		X = [x1, x2, x3, x4]
-		Y = [y1, y2, y3, y4]
-		#get area using Shoeslace formula
-		px_area = 0.5*np.abs(np.dot(X,np.roll(Y,1))-np.dot(Y,np.roll(X,1)))
-		pixel_areas.append(px_area)
-	area = int(sum(pixel_areas))
+	#sum georeferenced areas of active pixels
+	pixel_areas = get_pixel_area_grid(lake_level, np.shape(flir_data), flir_path)
+	area = int(pixel_areas[active_lava].sum())
 	logging.info(f'...total area of active lava lake: {area} m2')	
 
 	return area
@@ -342,28 +584,43 @@ def main(source):
 	json_data = read_run_json()	
 	keypath = json_data['user_defined']['keys']
 
-	#downlaod mat files if running as a forecast, otherwise will use images in flir directory
-	if os.environ['runtype'] == 'realtime':
-		listing = get_dir_listing(url,keypath,'npy')
-		download_images(listing, keypath, source['flir_path'])	
+	#load index of local images
+	catalog = load_image_catalog(source['flir_path'])
 
+	#pull lake level in the background while images are mirrored
+	with ThreadPoolExecutor(max_workers=1) as pool:
+		lake_pull = pool.submit(get_lake_level, keypath)
+
+		#downlaod mat files if running as a forecast, otherwise will use images in flir directory
+		if os.environ['runtype'] == 'realtime':
+			session = hvo_api.get_session(keypath, download_workers)
+			listing = get_dir_listing(url,session,'npy')
+			download_images(listing, session, catalog, get_mirror_window())
+
+		lake_level = lake_pull.result()
 
 	#get data for each hour
 	#for future/missing times, assume closts/most recent values
 	temperature, area = [], []
-	lake_level = get_lake_level(keypath)
+
+	#storage for values of images already processed (consecutive hours often share the same image)
+	frame_temperature, frame_area = {}, {}
 	for hr in range(int(os.environ['runhrs'])):
 		if hr < int(os.environ['spinup']):
 			temperature.append(0)
 			area.append(0)
 		else:
-			#locate most relevant file and read data
-			flir_data = get_nearest_image(source, hr)
+			#locate most relevant file
+			img_path = get_nearest_image(source, hr, catalog)
+			area_key = (img_path, quantize_lake_level(lake_level[hr]))
 			#TODO add logic to test image and make sure temperatures are reasonable
-			#extract temperature
-			temperature.append(get_lava_temperature(flir_data))
-			#extract area
-			area.append(get_lava_area(flir_data, lake_level[hr]))
+			#extract temperature and area only for images (and lake levels) not seen yet
+			if img_path not in frame_temperature:
+				frame_temperature[img_path] = get_lava_temperature(load_image(img_path))
+			if area_key not in frame_area:
+				frame_area[area_key] = get_lava_area(load_image(img_path), lake_level[hr], source['flir_path'])
+			temperature.append(frame_temperature[img_path])
+			area.append(frame_area[area_key])
 	source['temperature'] = temperature
 	source['area'] = area
 
@@ -16,7 +16,7 @@ import netCDF4 as nc
 from sklearn.neighbors import KDTree
 from scipy.interpolate import interp1d
 import wrf
-import pandas as pd
+import hashlib
 import numpy as np
 import datetime as dt
 
@@ -25,6 +25,9 @@ logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 logging.getLogger('matplotlib').setLevel(logging.WARNING)
 
+### Inputs ###
+grid_cache_dir = 'grid_cache' 	#folder (within run_dir) for cached source grid locations
+
  ### Fucntions ###
 
 def setup_cwipp_dir():
@@ -47,84 +50,176 @@ def setup_cwipp_dir():
 
 	return
 
-def build_met_tree(ds):
+def build_met_tree(xlat, xlong):
 	'''
 	Bbuild met kd-tree
 	'''
-	locs = pd.DataFrame({'XLAT': ds.variables['XLAT'][0].ravel(), 'XLONG': ds.variables['XLONG'][0].ravel()})
+	locs = np.column_stack([np.ravel(xlat), np.ravel(xlong)])
 	tree = KDTree(locs)
 
 	return tree
 
 
-def get_met_loc_idx(tree, src_loc):
+def get_met_loc_idx(tree, src_locs):
 	'''
-	Query kd-tree and do sanity check
+	Query kd-tree for all sources at once and do sanity check
 	'''
-	dist, ind = tree.query(src_loc, k=1)
+	dist, ind = tree.query(src_locs, k=1)
 
 	#make sure the points are not too far (NOTE: hardcoded cutoff)
-	if dist > 0.1:
-		logging.error('ERROR: Closest WRF location is too far: dist = {}'.format(dist[0][0]))
+	if np.any(dist > 0.1):
+		logging.error('ERROR: Closest WRF location is too far: dist = {}'.format(dist.max()))
 		sys.exit(1)
 	else:
-		return ind
+		return ind.ravel()
 
 
-def get_met_data(ds,hr,met_idx):
+def get_met_loc_cache(xlat, xlong, src_locs):
 	'''
-	Extract profiles
+	Get path of the cached grid index file for the given met grid and source locations
 	'''
-	
-	#get indecies in two differet formats for convenience
-	iz,ilat,ilon =  np.unravel_index(met_idx[0],shape = np.shape(ds.variables['XLAT']))
+	#grid is identical from cycle to cycle, so key the cache by grid coordinates and source locations
+	key = hashlib.sha1()
+	for arr in [xlat, xlong, src_locs]:
+		key.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+	cache_path = os.path.join(os.environ['run_dir'], grid_cache_dir)
+	Path(cache_path).mkdir(exist_ok=True)
 
-	#get time index (accounting for possible resart run)
-	min_from_start = hr * 60
-	it = np.argmin(abs(ds.variables['XTIME'][:] - ds.variables['XTIME'][0]- min_from_start))
-	time = str(wrf.extract_times(ds,it))
-	logging.debug(f'Getting data for time: {time}')
+	return os.path.join(cache_path, f'met_idx_{key.hexdigest()}.json')
 
-	#get destaggered height vector, convert to AGL
-	zstag = (ds.variables['PHB'][it,:,ilat,ilon] + ds.variables['PH'][it,:,ilat,ilon])//9.81
-	z0 = wrf.destagger(zstag,0)
-	sfc_elev = ds.variables['HGT'][it,ilat,ilon]
-	logging.debug(f'Source elevation: {sfc_elev}')
-	agl_height = z0 - sfc_elev
 
-	#get vertical temperature profile
-	T0 = ds.variables['T'][it,:,ilat,ilon] + 300
-	P = (ds.variables['P'][it,:,ilat,ilon] + ds.variables['PB'][it,:,ilat,ilon]) * 0.01
+def locate_sources(ds, src_locs):
+	'''
+	Get flattened met grid indices for all sources, building the kd-tree only if not cached
+	'''
+	xlat = np.asarray(ds.variables['XLAT'][0])
+	xlong = np.asarray(ds.variables['XLONG'][0])
+	cache_file = get_met_loc_cache(xlat, xlong, src_locs)
 
-	#get wind magnitude profile 
-	#M  = (ds.variables['U'][it,:,ilat,ilon].squeeze()**2 + ds.variables['V'][it,:,ilat,ilon].squeeze()**2)**(0.5)
-	M10 = (ds.variables['U10'][it,ilat,ilon]**2 + ds.variables['V10'][it,ilat,ilon]**2)**(0.5)
+	if os.path.exists(cache_file):
+		logging.debug(f'...using cached source grid locations: {cache_file}')
+		met_idxs = np.array(read_json(cache_file)['met_idx'])
+	else:
+		logging.debug('...building met kd-tree')
+		met_tree = build_met_tree(xlat, xlong)
+		met_idxs = get_met_loc_idx(met_tree, src_locs)
+		with atomic_write(cache_file, f'.{os.getpid()}.tmp') as tmp_file:
+			write_json(tmp_file, {'src_locs': np.asarray(src_locs).tolist(), 'met_idx': met_idxs.tolist()})
+
+	return met_idxs
+
+
+def get_uvmet_rotation(ds, lat, lon):
+	'''
+	Get sine and cosine of the grid-to-earth wind rotation angle at given points (same as wrf-python uvmet)
+	'''
+	map_proj = int(ds.getncattr('MAP_PROJ'))
+
+	#no rotation needed for Mercator and lat/lon grids
+	if map_proj not in (1, 2):
+		return np.zeros(np.shape(lat)), np.ones(np.shape(lat))
+
+	rpd = np.pi/180.
+	if map_proj == 1:
+		#Lambert conformal: get cone factor from true latitudes
+		true_lat1, true_lat2 = ds.getncattr('TRUELAT1'), ds.getncattr('TRUELAT2')
+		if (abs(true_lat1 - true_lat2) > 0.1) and (abs(true_lat2 - 90.) > 0.1):
+			cone = np.log(np.cos(true_lat1*rpd)) - np.log(np.cos(true_lat2*rpd))
+			cone = cone / (np.log(np.tan((45.-abs(true_lat1/2.))*rpd)) - np.log(np.tan((45.-abs(true_lat2/2.))*rpd)))
+		else:
+			cone = np.sin(abs(true_lat1)*rpd)
+	else:
+		#polar stereographic
+		cone = 1.
+	try:
+		cen_lon = ds.getncattr('STAND_LON')
+	except AttributeError:
+		cen_lon = ds.getncattr('CEN_LON')
+
+	longca = lon - cen_lon
+	longca = np.where(longca > 180., longca - 360., longca)
+	longca = np.where(longca < -180., longca + 360., longca)
+	alpha = np.where(lat < 0, -longca*cone*rpd, longca*cone*rpd)
+
+	return np.sin(alpha), np.cos(alpha)
 
-	#get wind  direction from wrf functions
-	WDIR = wrf.g_uvmet.get_uvmet_wdir(ds, timeidx=it, meta=False)[:,ilat,ilon]
-	WSPD = wrf.g_uvmet.get_uvmet_wspd(ds, timeidx=it, meta=False)[:,ilat,ilon]
-	
-	#get zi
-	pblh = ds.variables['PBLH'][it,ilat,ilon]
-	
-	#get surface heat flux in kinematic form
-	hfx = (ds.variables['HFX'][it,ilat,ilon]) * 1.2/1005
-
-	#compile output dict
-	metdata = {}
-	metdata['T'] = T0.squeeze().tolist()
-	metdata['P'] = P.squeeze().tolist()
-	metdata['ELEV'] = int(sfc_elev)
-	metdata['PBLH'] = int(pblh)
-	metdata['Z'] = agl_height.squeeze().tolist()
-	#metdata['U'] = M.squeeze().tolist()
-	metdata['HFX'] = int(hfx)
-	metdata['U10'] = float(M10)
-	metdata['WDIR'] = WDIR.squeeze().tolist()
-	metdata['WSPD'] = WSPD.squeeze().tolist()
-	logging.debug(f'Near-vent windspeed is: {M10} m/s') 
-
-	return metdata
+
+def get_met_columns(ds, hrs, met_idxs):
+	'''
+	Extract profiles for all hours and all source locations, reading each variable once
+	-returns a list (one item per source) of dictionaries with metdata for each hour
+	'''
+	#get column indices for all sources and the bounding box that contains them
+	grid_shape = np.shape(ds.variables['XLAT'])[1:]
+	ilat, ilon = np.unravel_index(np.ravel(met_idxs), grid_shape)
+	j0, j1 = ilat.min(), ilat.max() + 1
+	i0, i1 = ilon.min(), ilon.max() + 1
+	jj, ii = ilat - j0, ilon - i0
+
+	#get time indices (accounting for possible resart run)
+	xtime = np.asarray(ds.variables['XTIME'][:])
+	its = np.array([np.argmin(abs(xtime - xtime[0] - hr * 60)) for hr in hrs])
+	t0, t1 = its.min(), its.max() + 1
+	tt = its - t0
+	times = wrf.extract_times(ds, wrf.ALL_TIMES)
+
+	def read_columns(varname, stag_y=0, stag_x=0):
+		#single hyperslab read per variable, then pick out the source columns: shape (hours, [levels], sources)
+		slab = np.asarray(ds.variables[varname][t0:t1, ..., j0:j1+stag_y, i0:i1+stag_x])[tt]
+		if stag_y:
+			return 0.5 * (slab[..., jj, ii] + slab[..., jj+1, ii])
+		elif stag_x:
+			return 0.5 * (slab[..., jj, ii] + slab[..., jj, ii+1])
+		else:
+			return slab[..., jj, ii]
+
+	#get destaggered height vector, convert to AGL
+	zstag = (read_columns('PHB') + read_columns('PH'))//9.81
+	z0 = wrf.destagger(zstag,1)
+	sfc_elev = read_columns('HGT')
+	agl_height = z0 - sfc_elev[:,None,:]
+
+	#get vertical temperature profile
+	T0 = read_columns('T') + 300
+	P = (read_columns('P') + read_columns('PB')) * 0.01
+
+	#get near-surface wind magnitude
+	M10 = (read_columns('U10')**2 + read_columns('V10')**2)**(0.5)
+
+	#get earth-relative wind speed and direction at source columns only (same as wrf.g_uvmet)
+	U, V = read_columns('U', stag_x=1), read_columns('V', stag_y=1)
+	sina, cosa = get_uvmet_rotation(ds, read_columns('XLAT')[:,None,:], read_columns('XLONG')[:,None,:])
+	Umet = V * sina + U * cosa
+	Vmet = V * cosa - U * sina
+	WSPD = np.sqrt(Umet**2 + Vmet**2)
+	WDIR = np.remainder(270.0 - np.arctan2(Vmet, Umet) * (180.0/np.pi), 360.0)
+
+	#get zi and surface heat flux in kinematic form
+	pblh = read_columns('PBLH')
+	hfx = read_columns('HFX') * 1.2/1005
+
+	#compile output dicts
+	columns = []
+	for iSrc in range(len(ilat)):
+		src_data = {}
+		for iH, hr in enumerate(hrs):
+			logging.debug(f'Getting data for time: {times[its[iH]]}')
+			logging.debug(f'Source elevation: {sfc_elev[iH,iSrc]}')
+			metdata = {}
+			metdata['T'] = T0[iH,:,iSrc].tolist()
+			metdata['P'] = P[iH,:,iSrc].tolist()
+			metdata['ELEV'] = int(sfc_elev[iH,iSrc])
+			metdata['PBLH'] = int(pblh[iH,iSrc])
+			metdata['Z'] = agl_height[iH,:,iSrc].tolist()
+			metdata['HFX'] = int(hfx[iH,iSrc])
+			metdata['U10'] = float(M10[iH,iSrc])
+			metdata['WDIR'] = WDIR[iH,:,iSrc].tolist()
+			metdata['WSPD'] = WSPD[iH,:,iSrc].tolist()
+			logging.debug(f'Near-vent windspeed is: {M10[iH,iSrc]} m/s') 
+			src_data[hr] = metdata
+		columns.append(src_data)
+
+	return columns
 
 def parse_timestamp(json_data,hr):
 	'''
@@ -206,7 +301,9 @@ def get_intensity_mass(source, metdata, emissions, hr):
 		mean_rho = 0.88 * rho_h2o + 0.02 * rho_co2 + frac_so2 * rho_so2
 
 	#get kinemtaic mass flux
-	so2_kg_per_sec = emissions['so2'] * 1000 / ( 24 * 60 * 60 )
+	#run json files without an hourly series hold the scalar rate for the whole run
+	so2 = emissions['so2_hourly'][hr] if 'so2_hourly' in emissions else emissions['so2']
+	so2_kg_per_sec = so2 * 1000 / ( 24 * 60 * 60 )
 	tot_mass = (mean_rho/rho_so2) * so2_kg_per_sec / frac_so2
 	mass_flux = tot_mass / (mean_rho * source['area'][hr])
 	mass_flux_cw = mass_flux * 2* ((source['area'][hr]/3.14)**0.5)
@@ -232,9 +329,8 @@ def main():
 	json_data = read_run_json()
 	cwippjson = {}
 
-	#read linked wrfout file and build kd-tree
+	#read linked wrfout file
 	ds = nc.Dataset('wrfout.nc')
-	met_tree = build_met_tree(ds)
 	
 	#loop through sources
 	num_src = len(json_data['user_defined']['source'])
@@ -243,8 +339,8 @@ def main():
 	#create slot for data in run_json
 	vent_data = {}
 
-	#for iSrc in range(num_src):
-		#tag = 'src'+str(iSrc+1)
+	#locate all sources on the met grid
+	src_locs = []
 	for iSrc, tag in enumerate(tags):
 		source = json_data['user_defined']['source'][tag]
 		
@@ -252,16 +348,23 @@ def main():
 			logging.critical('ERROR: if using CWIPP plume-rise in must be applied to all source locations. Aborting!')	
 			sys.exit(1)
 
-		emissions = json_data['emissions'][tag]
-
 		#get source location
 		lat, lon = float(source['lat']),float(source['lon'])
-		src_loc = np.array([lat,lon]).reshape(1, -1)
+		src_locs.append([lat,lon])
 		logging.info(f'Getting source conditions for {tag}: {lat},{lon}')
 
+	#get loc indices nearest to all sources
+	met_idxs = locate_sources(ds, np.array(src_locs))
 
-		#get loc index nearest to fire
-		met_idx = get_met_loc_idx(met_tree, src_loc)
+	#get met inputs for cwipp for all sources and hours at once
+	hrs = list(range(int(os.environ['spinup']),int(os.environ['runhrs'])))
+	met_columns = get_met_columns(ds, hrs, met_idxs)
+
+	#for iSrc in range(num_src):
+		#tag = 'src'+str(iSrc+1)
+	for iSrc, tag in enumerate(tags):
+		source = json_data['user_defined']['source'][tag]
+		emissions = json_data['emissions'][tag]
 
 		cwippjson[tag] = {}
 
@@ -280,10 +383,10 @@ def main():
 			logging.critical('ERROR: unrecognized vent parameter input. Available options: "prescribed"/"flir"')
 
 		#loop through hours of simulation
-		for hr in range(int(os.environ['spinup']),int(os.environ['runhrs'])):
+		for hr in hrs:
 			
 			#get met inputs for cwipp 
-			metdata = get_met_data(ds,hr,met_idx)
+			metdata = met_columns[iSrc][hr]
 
 			#parse timestamp
 			timestamp = parse_timestamp(json_data, hr)
@@ -8,9 +8,14 @@ __date__="July 2021"
 from set_vog_env import *
 from pproc.graphics import *
 import pproc.to_webserver as web
+import hys_ensemble
+from pproc import ens_stats, stn_sampler
 import logging
 import json
 import os
+import sys
+import datetime as dt
+import netCDF4 as nc
 
 ### Functions ###
 
@@ -28,130 +33,78 @@ def link_exec(hysexec):
 	
 	return
 
-def ensmean(pproc_settings):
+def get_product():
 	'''
-	Run ensemble averaging
+	Get path of the ensemble netcdf product for the current cycle
 	'''
-	#move into dispersion working directory, clean up
-	os.chdir(os.environ['hys_rundir'])
-	#os.system('find -type l -delete')
-
-	#TODO check that that dispersion completed
-	#TODO fix for consistency with POE plots
-
-	#link executables
-	link_exec('conprob')
-	
-	conv = pproc_settings['conversion']
+	return os.path.join(os.environ['hys_rundir'], ens_stats.product_file.format(os.environ['forecast']))
 
-	for iP, pollutant in enumerate(conv.keys()):
-		logging.info(f'...creating ensemble average: {pollutant}')
-		#flat for pollutant number
-		pflag = '-p{}'.format(str(iP + 1))
-		#flag for concentration conversion
-		xflag = '-x{}'.format(conv[pollutant][0])
-		#run calculation for first non-deposition layer (-z2)
-		#os.system(f'./conprob -bcdump {pflag} -z2 {xflag}')
-		os.system(f'./conprob -bcdump {pflag} {xflag}') 
-		to_netcdf('cmean', f'cmean_{pollutant}.nc')		
-
-		#save ncmean for pollutants with requested stn traces
-		logging.debug(f'...saving as cmean_{pollutant} for future use')
-		os.system(f'mv cmean cmean_{pollutant}')
-	return
 
-def get_poe(pproc_settings):
+def ensemble_stats(pproc_settings, members):
 	'''
-	Get probabilities of exceedance for all user-defined pollutants and thresholds
+	Compute ensemble mean, exceedance probabilities and percentiles for all pollutants in one pass over member files
 	'''
-	logging.info('Calculating exceedance probabilities')
-	
-	#move into dispersion working directory, clean up
-	os.chdir(os.environ['hys_rundir'])
-	#os.system('find -type l -delete')
-	
+	logging.info('Calculating ensemble statistics')
 
-	#link executables
-	link_exec('conprob')
+	#move into dispersion working directory
+	os.chdir(os.environ['hys_rundir'])
 
-	#get conversion factors and thresholds
+	#get conversion factors, thresholds and percentiles
 	conv = pproc_settings['conversion']
-	poe_settings = pproc_settings['poe']
-
-	#TODO what if only one pollutant is requested and it's not the first? indexing is wrong
-	#loop through requested pollutants
-	for iP, pollutant in enumerate(poe_settings.keys()):
-		#flag for pollutant number
-		pflag = '-p{}'.format(str(iP + 1)) 
-		#flag for concentration conversion
-		xflag = '-x{}'.format(conv[pollutant][0])
-		lvls = np.sort(poe_settings[pollutant])[::-1]
-		#flag for concentration levels
-		cflag = '-c{}:{}:{}'.format(lvls[0],lvls[1],lvls[2])
-		##run calculation for first non-deposition layer (-z2)
-		#poe_cmd = './conprob -bcdump {} {} -z2 {}'.format(pflag,xflag,cflag)
-		poe_cmd = './conprob -bcdump {} {} {}'.format(pflag,xflag,cflag)
-		logging.debug('...running POE analysis for {}: {}'.format(pollutant, poe_cmd))
-		os.system(poe_cmd)
-
-		#convert output to netcdf
-		to_netcdf('cmean', 'cmean_{}.nc'.format(pollutant))
-		to_netcdf('cmax01', 'poe_lvl1_{}.nc'.format(pollutant))
-		to_netcdf('cmax10', 'poe_lvl2_{}.nc'.format(pollutant))
-		to_netcdf('cmax00', 'poe_lvl3_{}.nc'.format(pollutant))
-		
-		##convert individual percentiles to netcdf
-		#for j in ['05','10','25','50','75','90','95']:
-		#	to_netcdf(f'prob{j}',f'prob_{pollutant}_{j}.nc')
-
-		## convert individual member output to netcdf
-		#for j in range(1, 28):
-		#	to_netcdf(f'cdump.{j:03}', f'cdump_{pollutant}_{j:03}.nc')
-
-		#save ncmean for pollutants with requested stn traces
-		logging.debug('...saving as cmean_{} for future use'.format(pollutant))
-		os.system('mv cmean cmean_{}'.format(pollutant))
+	pollutants = list(conv.keys())
+	thresholds = pproc_settings.get('poe', {})
+	percentiles = pproc_settings.get('percentiles', [])
+
+	#open member outputs (read once for all pollutants)
+	cdumps = ens_stats.open_members(members)
+	if not cdumps:
+		logging.critical('ERROR: no ensemble member output found. Aborting!')
+		sys.exit(1)
+	logging.info(f'...using {len(cdumps)} ensemble members')
+	stats = ens_stats.compute_stats(cdumps, pollutants, {pol: conv[pol][0] for pol in pollutants}, thresholds, percentiles)
+
+	#save all statistics to a single product for the cycle
+	ref = cdumps[0]
+	units = {pol: conv[pol][1] for pol in pollutants}
+	attrs = {'forecast_reference_time': dt.datetime.strptime(os.environ['forecast'], '%Y%m%d%H').strftime('%Y-%m-%dT%H:%M:%SZ'), 'ensemble_members': len(cdumps)}
+	ens_stats.write_product(get_product(), ref, stats, units, thresholds, percentiles, attrs)
+
+	for cd in cdumps:
+		cd.close()
 
 	return
 
 
-
-def stn_traces(tag, stn_file):
+def stn_traces(ds, stn_settings):
 	'''
-	Script extracts ensmean concentrations from user-defined stations
+	Extract ensemble statistics at user-defined stations from the cycle product
+	-stn_settings: station tag and file by pollutant; pollutants sharing a tag and station file are sampled together
 	'''
 	logging.info('Creating station traces')
-	
-	#link executables
-	link_exec('con2stn')
-
-	#TODO change station naming
-	#extract station data
-	out_file = 'hysplit.haw.{}.so2.{}.txt'.format(tag,os.environ['forecast'])
-	#con2stn_cmd = './con2stn -d2 -icmean_SO2 -o{} -s{} -xi'.format(out_file,stn_file)
-	con2stn_cmd = './con2stn -d2 -icmean_SO2 -o{} -s{} -xi -z2'.format(out_file,stn_file)
-	os.system(con2stn_cmd)
-
-
-	return
 
+	#group pollutants by station list, so interpolation weights are computed once per list
+	groups = {}
+	for pollutant, settings in stn_settings.items():
+		groups.setdefault((settings['tag'], settings['stn_file']), []).append(pollutant)
 
-def to_netcdf(hysfile, ncfile):
-	'''
-	Converts hysplit binary to NetCDF
-	'''
-
-	logging.info('...saving netcdf: {}'.format(ncfile))	
+	times = stn_sampler.get_times(ds)
+	lvl = stn_sampler.get_trace_level(ds)
+	for (tag, stn_file), pollutants in groups.items():
+		ids, lats, lons = stn_sampler.read_stations(stn_file)
+		traces = stn_sampler.sample_product(ds, pollutants, lats, lons)
 
-	#link netcdf converter
-	link_exec('con2cdf4')
+		#ensemble mean of first non-deposition layer in con2stn layout (as used by web display)
+		for pollutant in pollutants:
+			out_file = stn_sampler.haw_file.format(tag, pollutant.lower(), os.environ['forecast'])
+			stn_sampler.write_haw(out_file, times, ids, traces[f'{pollutant}_mean'][:,lvl,:], pollutant, int(ds.variables['level'][lvl]))
 
-	#convert ensemble mean to netcdf
-	con2cdf4_cmd = './con2cdf4 {} {}'.format(hysfile, ncfile)
-	os.system(con2cdf4_cmd)
+		#all statistics and levels in columnar format
+		out_file = stn_sampler.table_file.format(tag, os.environ['forecast'])
+		stn_sampler.write_table(out_file, ds, traces, times, ids, lats, lons)
 
 	return
 
+
 def clean_hysdir():
 	#clean up dispersion folder
 
@@ -177,37 +130,33 @@ def main():
 	pproc_settings = json_data['user_defined']['post_process']
 	unit_conv = pproc_settings['conversion']
 	vert_lvls = json_data['user_defined']['dispersion']['lvls']
+	members = hys_ensemble.get_members(json_data['user_defined']['dispersion'])
 	
-	#create POE for user-defined thresholds, if requested 
-	if 'poe' in pproc_settings.keys():
-		get_poe(pproc_settings)
-	else:
-		#if no PEO plots requested just do ensemble averaging
-		ensmean(pproc_settings)
+	#create ensemble mean and POE for user-defined thresholds, if requested 
+	ensemble_stats(pproc_settings, members)
 
 
 	#create station traces for user-defined stations, if requested
 	if 'stns' in pproc_settings.keys():
-		stn_settings = pproc_settings['stns']
-		for pollutant in stn_settings:
-			stn_traces(stn_settings[pollutant]['tag'],stn_settings[pollutant]['stn_file'])
+		with nc.Dataset(get_product()) as ds:
+			stn_traces(ds, pproc_settings['stns'])
 	else:
 		logging.info('No station traces requested in config file')
 
 	#os.chdir(os.environ['hys_rundir'])
 
-	#create graphics
+	#create graphics (all plots read from the cycle product)
 	if 'plots' in pproc_settings.keys():
 		plot_settings = pproc_settings['plots']
-		for pollutant in plot_settings['concentration']:
-			con_file = './cmean_{}.nc'.format(pollutant)
-			make_con_plots(con_file, pollutant, 'png', unit_conv[pollutant], plot_settings)
-		if 'poe' in plot_settings.keys():
-			for pollutant in plot_settings['poe']:
-				make_poe_plots('./poe_', pollutant, 'png', plot_settings)
-		if 'ci' in plot_settings.keys():
-			for pollutant in plot_settings['ci']:
-				make_ci_contours(f'cmean_{pollutant}.nc', pollutant, vert_lvls, 'png',unit_conv[pollutant],plot_settings['leaflet'])
+		with nc.Dataset(get_product()) as ds:
+			for pollutant in plot_settings['concentration']:
+				make_con_plots(ds, pollutant, 'png', unit_conv[pollutant], plot_settings)
+			if 'poe' in plot_settings.keys():
+				for pollutant in plot_settings['poe']:
+					make_poe_plots(ds, pollutant, 'png', plot_settings)
+			if 'ci' in plot_settings.keys():
+				for pollutant in plot_settings['ci']:
+					make_ci_contours(ds, pollutant, vert_lvls, 'png',unit_conv[pollutant],plot_settings['leaflet'])
 	else:
 		logging.info('No plots requested in config file')	
 	
@@ -0,0 +1,172 @@
+#!/usr/bin/python3.7
+
+# In-process ensemble statistics (mean, percentiles, exceedance probabilities) from member cdump files
+
+import logging
+import datetime as dt
+import numpy as np
+import netCDF4 as nc
+from set_vog_env import atomic_write
+from pproc import hys_reader
+
+### Inputs ###
+product_file = 'vogcast_{}.nc' 	#per-cycle ensemble product (formatted with forecast date, YYYYMMDDHH)
+compress_level = 4 		#zlib compression level for product variables
+
+
+### Functions ###
+
+def get_mismatch(cd, ref):
+	'''
+	Describe how a member file differs from the reference member (empty if compatible)
+	Pollutants may be stored in a different order, they are located by name in each member
+	'''
+	checks = {'output times': cd.times == ref.times,
+		'levels': cd.levels == ref.levels,
+		'grid': cd.shape == ref.shape and np.allclose(cd.grid, ref.grid),
+		'pollutants': sorted(cd.pollutants) == sorted(ref.pollutants)}
+
+	return [name for name, match in checks.items() if not match]
+
+
+def open_members(members, base='cdump'):
+	'''
+	Open member concentration files (members without output or inconsistent with the first readable member are skipped)
+	'''
+	cdumps = []
+	for member in members:
+		try:
+			cd = hys_reader.Cdump(f'{base}.{member:03d}')
+		except (OSError, ValueError) as err:
+			logging.warning(f'WARNING: unable to read {base}.{member:03d}, excluded from ensemble: {err}')
+			continue
+
+		mismatch = get_mismatch(cd, cdumps[0]) if cdumps else []
+		if mismatch:
+			logging.warning(f'WARNING: {base}.{member:03d} does not match {cdumps[0].path} ({", ".join(mismatch)}), excluded from ensemble')
+			cd.close()
+			continue
+		cdumps.append(cd)
+
+	return cdumps
+
+
+def compute_stats(cdumps, pollutants, conv, thresholds={}, percentiles=[]):
+	'''
+	Compute ensemble statistics for all pollutants, levels and times, reading each member grid once
+	-conv: conversion factors by pollutant (applied to concentrations before statistics)
+	-thresholds: exceedance thresholds by pollutant (converted units, any number per pollutant)
+	-percentiles: ensemble percentiles (0-100) to compute for all pollutants
+	Returns dictionary by pollutant of 'mean' (nt,nlev,nlat,nlon), 'poe' (nthresh,...) in % and 'pct' (npct,...)
+	'''
+	ref = cdumps[0]
+	nt, nlev = len(ref.times), len(ref.levels)
+	dims = (nt, nlev) + ref.shape
+
+	#locate pollutants in each member file (by name, falling back to position as for conprob -p flag)
+	pidx = [[cd.pollutants.index(pol) if pol in cd.pollutants else p for p, pol in enumerate(pollutants)] for cd in cdumps]
+	factors = np.array([conv[pol] for pol in pollutants], dtype=np.float32)[:, None, None, None]
+
+	stats = {pol: {'mean': np.zeros(dims, dtype=np.float32),
+			'poe': np.zeros((len(thresholds.get(pol, [])),) + dims, dtype=np.float32),
+			'pct': np.zeros((len(percentiles),) + dims, dtype=np.float32)} for pol in pollutants}
+
+	#thresholds shaped for comparison against all members and levels at once: (nthresh, nmem, nlev, nlat, nlon)
+	limits = {pol: np.asarray(thresholds[pol], dtype=np.float32)[:, None, None, None, None] for pol in pollutants if pol in thresholds}
+
+	#stream one time at a time: (members, pollutants, levels, lat, lon)
+	for t in range(nt):
+		frame = np.stack([np.stack([[cd.get(t, p, lvl) for lvl in range(nlev)] for p in cd_pidx]) for cd, cd_pidx in zip(cdumps, pidx)])
+		frame *= factors
+		mean = frame.mean(axis=0)
+		if percentiles:
+			pct = np.percentile(frame, percentiles, axis=0)
+		for p, pol in enumerate(pollutants):
+			stats[pol]['mean'][t] = mean[p]
+			if pol in limits:
+				stats[pol]['poe'][:, t] = 100. * (frame[None, :, p] > limits[pol]).mean(axis=1)
+			if percentiles:
+				stats[pol]['pct'][:, t] = pct[:, p]
+
+	return stats
+
+
+def serial_time(date):
+	'''
+	Convert datetime to days since 1970 (time convention of con2cdf4 output, expected by graphics.get_tdim)
+	'''
+	return (date - dt.datetime(1970, 1, 1)).total_seconds() / 86400.
+
+
+def write_product(nc_path, ref, stats, units, thresholds={}, percentiles=[], attrs={}):
+	'''
+	Save ensemble statistics for all pollutants to a single chunked, compressed CF netcdf4 file
+	-stats: output of compute_stats; variables are named <pollutant>_mean, <pollutant>_poe and <pollutant>_pct
+	-units: obs units by pollutant (POE thresholds are in the same units)
+	-attrs: additional global attributes
+	Chunks hold one time of one threshold/percentile, matching how plots and hazard maps read the data
+	'''
+	nt, nlev, (nlat, nlon) = len(ref.times), len(ref.levels), ref.shape
+	with atomic_write(nc_path) as tmp_path, nc.Dataset(tmp_path, 'w', format='NETCDF4') as ncf:
+		ncf.Conventions = 'CF-1.8'
+		ncf.title = 'VogCast HYSPLIT ensemble forecast'
+		ncf.source = f'HYSPLIT {ref.model} ensemble'
+		ncf.history = f'{dt.datetime.utcnow():%Y-%m-%d %H:%M} UTC: created by VogCast post-processing'
+		ncf.setncatts(attrs)
+
+		#coordinates
+		ncf.createDimension('time', nt)
+		ncf.createDimension('nv', 2)
+		ncf.createDimension('level', nlev)
+		ncf.createDimension('latitude', nlat)
+		ncf.createDimension('longitude', nlon)
+
+		time = ncf.createVariable('time', 'f8', ('time',))
+		time.setncatts({'standard_name': 'time', 'units': 'days since 1970-01-01 00:00:00', 'calendar': 'standard', 'axis': 'T', 'bounds': 'time_bnds'})
+		time[:] = [serial_time(t_start) for t_start, t_stop in ref.times]
+		time_bnds = ncf.createVariable('time_bnds', 'f8', ('time', 'nv'))
+		time_bnds[:] = [[serial_time(t_start), serial_time(t_stop)] for t_start, t_stop in ref.times]
+
+		level = ncf.createVariable('level', 'i4', ('level',))
+		level.setncatts({'standard_name': 'height', 'long_name': 'top of concentration layer (0: deposition)', 'units': 'm', 'positive': 'up', 'axis': 'Z'})
+		level[:] = ref.levels
+		lat = ncf.createVariable('latitude', 'f4', ('latitude',))
+		lat.setncatts({'standard_name': 'latitude', 'units': 'degrees_north', 'axis': 'Y'})
+		lat[:] = ref.lats
+		lon = ncf.createVariable('longitude', 'f4', ('longitude',))
+		lon.setncatts({'standard_name': 'longitude', 'units': 'degrees_east', 'axis': 'X'})
+		lon[:] = ref.lons
+
+		if percentiles:
+			ncf.createDimension('percentile', len(percentiles))
+			percentile = ncf.createVariable('percentile', 'f4', ('percentile',))
+			percentile.long_name = 'ensemble percentile'
+			percentile.units = '%'
+			percentile[:] = percentiles
+
+		#statistics by pollutant
+		grid = ('time', 'level', 'latitude', 'longitude')
+		opts = {'zlib': True, 'complevel': compress_level, 'shuffle': True}
+		for pollutant, pol_stats in stats.items():
+			mean = ncf.createVariable(f'{pollutant}_mean', 'f4', grid, chunksizes=(1, nlev, nlat, nlon), **opts)
+			mean.setncatts({'long_name': f'ensemble mean {pollutant} concentration', 'units': units[pollutant], 'cell_methods': 'time: mean realization: mean'})
+			mean[:] = pol_stats['mean']
+
+			if pollutant in thresholds:
+				thresh_dim = f'threshold_{pollutant}'
+				ncf.createDimension(thresh_dim, len(thresholds[pollutant]))
+				thresh = ncf.createVariable(thresh_dim, 'f4', (thresh_dim,))
+				thresh.long_name = f'{pollutant} exceedance threshold'
+				thresh.units = units[pollutant]
+				thresh[:] = thresholds[pollutant]
+				poe = ncf.createVariable(f'{pollutant}_poe', 'f4', (thresh_dim,) + grid, chunksizes=(1, 1, nlev, nlat, nlon), **opts)
+				poe.setncatts({'long_name': f'probability of {pollutant} concentration exceeding threshold', 'units': '%'})
+				poe[:] = pol_stats['poe']
+
+			if percentiles:
+				pct = ncf.createVariable(f'{pollutant}_pct', 'f4', ('percentile',) + grid, chunksizes=(1, 1, nlev, nlat, nlon), **opts)
+				pct.setncatts({'long_name': f'ensemble percentiles of {pollutant} concentration', 'units': units[pollutant], 'cell_methods': 'realization: percentile'})
+				pct[:] = pol_stats['pct']
+	logging.info('...saving netcdf: {}'.format(nc_path))
+
+	return
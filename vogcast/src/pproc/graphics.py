@@ -98,20 +98,18 @@ def make_aqi_cmap(pollutant):
 
 	return aqi, norm
 
-def make_ci_contours(nc_path, pollutant, cz, fmt, unit, leaflet):
+def make_ci_contours(ds, pollutant, cz, fmt, unit, leaflet):
 	'''
 	Create crude (qualitative) contours of column-integrated smoke, for user-defined layers cz
+	-ds: open ensemble product dataset
 	'''
 	logging.info('...creating column-integrated contours for: {}'.format(pollutant))
 
-	#open netcdf file
-	ds = nc.Dataset(nc_path)
-
 	#get readable time dimension
 	tdim = get_tdim(ds)
 
 	#get the needed variable
-	converted_fields = ds.variables[pollutant][:,:,:,:]
+	converted_fields = ds.variables[f'{pollutant}_mean'][:,:,:,:]
 
 	#integrate over all layers to get total column mass
 	#NOTE units are not appropriate for quantitative comparison
@@ -169,18 +167,16 @@ def get_tdim(ds):
 	return tdim
 
 
-def make_con_plots(nc_path, pollutant, fmt, unit, plot_settings):
+def make_con_plots(ds, pollutant, fmt, unit, plot_settings):
 	'''
 	Create surface concentration plots for all available timesteps
+	-ds: open ensemble product dataset
 	'''
 	logging.info('...creating surface concentration plots for: {}'.format(pollutant))
 
 	leaflet = plot_settings['leaflet']
 	smooth = plot_settings['smooth']
 
-	#open netcdf file
-	ds = nc.Dataset(nc_path)
-
 	#get readable time dimension
 	tdim = get_tdim(ds)
 
@@ -194,7 +190,7 @@ def make_con_plots(nc_path, pollutant, fmt, unit, plot_settings):
 
 	#get fields
 	logging.debug('...REMINDER: first vertical layer is assumed to be deposition only, extracting second layer')
-	converted_fields = ds.variables[pollutant][:,1,:,:]
+	converted_fields = ds.variables[f'{pollutant}_mean'][:,1,:,:]
 	
 	#loop through all frames, smoothing and saving
 	for t,time in enumerate(tdim):
@@ -234,9 +230,10 @@ def make_con_plots(nc_path, pollutant, fmt, unit, plot_settings):
 	return
 
 
-def make_poe_plots(nc_prefix, pollutant, fmt, plot_settings):
+def make_poe_plots(ds, pollutant, fmt, plot_settings):
 	'''
-	Create surface POE plots
+	Create surface POE plots for all exceedance thresholds of a pollutant
+	-ds: open ensemble product dataset
 	'''
 	
 	logging.info('...creating surface POE plots for: {}'.format(pollutant))
@@ -244,32 +241,23 @@ def make_poe_plots(nc_prefix, pollutant, fmt, plot_settings):
 	leaflet = plot_settings['leaflet']
 	smooth = plot_settings['smooth']	
 
-	#manually create tags to match HYSPLIT's very particular namting
-	hys_keys = ['CM01', 'CM10', 'CM00']
-
 	#get colormap
 	poe = make_poe_cmap()
 
+	#get time dimension and thresholds
+	tdim = get_tdim(ds)
+	thresholds = ds.variables[f'threshold_{pollutant}']
+
+	#get bounds
+	lons, lats = ds.variables['longitude'][:], ds.variables['latitude'][:]
+	bounds = [np.min(lons), np.max(lons),np.min(lats), np.max(lats)]
+
 	#loop through thresholds
-	for i in range(3):
+	for i, thresh in enumerate(thresholds[:]):
 		tag = 'lvl{}'.format(str(i+1))
-		poe_file = nc_prefix + tag + '_' + pollutant + '.nc'
-		
-
-		#open netcdf file
-		ds = nc.Dataset(poe_file)
-		tdim = get_tdim(ds)
 
-		#get bounds
-		lons, lats = ds.variables['longitude'][:], ds.variables['latitude'][:]
-		bounds = [np.min(lons), np.max(lons),np.min(lats), np.max(lats)]
-		
-		#deal with Hysplit's weird naming: -p1 has keys CM00 etc, -pX uses pollutnat as key
 		logging.debug('...REMINDER: first vertical layer is assumed to be deposition only, extracting second layer')
-		try:
-			poe_field = ds.variables[hys_keys[i]][:,1,:,:]
-		except:
-			poe_field = ds.variables[pollutant][:,1,:,:]
+		poe_field = ds.variables[f'{pollutant}_poe'][i,:,1,:,:]
 
 		#loop through all frams with smoothing
 		for t,time in enumerate(tdim):
@@ -300,7 +288,7 @@ def make_poe_plots(nc_prefix, pollutant, fmt, plot_settings):
 				gl.top_labels = False
 				gl.right_labels = False
 				ax.coastlines(zorder=4)
-				plt.title(f'POE {pollutant} {tag} | {time}', fontsize=10)
+				plt.title(f'POE {pollutant} > {thresh:g} {thresholds.units} | {time}', fontsize=10)
 				plt.colorbar(im, label = f'probability of exceedance (%)', fraction=0.05, pad = 0.07, orientation = 'horizontal')
 				plt.tight_layout()
 				plt.savefig('./{}_{}_{}.{}'.format(pollutant,tag,time,fmt),  dpi=200)
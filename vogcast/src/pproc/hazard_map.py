@@ -17,6 +17,7 @@ import pandas as pd
 import os
 import sys
 from pproc.graphics import get_tdim
+from pproc import ens_stats
 import cartopy.crs as ccrs
 import cartopy.io.img_tiles as cimgt
 import cartopy.feature as cfeature
@@ -69,7 +70,7 @@ def assemble_hourly_data(settings, pollutant, units):
 				surface_field = get_surface_poe(ds, pollutant, settings['poe_lvl'], t)	
 			elif settings['plot'] == 'concentration':
 				z = int(settings['zflag'])
-				surface_field = ds.variables[pollutant][t,z,:,:]
+				surface_field = ds.variables[f'{pollutant}_mean'][t,z,:,:]
 			
 			#save data to various storage arrays
 			fcst_mean.append(surface_field)
@@ -80,6 +81,7 @@ def assemble_hourly_data(settings, pollutant, units):
 		hyslon = ds.variables['longitude'][:]	
 		hysdims = {'lats': hyslat, 'lons': hyslon}	
 		bounds = [np.min(hyslon), np.max(hyslon),np.min(hyslat), np.max(hyslat)]
+		ds.close()
 
 		#average forecast data
 		fc_mean = np.median(np.array(fcst_mean), 0)
@@ -135,7 +137,7 @@ def generate_nc_output(save_data, hysdims, settings, pollutant, units):
 
 def get_nc_data(fcst_tag, settings, pollutant):
 	'''
-	Locates correct forecast subfolderes, ncfiles and pulls data for given pollutant, lvl, time
+	Locates correct forecast subfolder and opens its ensemble product (all pollutants, thresholds and levels)
 	'''
 	
 	#check if directory exists
@@ -144,31 +146,21 @@ def get_nc_data(fcst_tag, settings, pollutant):
 	#	logging.warning(f'WARNING: {fcst_path} forecast is missing. Skipping!!!.')
 	
 	#get dataset
-	if settings['plot'] == 'poe':
-		fcst_file = 'poe_lvl{}_{}.nc'.format(settings['poe_lvl'],pollutant)
-	elif settings['plot'] == 'concentration':
-		fcst_file = f'cmean_{pollutant}.nc'
-	else:
+	if settings['plot'] not in ['poe', 'concentration']:
 		logging.critical('ERROR: unrecognized plot type requested. Available options: "concentration"/"poe". Aborting!')
 		sys.exit()
 
-	nc_path = os.path.join(fcst_path,fcst_file)
+	nc_path = os.path.join(fcst_path,ens_stats.product_file.format(fcst_tag))
 	ds = nc.Dataset(nc_path)
 
 	return ds
 
 def get_surface_poe(ds, pollutant,lvl,time):
 	'''
-	Get data for correct pollutant and time dealing with hysplit naming
+	Get data for correct pollutant, exceedance threshold (1-based, config order) and time
 	'''
 
-	#deal with Hysplit's weird naming: -p1 has keys CM00 etc, -pX uses pollutnat as key
-	hys_keys = ['CM01', 'CM10', 'CM00']
-	try:
-		surface_poe = ds.variables[hys_keys[int(lvl-1)]][time,0,:,:]
-	except:
-		surface_poe = ds.variables[pollutant][time,0,:,:]
-
+	surface_poe = ds.variables[f'{pollutant}_poe'][int(lvl)-1,time,0,:,:]
 
 	return surface_poe
 
@@ -0,0 +1,207 @@
+#!/usr/bin/python3.7
+
+# Native readers for HYSPLIT binary output: cdump concentration files and PARDUMP particle dumps
+
+import mmap
+import struct
+import datetime as dt
+import numpy as np
+
+#HYSPLIT writes big-endian fortran unformatted sequential records: [int32 length][payload][int32 length]
+
+### Functions ###
+
+def read_record(buf, offset):
+	'''
+	Get payload location of the fortran record at offset: returns payload offset, payload length, next record offset
+	'''
+	length, = struct.unpack_from('>i', buf, offset)
+	end, = struct.unpack_from('>i', buf, offset + 4 + length)
+	if end != length:
+		raise ValueError(f'corrupt fortran record at byte {offset}: markers {length} != {end}')
+
+	return offset + 4, length, offset + 8 + length
+
+
+def to_datetime(yr, mo, da, hr, mn=0):
+	'''
+	Convert HYSPLIT date (2-digit year) to datetime
+	'''
+	if yr < 100:
+		yr = yr + (2000 if yr < 40 else 1900)
+
+	return dt.datetime(yr, mo, da, hr, mn)
+
+
+def open_mmap(path):
+	'''
+	Memory map a file read-only
+	'''
+	with open(path, 'rb') as f:
+		return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Cdump:
+	'''
+	Lazy cdump reader: headers and record offsets are indexed on open, concentration grids are read on request
+	'''
+	packed_dtype = np.dtype([('i', '>i2'), ('j', '>i2'), ('conc', '>f4')])
+
+	def __init__(self, path):
+		self.path = path
+		self.buf = open_mmap(path)
+		self.index_file()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		self.buf.close()
+
+	def index_file(self):
+		'''
+		Parse file headers and locate concentration records for each time, pollutant and level
+		'''
+		buf = self.buf
+
+		#model, start time, number of release locations, packing flag
+		pos, length, nxt = read_record(buf, 0)
+		self.model = bytes(buf[pos:pos+4]).decode().strip()
+		header = struct.unpack_from(f'>{(length - 4) // 4}i', buf, pos + 4)
+		self.start = to_datetime(*header[:4])
+		nloc = header[5]
+		self.packed = len(header) > 6 and header[6] == 1
+
+		#release locations: time, lat, lon, height
+		self.locations = []
+		for n in range(nloc):
+			pos, length, nxt = read_record(buf, nxt)
+			yr, mo, da, hr, lat, lon, hgt = struct.unpack_from('>4i3f', buf, pos)
+			self.locations.append({'time': to_datetime(yr, mo, da, hr), 'lat': lat, 'lon': lon, 'height': hgt})
+
+		#grid definition
+		pos, length, nxt = read_record(buf, nxt)
+		nlat, nlon, dlat, dlon, lat0, lon0 = struct.unpack_from('>2i4f', buf, pos)
+		self.shape = (nlat, nlon)
+		self.grid = (dlat, dlon, lat0, lon0)
+		self.lats = lat0 + dlat * np.arange(nlat)
+		self.lons = lon0 + dlon * np.arange(nlon)
+
+		#vertical levels
+		pos, length, nxt = read_record(buf, nxt)
+		nlev, = struct.unpack_from('>i', buf, pos)
+		self.levels = list(struct.unpack_from(f'>{nlev}i', buf, pos + 4))
+
+		#pollutants
+		pos, length, nxt = read_record(buf, nxt)
+		npol, = struct.unpack_from('>i', buf, pos)
+		self.pollutants = [bytes(buf[pos+4+4*p:pos+8+4*p]).decode().strip() for p in range(npol)]
+
+		#sampling periods: start/stop records followed by one record per pollutant and level
+		self.times, self.records = [], {}
+		while nxt < len(buf):
+			pos, length, nxt = read_record(buf, nxt)
+			t_start = to_datetime(*struct.unpack_from('>5i', buf, pos))
+			pos, length, nxt = read_record(buf, nxt)
+			t_stop = to_datetime(*struct.unpack_from('>5i', buf, pos))
+			t = len(self.times)
+			self.times.append((t_start, t_stop))
+			for n in range(npol * nlev):
+				pos, length, nxt = read_record(buf, nxt)
+				pol = bytes(buf[pos:pos+4]).decode().strip()
+				lvl, = struct.unpack_from('>i', buf, pos + 4)
+				self.records[(t, self.pollutants.index(pol), self.levels.index(lvl))] = (pos + 8, length - 8)
+
+		return
+
+	def get(self, t, pollutant=0, level=0):
+		'''
+		Get concentration grid (nlat, nlon) for time index, pollutant (index or name) and level index
+		'''
+		if isinstance(pollutant, str):
+			pollutant = self.pollutants.index(pollutant)
+		offset, length = self.records[(t, pollutant, level)]
+
+		if self.packed:
+			#packed records: number of nonzero points, then (i, j, concentration) for each (1-based indices)
+			npts, = struct.unpack_from('>i', self.buf, offset)
+			points = np.frombuffer(self.buf, dtype=self.packed_dtype, count=npts, offset=offset + 4)
+			conc = np.zeros(self.shape, dtype=np.float32)
+			conc[points['j'].astype(int) - 1, points['i'].astype(int) - 1] = points['conc']
+			return conc
+
+		return np.frombuffer(self.buf, dtype='>f4', count=self.shape[0] * self.shape[1], offset=offset).reshape(self.shape).astype(np.float32)
+
+	def get_all(self, pollutant=0):
+		'''
+		Get all times and levels for a pollutant as array (ntimes, nlevels, nlat, nlon)
+		'''
+		data = np.zeros((len(self.times), len(self.levels)) + self.shape, dtype=np.float32)
+		for t in range(len(self.times)):
+			for lvl in range(len(self.levels)):
+				data[t, lvl] = self.get(t, pollutant, lvl)
+
+		return data
+
+
+class Pardump:
+	'''
+	Lazy PARDUMP reader: time headers are indexed on open, particle arrays are memory-mapped views per time
+	'''
+	def __init__(self, path):
+		self.path = path
+		self.buf = open_mmap(path)
+		self.index_file()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		#mapping stays open while particle views are still in use (released once they are garbage collected)
+		try:
+			self.buf.close()
+		except BufferError:
+			pass
+
+	@staticmethod
+	def particle_dtype(npol):
+		'''
+		Layout of the three fortran records written for each particle (including record markers)
+		'''
+		return np.dtype([('m0', '>i4'), ('mass', '>f4', (npol,)), ('m1', '>i4'),
+				('m2', '>i4'), ('lat', '>f4'), ('lon', '>f4'), ('height', '>f4'),
+				('sigh', '>f4'), ('sigw', '>f4'), ('sigv', '>f4'), ('m3', '>i4'),
+				('m4', '>i4'), ('age', '>i4'), ('hdwp', '>i4'), ('ptyp', '>i4'), ('pgrd', '>i4'), ('nsort', '>i4'), ('m5', '>i4')])
+
+	def index_file(self):
+		'''
+		Locate particle block for each dump time
+		'''
+		self.times, self.blocks = [], []
+		nxt = 0
+		while nxt < len(self.buf):
+			pos, length, nxt = read_record(self.buf, nxt)
+			numpar, npol, yr, mo, da, hr, mn = struct.unpack_from('>7i', self.buf, pos)
+			dtype = self.particle_dtype(npol)
+			self.times.append(to_datetime(yr, mo, da, hr, mn))
+			self.blocks.append((nxt, numpar, dtype))
+			nxt = nxt + numpar * dtype.itemsize
+
+		return
+
+	def get(self, t=0):
+		'''
+		Get particle data for time index as structured array view (mass, lat, lon, height, sigh, sigw, sigv, age...)
+		'''
+		offset, numpar, dtype = self.blocks[t]
+		particles = np.frombuffer(self.buf, dtype=dtype, count=numpar, offset=offset)
+		if numpar and not (particles['m0'][0] == dtype['mass'].itemsize and particles['m2'][0] == 24 and particles['m4'][0] == 20):
+			raise ValueError(f'unexpected PARDUMP particle record layout at byte {offset}')
+
+		return particles
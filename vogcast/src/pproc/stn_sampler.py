@@ -0,0 +1,156 @@
+#!/usr/bin/python3.7
+
+# In-process station sampler: bilinear extraction of station time series from the ensemble product
+
+import logging
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+### Inputs ###
+haw_file = 'hysplit.haw.{}.{}.{}.txt' 	#station trace text file (tag, pollutant, forecast), con2stn column layout
+table_file = 'hysplit.haw.{}.{}.csv' 	#columnar station table with all pollutants, levels and statistics (tag, forecast)
+stats = ['mean', 'poe', 'pct'] 		#product statistics sampled at stations (<pollutant>_<stat> variables)
+
+
+### Functions ###
+
+def read_stations(stn_file):
+	'''
+	Read station list file: one "id lat lon" entry per line
+	'''
+	ids, lats, lons = [], [], []
+	with open(stn_file, 'r') as f:
+		for line in f:
+			fields = line.split()
+			if len(fields) < 3:
+				continue
+			ids.append(fields[0])
+			lats.append(float(fields[1]))
+			lons.append(float(fields[2]))
+
+	return ids, np.array(lats), np.array(lons)
+
+
+def get_weights(grid_lats, grid_lons, stn_lats, stn_lons):
+	'''
+	Precompute bilinear interpolation weights on a regular lat/lon grid
+	Returns flat indices of the four surrounding grid points and their weights (nstn, 4);
+	stations outside the grid get NaN weights
+	'''
+	grid_lats, grid_lons = np.asarray(grid_lats, dtype=float), np.asarray(grid_lons, dtype=float)
+	nlat, nlon = len(grid_lats), len(grid_lons)
+
+	#fractional grid indices (spacing from full extent, less sensitive to single precision coordinates)
+	fi = (stn_lats - grid_lats[0]) / ((grid_lats[-1] - grid_lats[0]) / (nlat - 1))
+	fj = (stn_lons - grid_lons[0]) / ((grid_lons[-1] - grid_lons[0]) / (nlon - 1))
+	tol = 1e-6
+	outside = (fi < -tol) | (fi > nlat - 1 + tol) | (fj < -tol) | (fj > nlon - 1 + tol)
+
+	#lower-left corner (last cell is used for stations on the upper/right edge)
+	i0 = np.clip(np.floor(fi).astype(int), 0, nlat - 2)
+	j0 = np.clip(np.floor(fj).astype(int), 0, nlon - 2)
+	dy, dx = fi - i0, fj - j0
+
+	idx = np.stack([i0 * nlon + j0, i0 * nlon + j0 + 1, (i0 + 1) * nlon + j0, (i0 + 1) * nlon + j0 + 1], axis=-1)
+	weights = np.stack([(1 - dy) * (1 - dx), (1 - dy) * dx, dy * (1 - dx), dy * dx], axis=-1)
+	idx[outside] = 0
+	weights[outside] = np.nan
+
+	return idx, weights
+
+
+def sample(field, idx, weights):
+	'''
+	Interpolate field (..., nlat, nlon) to stations in one gather: returns (..., nstn)
+	'''
+	flat = np.asarray(field).reshape(field.shape[:-2] + (-1,))
+
+	return (flat[..., idx] * weights).sum(axis=-1)
+
+
+def sample_product(ds, pollutants, stn_lats, stn_lons):
+	'''
+	Sample all statistics, levels and times of the requested pollutants from an open ensemble product
+	Returns dictionary by product variable name of (..., time, level, nstn) arrays
+	'''
+	idx, weights = get_weights(ds.variables['latitude'][:], ds.variables['longitude'][:], stn_lats, stn_lons)
+	outside = np.isnan(weights[:, 0]).sum()
+	if outside:
+		logging.warning(f'WARNING: {outside} stations are outside the dispersion grid, traces are set to NaN')
+
+	traces = {}
+	for pollutant in pollutants:
+		for stat in stats:
+			var = f'{pollutant}_{stat}'
+			if var in ds.variables:
+				traces[var] = sample(np.ma.filled(ds.variables[var][:], 0), idx, weights)
+
+	return traces
+
+
+def get_times(ds):
+	'''
+	Get start and stop datetime of each output period from the product time bounds
+	'''
+	epoch = dt.datetime(1970, 1, 1)
+
+	return [(epoch + dt.timedelta(float(t_start)), epoch + dt.timedelta(float(t_stop))) for t_start, t_stop in ds.variables['time_bnds'][:]]
+
+
+def get_trace_level(ds):
+	'''
+	Get index of the first non-deposition (non-zero) level of the product (first level if all are zero)
+	'''
+	air = np.flatnonzero(np.asarray(ds.variables['level'][:]))
+	if not len(air):
+		logging.warning('WARNING: product has deposition levels only, station traces use the first level')
+
+	return int(air[0]) if len(air) else 0
+
+
+def write_haw(out_file, times, ids, values, pollutant, level):
+	'''
+	Write station traces of one pollutant and level in con2stn column layout (one row per time, one column per station)
+	'''
+	with open(out_file, 'w') as f:
+		f.write(' Jday       YR1 MO1 DA1 HR1 MN1 YR2 MO2 DA2 HR2 MN2 Pol  Lev' + ''.join(f'{sid:>11}' for sid in ids) + '\n')
+		for (t_start, t_stop), row in zip(times, values):
+			jday = t_start.timetuple().tm_yday + t_start.hour / 24. + t_start.minute / 1440.
+			dates = ' '.join(f'{date.year % 100:3d} {date.month:3d} {date.day:3d} {date.hour:3d} {date.minute:3d}' for date in (t_start, t_stop))
+			f.write(f'{jday:9.3f} {dates} {pollutant:>4} {level:4d}' + ''.join(f' {val:10.4E}' for val in row) + '\n')
+	logging.info(f'...saving station traces: {out_file}')
+
+	return
+
+
+def write_table(out_file, ds, traces, times, ids, stn_lats, stn_lons):
+	'''
+	Write all sampled traces as a long-format table: one row per station, time, level, statistic and pollutant
+	'''
+	levels = ds.variables['level'][:]
+	frames = []
+	for var, values in traces.items():
+		pollutant, stat = var.rsplit('_', 1)
+		var_dims = ds.variables[var].dimensions
+
+		#statistics with an extra leading dimension (thresholds, percentiles) are labelled by its values
+		if len(var_dims) == 5:
+			labels = [f'{stat}_{val:g}' for val in ds.variables[var_dims[0]][:]]
+		else:
+			labels, values = [stat], values[None]
+
+		#index order matches sampled array: (stat, time, level, station)
+		index = pd.MultiIndex.from_product([labels, [t_start for t_start, t_stop in times], levels, ids], names=['statistic', 'time', 'level', 'station'])
+		frame = pd.DataFrame({'value': values.ravel()}, index=index).reset_index()
+		frame.insert(0, 'pollutant', pollutant)
+		frame['units'] = ds.variables[var].units
+		frames.append(frame)
+
+	table = pd.concat(frames, ignore_index=True)
+	stn_loc = pd.DataFrame({'station': ids, 'lat': stn_lats, 'lon': stn_lons})
+	table = table.merge(stn_loc, on='station', how='left')
+	table.to_csv(out_file, index=False, float_format='%.6g')
+	logging.info(f'...saving station table: {out_file}')
+
+	return
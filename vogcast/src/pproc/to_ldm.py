@@ -8,6 +8,7 @@ __date__="December 2022"
 from set_vog_env import *
 import logging
 import os
+from pproc import ens_stats
 
 ### Functions ###
 
@@ -28,7 +29,7 @@ def to_ldm(ldm_path):
 
 
 	#push data (requires ssh key) to ladm
-	file_list = ['poe_lvl1_SO2.nc','poe_lvl1_SO4.nc','cmean_SO2.nc','cmean_SO4.nc','poe_lvl2_SO2.nc','poe_lvl2_SO4.nc','poe_lvl3_SO2.nc','poe_lvl3_SO4.nc']
+	file_list = [ens_stats.product_file.format(os.environ['forecast'])]
 	for item in file_list:
 		#copy file to uila
 		uila_file_path = os.path.join(ldm_dir,item)
@@ -9,6 +9,7 @@ import sys, getopt
 import argparse
 import logging
 import hjson
+from contextlib import contextmanager
  ### Fucntions ###
 
 def read_config(config_path):
@@ -116,6 +117,24 @@ def write_json(json_path, json_data):
 	return
 
 
+@contextmanager
+def atomic_write(path, suffix='.tmp'):
+	'''
+	Yield a temporary path to write to, moved into place only once writing completes
+	(readers never see a partial file; the temporary file is removed if writing fails)
+	'''
+	tmp_path = path + suffix
+	try:
+		yield tmp_path
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+	os.replace(tmp_path, path)
+
+	return
+
+
 def read_json(json_path):
 	'''
 	Read some json file - same as above, repeated for convenience
@@ -127,20 +146,15 @@ def read_json(json_path):
 
 
 
-def update_user_settings(run_modules):
+def update_user_settings(settings):
 	'''
-	Update user settings for partial reruns
+	Update user settings for partial reruns (the pipeline scheduler decides which modules need to run)
 	'''
 	logging.warning('WARNING: this is a pipeline RERUN')
 	
-	#read existing config json and run json
-	user_defined = read_config(os.environ['config_path'])	
+	#replace user settings in existing run json, keeping outputs of previous module runs
 	json_data = read_run_json()
-
-	#loop through modules to be rerun and overwrite corresponding settings
-	for module in run_modules:
-		logging.debug('...updating user-settings for "{}" module'.format(module))
-		json_data['user_defined'][module] = user_defined[module]
+	json_data['user_defined'] = settings
 
 	#write updated run json
 	update_run_json(json_data)
@@ -13,8 +13,11 @@ from set_vog_env import *
 import glob
 import plumerise.preproc_src as prepcwipp
 import plumerise.cwipp as cwipp
-import matplotlib.pyplot as plt #NOTE this is for testing only
+import plumerise.emitimes as emitimes
+import numpy as np
+import matplotlib.pyplot as plt #NOTE this is for diagnostic plots only
 import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
 
 
 #turn off font warnings in logging
@@ -23,6 +26,8 @@ logging.getLogger('matplotlib.font_manager').disabled = True
 ### Inputs ####
 # Some of these are specific to selected options (may or not be used in a given workflow)
 emit_levels = 5 		#number of layers to approximate veritical emissions distribution with (CWIPP)
+plot_workers = 4 		#number of processes for rendering diagnostic CWIPP plots
+pending_plots = [] 		#(pool, futures) of CWIPP plots still rendering, joined by wait_cwipp_plots at the end of the pipeline
 
 
  ### Fucntions ###
@@ -83,10 +88,10 @@ def static_area(source, emissions,iSrc):
 	to_mg_per_hr = (1./24) * 1e9 	#converstion factor from tonnes/day to mg/hr
 
 	### main ###
-	lat, lon, height, area = str(source['lat']), str(source['lon']), str(source['height']),  str(source['area'])
-	so2 = str(to_mg_per_hr * emissions['so2'])
+	so2 = to_mg_per_hr * emissions['so2']
 
-	lines = lat + ' ' + lon + ' ' + height + ' ' + so2 + ' ' + area
+	#source line for CONTROL file: lat lon height rate area
+	line = [source['lat'], source['lon'], source['height'], so2, source['area']]
 
 	#append main run json with area source data
 	#json_data = read_run_json()
@@ -97,19 +102,68 @@ def static_area(source, emissions,iSrc):
 	#	json_data['plumerise']['src_cnt'] = iSrc + 1
 	#update_run_json(json_data)
 
-	#get source count and lines for CONTROL file
-	if iSrc == 0:
-		#json_data['plumerise'] = {'sources': lines, 'src_cnt' : 1}
-		src_lines = lines
-	else:
-		src_lines = '\\n' + lines
-		#json_data['plumerise']['sources'] = json_data['plumerise']['sources'] + '\\n' + lines
-		#json_data['plumerise']['src_cnt'] = iSrc + 1
-	
+	return line
+
+def plot_cwipp_hour(save_path, hour_data):
+	'''
+	Plot sounding and modelled vog profile for a single source-hour
+	'''
+	plt.figure()
+	ax1 = plt.gca()
+	ax1.set(xlabel='potential temperature (K)', ylabel='height (m)')
+	l_sound = plt.plot(hour_data['sounding'], hour_data['interpZ'], color='C0', label='WRF sounding')
+	l_zi = plt.axhline(y = hour_data['zi'], ls='--', color='C0', label='broundary layer height')
+	l_zCL = plt.axhline(y = hour_data['zCL'], color='C1',ls=':', label='modelled injection height')
+	ax2 = plt.twiny(ax1)
+	l_cwipp = plt.plot(hour_data['profile'], hour_data['interpZ'], color='C1',label='modelled profile')
+	plt.gca().set(xlabel='normalized concentration', ylabel='height [m]')
+	plt.xlim(xmin=0)
+	plt.legend([l_sound[0],l_zi,l_zCL,l_cwipp[0]],['WRF sounding','boundary layer height','modelled injection height','modelled vog profile'],loc=2)
+	plt.savefig(save_path)
+	plt.close()
+
+	return
+
+def render_cwipp_plots(hires_path):
+	'''
+	Render diagnostic cwipp plots from saved high-resolution output in a background process pool
+	Plots are added to pending_plots and keep rendering while the pipeline moves on
+	'''
+	hires_out = read_json(hires_path)
+	save_dir = os.path.join(os.environ['run_dir'],os.environ['forecast'],'plumerise')
+	logging.info('Rendering CWIPP diagnostic plots in the background')
+
+	pool = ProcessPoolExecutor(max_workers=plot_workers)
+	futures = {}
+	for tag in hires_out.keys():
+		for dtime in hires_out[tag].keys():
+			#keep original naming for single-source runs
+			if len(hires_out) == 1:
+				save_path = os.path.join(save_dir, '{}.png'.format(dtime))
+			else:
+				save_path = os.path.join(save_dir, '{}_{}.png'.format(tag,dtime))
+			futures[save_path] = pool.submit(plot_cwipp_hour, save_path, hires_out[tag][dtime])
+	pending_plots.append((pool, futures))
+
+	return
 
-	return src_lines
+def wait_cwipp_plots():
+	'''
+	Wait for background cwipp plots to complete; failed plots are logged but do not stop the run
+	'''
+	while pending_plots:
+		pool, futures = pending_plots.pop()
+		for save_path, future in futures.items():
+			try:
+				future.result()
+			except Exception as err:
+				logging.warning(f'WARNING: failed to render CWIPP diagnostic plot {save_path}: {err}')
+		pool.shutdown()
+		logging.info(f'...rendered {len(futures)} CWIPP diagnostic plots')
+
+	return
 
-def run_cwipp():
+def run_cwipp(plots=True):
 	'''
 	Run dynamic plume rise model
 	'''
@@ -124,55 +178,49 @@ def run_cwipp():
 	#set up output dictionary
 	output = {}
 
-	#extra high-resolution output for research
-	#TODO: remove
+	#extra high-resolution output for research and diagnostic plots
 	hires_out = {}
 
-	#loop through available timestamps
-	for tag in cwippinputs.keys():
-		logging.debug(f'Processing source: {tag}')
-		output[tag] = {}
-		
-		hires_out[tag] = {}
-		
-		#loop through all hours
-		for dtime in cwippinputs[tag].keys():
-			src = cwippinputs[tag][dtime]
-		
-			#run cwipp model
-			plume = cwipp.Plume(tag)
-			plume.get_sounding(src)
-			plume.I = src['I']
-			plume.iterate(biasFit)
-			plume.classify()
-			plume.get_uBL(src)
-			plume.get_profile()
-			output[tag][dtime] = {}
-			output[tag][dtime]['fractions'] = plume.layer_fractions
-			output[tag][dtime]['heights'] = plume.layer_heights
-			logging.debug('...{}: estimated mean injection height is {:.1f} m'.format(dtime,plume.zCL))
+	#stack all sources and hours into a single batch
+	cases = [(tag, dtime) for tag in cwippinputs.keys() for dtime in cwippinputs[tag].keys()]
+	srcs = [cwippinputs[tag][dtime] for tag, dtime in cases]
+	logging.debug(f'Solving plume rise for {len(cwippinputs)} sources, {len(cases)} source-hours')
+
+	#run cwipp model for all cases at once
+	plumes = cwipp.PlumeBatch([f'{tag}_{dtime}' for tag, dtime in cases])
+	plumes.get_sounding(srcs)
+	plumes.I = [src['I'] for src in srcs]
+	plumes.iterate(biasFit)
+	plumes.classify()
+	plumes.get_uBL(srcs)
+	plumes.get_profile()
+
+	#unpack results by source and hour
+	for n, (tag, dtime) in enumerate(cases):
+		if tag not in output:
+			logging.debug(f'Processing source: {tag}')
+			output[tag] = {}
+			hires_out[tag] = {}
+
+		output[tag][dtime] = {}
+		output[tag][dtime]['fractions'] = plumes.layer_fractions[n].tolist()
+		output[tag][dtime]['heights'] = plumes.layer_heights[n].tolist()
+		logging.debug('...{}: estimated mean injection height is {:.1f} m'.format(dtime,plumes.zCL[n]))
 	
-			hires_out[tag][dtime] = {}
-			hires_out[tag][dtime]['profile'] = plume.profile
-			hires_out[tag][dtime]['interpZ'] = plume.interpZ.tolist()
-
-			plt.figure()
-			ax1 = plt.gca()
-			ax1.set(xlabel='potential temperature (K)', ylabel='height (m)')
-			l_sound = plt.plot(plume.sounding, plume.interpZ, color='C0', label='WRF sounding')
-			l_zi = plt.axhline(y = plume.zi, ls='--', color='C0', label='broundary layer height')
-			l_zCL = plt.axhline(y = plume.zCL, color='C1',ls=':', label='modelled injection height')
-			ax2 = plt.twiny(ax1)
-			l_cwipp = plt.plot(plume.profile, plume.interpZ, color='C1',label='modelled profile')
-			plt.gca().set(xlabel='normalized concentration', ylabel='height [m]')
-			plt.xlim(xmin=0)
-			plt.legend([l_sound[0],l_zi,l_zCL,l_cwipp[0]],['WRF sounding','boundary layer height','modelled injection height','modelled vog profile'],loc=2)
-			save_dir = os.path.join(os.environ['run_dir'],os.environ['forecast'],'plumerise')
-			plt.savefig(save_dir + '/{}.png'.format(dtime))
-			plt.close()
+		hires_out[tag][dtime] = {}
+		hires_out[tag][dtime]['profile'] = plumes.profile[n].tolist()
+		hires_out[tag][dtime]['interpZ'] = plumes.interpZ.tolist()
+		hires_out[tag][dtime]['sounding'] = plumes.sounding[n].tolist()
+		hires_out[tag][dtime]['zi'] = float(plumes.zi[n])
+		hires_out[tag][dtime]['zCL'] = float(plumes.zCL[n])
+
 	write_json('cwipp_output.json',output)
 	write_json('hires_output.json',hires_out)
 
+	#diagnostic plots are rendered off the critical path, if requested
+	if plots:
+		render_cwipp_plots(os.path.abspath('hires_output.json'))
+
 	return
 
 def generate_emitimes(vent,emissions):
@@ -182,82 +230,43 @@ def generate_emitimes(vent,emissions):
 
 	logging.info('Generating EMITIMES file for HYSPLIT')
 
-	#format of EMITIMES file
-	info_lines = 'YYYY MM DD HH DURATION(hhhh) #RECORDS\nYYYY MM DD HH MM DURATION(hhmm) LAT LON HGT(m) RATE(/h) AREA(m2) HEAT(w)\n'
-
 	#read plumerise data
 	cwippdata = read_json('cwipp_output.json')
-	
-	#string storage for control lines
-	control_lines = ''
-
-	#open write file$
-	#TODO wipe old file$
-	with open('../hysplit/EMITIMES', 'w') as emitimes:
-		emitimes.write(info_lines)
-
-		#EMITIMES wants all sources under one time block, our data is all times under single source block
-		#pull the first tag (shouldn't matter cuz all times are the same)
-		tags = list(cwippdata.keys())
-		datetimes = cwippdata[tags[0]].keys()
-		
 
-		##loop through available timestamps
-		#for tag in cwippdata.keys():
-		#	logging.debug('...processing source: {}'.format(tag))
-
-		#loop through emission cyles
-		#for t, dtime in enumerate(cwippdata[tag].keys()):
-		for t, dtime in enumerate(datetimes):
-			#convert to datetime for convenience
-			emitdate = dt.datetime.strptime(dtime, '%Y%m%d%H')
-			spnp = int(os.environ['spinup'])			
-
-			rec_cnt = int(emit_levels * 2 * len(tags))
-
-			#generate block header			
-			header = emitdate.strftime('%Y %m %d %H ') + f'0001 {rec_cnt} \n'
-			emitimes.write(header)
-
-			loc_lines = ''
-
-			for tag in cwippdata.keys():
-				for layer in range(emit_levels):
-					# conversion of emisisons
-					to_mg_per_hr = (1./24) * 1e9    #converstion factor from tonnes/day to mg/hr
-					so2 = str(int(to_mg_per_hr * emissions[tag]['so2'] * cwippdata[tag][dtime]['fractions'][layer])) 
-
-					#get height and location data as strings
-					hgt = str(int(cwippdata[tag][dtime]['heights'][layer]))
-					lat, lon, area = str(vent[tag]['lat']), str(vent[tag]['lon']), str(vent[tag]['area'][t+spnp])					
-
-					#generate source lines for SO2 and SO4
-					#TODO THIS IS SO HARDCODED!! FIX!!
-					so2_line = emitdate.strftime('%Y %m %d %H ') + '00 0100 ' + lat + ' ' + lon  + ' ' + hgt  + ' ' + so2 + ' ' + area + ' 0\n'
-					emitimes.write(so2_line)	
-					so4_line = emitdate.strftime('%Y %m %d %H ') + '00 0100 ' + lat + ' ' + lon  + ' ' + hgt  + ' 0 ' + area + ' 0\n'
-					emitimes.write(so4_line)
+	#EMITIMES wants all sources under one time block, our data is all times under single source block
+	#pull the first tag (shouldn't matter cuz all times are the same)
+	tags = list(cwippdata.keys())
+	datetimes = list(cwippdata[tags[0]].keys())
+	emitdates = [dt.datetime.strptime(dtime, '%Y%m%d%H') for dtime in datetimes]
+	spnp = int(os.environ['spinup'])
 	
-					#generate lines for hysplit CONTROL file
-					loc_lines = loc_lines + lat + ' ' + lon + ' ' + hgt + ' ' + so2 + ' ' + area + '\\n'
-				
-
-		#update control lines
-		control_lines = control_lines + loc_lines
+	# conversion of emisisons
+	to_mg_per_hr = (1./24) * 1e9    #converstion factor from tonnes/day to mg/hr
+
+	#assemble (time, location) arrays: one location per source and emission layer
+	lat = [vent[tag]['lat'] for tag in tags for layer in range(emit_levels)]
+	lon = [vent[tag]['lon'] for tag in tags for layer in range(emit_levels)]
+	heights = np.array([[cwippdata[tag][dtime]['heights'][layer] for tag in tags for layer in range(emit_levels)] for dtime in datetimes])
+	fractions = np.array([[cwippdata[tag][dtime]['fractions'][layer] for tag in tags for layer in range(emit_levels)] for dtime in datetimes])
+	#run json files without an hourly series hold the scalar rate for the whole run
+	so2_hourly = {tag: emissions[tag].get('so2_hourly', [emissions[tag]['so2']] * (spnp + len(datetimes))) for tag in tags}
+	so2_rate = np.array([[to_mg_per_hr * so2_hourly[tag][t+spnp] for tag in tags for layer in range(emit_levels)] for t in range(len(datetimes))])
+	areas = [[vent[tag]['area'][t+spnp] for tag in tags for layer in range(emit_levels)] for t in range(len(datetimes))]
+
+	#get rates for SO2 and SO4 (SO4 has no direct emissions)
+	#TODO THIS IS SO HARDCODED!! FIX!!
+	so2 = (so2_rate * fractions).astype(int)
+	rates = np.stack([so2, np.zeros_like(so2)], axis=2)
+
+	#stream records to EMITIMES file
+	emitimes.write_emitimes('../hysplit/EMITIMES', emitdates, lat, lon, heights, rates, areas)
+
+	#generate source lines for hysplit CONTROL file (from the last emission cycle)
+	control_lines = [list(line) for line in zip(lat, lon, heights[-1].astype(int).tolist(), so2[-1].tolist(), areas[-1])]
 
 	#count total number of source lines for control file
 	src_cnt = len(cwippdata.keys()) * emit_levels
 
-	#remove newline character from the last line
-	control_lines = control_lines[:-2]
-
-	#append main run json with area source data
-	#json_data = read_run_json()
-	#json_data['plumerise'] = {'sources': control_lines, 'src_cnt' : src_cnt}
-	#json_data['vent'] = vent
-	#update_run_json(json_data)
-
-
 	return src_cnt, control_lines
 
 def check_model_compatibility(json_data,tag):
@@ -292,7 +301,7 @@ def main():
 
 	#storage lists for source counts and lines (eventually added to hysplit CONTROL file)
 	hys_src_cnt = 0
-	hys_src_lines = ''
+	hys_src_lines = []
 
 	cwipp_done = 0
 
@@ -311,18 +320,21 @@ def main():
 		
 		if source['pr_model']=='static_area':
 			#standard hysplit area source option
-			lines = static_area(source, emissions[tag], iSrc)
+			line = static_area(source, emissions[tag], iSrc)
 	
 			#update vent info for control file
 			hys_src_cnt = hys_src_cnt + 1
-			hys_src_lines = hys_src_lines + lines
+			hys_src_lines.append(line)
 
 		elif source['pr_model']=='cwipp':
 			#dynamic plume rise model adapted from widlfire
 			#if any of the sources use cwipp, run the preprocessor (but only the first time)
 			if cwipp_done==0:
 				vent = prepcwipp.main()
-				run_cwipp()
+				#diagnostic plots are on unless turned off for all cwipp sources
+				cwipp_srcs = [src for src in json_data['user_defined']['source'].values() if src['pr_model']=='cwipp']
+				plots = any(src.get('plots', True) for src in cwipp_srcs)
+				run_cwipp(plots)
 				src_cnt, lines = generate_emitimes(vent,emissions)
 				cwipp_done = 1
 				json_data['vent'] = vent
@@ -0,0 +1,48 @@
+#Shared test setup: pipeline modules are imported from vogcast/src (as when run by vog-run)
+
+import os
+import sys
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def stand_in_server():
+	'''
+	Local HTTP server standing in for remote services (HVO-API, image servers)
+	-server.routes[path] = (status, content type, body[, advertised length]); unknown paths return 404
+	-an advertised length larger than the body simulates a connection dropped mid-transfer
+	-server.requests: list of (method, path) received
+	'''
+	routes, received = {}, []
+
+	class Handler(BaseHTTPRequestHandler):
+		def respond(self):
+			received.append((self.command, self.path))
+			self.rfile.read(int(self.headers.get('Content-Length', 0)))
+			status, ctype, body, *length = routes.get(self.path, (404, 'text/html', b'<html>not found</html>'))
+			self.send_response(status)
+			self.send_header('Content-Type', ctype)
+			self.send_header('Content-Length', str(length[0] if length else len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+			if length:
+				self.close_connection = True
+
+		do_GET = do_POST = respond
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	server.daemon_threads = True
+	server.url = f'http://127.0.0.1:{server.server_address[1]}/'
+	server.routes, server.requests = routes, received
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
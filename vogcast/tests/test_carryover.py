@@ -0,0 +1,68 @@
+#Tests for the compressed carryover store passed between forecast cycles
+
+import os
+import pytest
+import carryover
+
+date_str = '2026101700'
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+	'''
+	Carryover store saved per member from three members with distinct particle dumps
+	'''
+	run_dir = tmp_path / 'run'
+	run_dir.mkdir()
+	monkeypatch.chdir(run_dir)
+	for member in [1, 2, 3]:
+		(run_dir / f'PARDUMP.{member:03d}').write_bytes(bytes([member]) * 1000)
+	store_path = str(tmp_path / 'carryover')
+	assert carryover.save(store_path, date_str, [1, 2, 3], per_member=True)
+
+	#restore in a clean run directory
+	next_dir = tmp_path / 'next'
+	next_dir.mkdir()
+	monkeypatch.chdir(next_dir)
+
+	return store_path
+
+
+def read(path):
+	with open(path, 'rb') as f:
+		return f.read()
+
+
+def test_save_nothing(tmp_path):
+	assert not carryover.save(str(tmp_path), date_str, [])
+	assert os.listdir(tmp_path) == []
+
+
+def test_restore_shared_fallback(store):
+	os.remove(carryover.get_carryover_file(store, date_str, 2))
+
+	assert carryover.restore(store, date_str, [1, 2, 3], per_member=True)
+	assert read('PARINIT.001') == bytes([1]) * 1000
+	#member without its own file falls back to shared carryover (first member)
+	assert read('PARINIT.002') == bytes([1]) * 1000
+	assert read('PARINIT.003') == bytes([3]) * 1000
+
+
+def test_restore_missing(store):
+	os.remove(carryover.get_carryover_file(store, date_str, 2))
+	os.remove(carryover.get_carryover_file(store, date_str))
+
+	#members after the missing one are still linked
+	assert not carryover.restore(store, date_str, [1, 2, 3], per_member=True)
+	assert read('PARINIT.001') == bytes([1]) * 1000
+	assert not os.path.exists('PARINIT.002')
+	assert read('PARINIT.003') == bytes([3]) * 1000
+
+
+def test_restore_corrupt(store):
+	with open(carryover.get_carryover_file(store, date_str) + '.sha256', 'w') as f:
+		f.write('0' * 64 + '\n')
+
+	assert not carryover.restore(store, date_str, [1, 2])
+	assert not os.path.exists('PARINIT.001') and not os.path.exists('PARINIT.002')
+	assert not os.path.exists(carryover.local_parinit)
@@ -0,0 +1,54 @@
+#Regression tests: batched CWIPP solver against the single-plume solver on synthetic soundings
+
+import numpy as np
+import pytest
+from plumerise import cwipp
+
+bias_fit = [0.9195, 137.9193]
+heights = np.arange(0, 13000., 100.)
+
+
+def sounding(zi, lapse=0.004):
+	'''
+	Well-mixed boundary layer (300 K) capped by a stable layer with given lapse rate (K/m)
+	'''
+	return {'Z': heights, 'T': 300 + np.where(heights > zi, (heights - zi) * lapse, 0.), 'PBLH': zi}
+
+
+#(inputs, intensity): converging plumes, zero BL height, null/negative intensity and no-root cases
+cases = [(sounding(1000), 1e5), (sounding(300), 2e4), (sounding(600, 0.01), 3e4), (sounding(2000, 0.002), 1e6),
+	(sounding(0), 1e5), (sounding(800), 0.), (sounding(0), -5.), (sounding(0, 1e-5), 1e9)]
+
+
+def solve_single(inputs, intensity):
+	plume = cwipp.Plume('test')
+	plume.get_sounding(inputs)
+	plume.I = intensity
+	plume.iterate(bias_fit)
+
+	return plume
+
+
+def test_batch_matches_single():
+	batch = cwipp.PlumeBatch([f'case{n}' for n in range(len(cases))])
+	batch.get_sounding([inputs for inputs, intensity in cases])
+	batch.I = [intensity for inputs, intensity in cases]
+	batch.iterate(bias_fit)
+
+	for n, (inputs, intensity) in enumerate(cases):
+		plume = solve_single(inputs, intensity)
+		assert batch.zCL[n] == pytest.approx(plume.zCL, abs=0.5), f'case {n}'
+		assert batch.THzCL[n] == pytest.approx(plume.THzCL), f'case {n}'
+		assert batch.zi[n] == plume.zi
+
+
+def test_special_cases():
+	batch = cwipp.PlumeBatch(['zero_bl', 'null_intensity', 'zero_bl_null_intensity', 'zero_bl_no_root', 'no_root'])
+	batch.get_sounding([sounding(0), sounding(800), sounding(0), sounding(0, 1e-5), sounding(1000, 1e-5)])
+	batch.I = [1e5, 0., -5., 1e9, 1e9]
+	batch.iterate(bias_fit)
+
+	#zero BL height is reset to 200 m for active plumes, plumes without a solution are injected at BL top
+	assert list(batch.zi) == [200., 800., 0., 200., 1000.]
+	assert batch.zCL[0] > 200.
+	assert list(batch.zCL[1:]) == [800., 0., 200., 1000.]
@@ -0,0 +1,84 @@
+#Tests for the local HVO emissions record store
+
+import datetime as dt
+import pytest
+import emissions_store
+
+utc = dt.timezone.utc
+
+
+def response(hours, values=None, series='so2'):
+	'''
+	HVO-API style response with one record per given hour of 2026-10-17 (UTC)
+	'''
+	values = values or [10 * (hr + 1) for hr in hours]
+	results = [{'date': f'2026-10-17T{hr:02d}:00:00+0000', series: value} for hr, value in zip(hours, values)]
+	return {'nr': len(results), 'results': results}
+
+
+def at(hour, minute=0):
+	return dt.datetime(2026, 10, 17, hour, minute, tzinfo=utc)
+
+
+@pytest.fixture
+def store(tmp_path):
+	conn = emissions_store.open_store(str(tmp_path / 'emissions.db'))
+	yield conn
+	conn.close()
+
+
+def test_ingest(store):
+	assert emissions_store.ingest(store, 'SUMDFW', 'so2', response([0, 1, 2], [5, None, 7])) == 2
+	#existing records are skipped
+	assert emissions_store.ingest(store, 'SUMDFW', 'so2', response([2, 3])) == 2
+	assert store.execute('SELECT COUNT(*) FROM records').fetchone()[0] == 3
+	assert emissions_store.get_record(store, 'SUMDFW', 'so2', at(2), 'before')[2] == 7
+
+
+def test_get_nearest(store):
+	emissions_store.ingest(store, 'SUMDFW', 'so2', response([0, 2, 4]))
+
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(2, 50)) == (30, '2026-10-17T02:00:00+0000')
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(3, 10)) == (50, '2026-10-17T04:00:00+0000')
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(4)) == (50, '2026-10-17T04:00:00+0000')
+	#outside the stored records, or for another channel
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(5)) is None
+	assert emissions_store.get_nearest(store, 'OTHER', 'so2', at(2)) is None
+
+
+def test_get_nearest_gap(store):
+	#two separate pulls with an un-ingested period between them
+	emissions_store.ingest(store, 'SUMDFW', 'so2', response([0, 1]))
+	emissions_store.ingest(store, 'SUMDFW', 'so2', response([20, 21]))
+
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(0, 30)) == (10, '2026-10-17T00:00:00+0000')
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(2)) is None
+	assert emissions_store.get_latest(store, 'SUMDFW', 'so2', at(10)) is None
+
+	#a pull spanning the gap makes it available
+	emissions_store.ingest(store, 'SUMDFW', 'so2', response([0, 20]))
+	assert emissions_store.get_nearest(store, 'SUMDFW', 'so2', at(2)) == (20, '2026-10-17T01:00:00+0000')
+	assert emissions_store.get_latest(store, 'SUMDFW', 'so2', at(10)) == (20, '2026-10-17T01:00:00+0000')
+
+
+def test_get_latest(store):
+	emissions_store.ingest(store, 'FLYA', 'dailybstfluxmean', response([0, 6, 12], series='dailybstfluxmean'))
+
+	assert emissions_store.get_latest(store, 'FLYA', 'dailybstfluxmean', at(11)) == (70, '2026-10-17T06:00:00+0000')
+	assert emissions_store.get_latest(store, 'FLYA', 'dailybstfluxmean', at(12)) == (130, '2026-10-17T12:00:00+0000')
+	#store must extend past the target time
+	assert emissions_store.get_latest(store, 'FLYA', 'dailybstfluxmean', at(13)) is None
+
+
+def test_get_series(store):
+	emissions_store.ingest(store, 'SUMDFW', 'so2', response([0, 3, 6, 9, 12]))
+
+	#closest records outside the interval are included for interpolation
+	times, values = emissions_store.get_series(store, 'SUMDFW', 'so2', at(4), at(7))
+	assert times == [emissions_store.to_epoch(at(hr)) for hr in [3, 6, 9]]
+	assert values == [40, 70, 100]
+	times, values = emissions_store.get_series(store, 'SUMDFW', 'so2', at(11), at(15))
+	assert values == [100, 130]
+	#past the last record only that record is returned (rate persists), no records at all for another channel
+	assert emissions_store.get_series(store, 'SUMDFW', 'so2', at(13), at(15)) == ([emissions_store.to_epoch(at(12))], [130])
+	assert emissions_store.get_series(store, 'OTHER', 'so2', at(4), at(7)) == ([], [])
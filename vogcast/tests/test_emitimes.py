@@ -0,0 +1,59 @@
+#Tests for EMITIMES writer and reader against the legacy line-by-line format
+
+import datetime as dt
+import numpy as np
+from plumerise import emitimes
+
+to_mg_per_hr = (1./24) * 1e9
+vent = {'src1': {'lat': 19.406, 'lon': -155.281, 'area': [12000.5, 12500.0, 13000.25]},
+	'src2': {'lat': 19.41, 'lon': -155.27, 'area': [800, 900, 1000]}}
+so2 = {'src1': 3500, 'src2': 120.5}
+dates = [dt.datetime(2026, 10, 17, hr) for hr in range(3)]
+heights = {tag: [[100. * (t + 1) + 500. * layer for layer in range(2)] for t in range(3)] for tag in vent}
+fractions = {tag: [[0.25, 0.75], [0.5, 0.5], [1., 0.]] for tag in vent}
+
+
+def legacy_text():
+	'''
+	EMITIMES text as written line by line by the original source.generate_emitimes (SO2 and SO4 record per layer)
+	'''
+	text = emitimes.info_lines
+	for t, date in enumerate(dates):
+		text += date.strftime('%Y %m %d %H ') + f'0001 {2 * 2 * len(vent)} \n'
+		for tag in vent:
+			for layer in range(2):
+				rate = str(int(to_mg_per_hr * so2[tag] * fractions[tag][t][layer]))
+				hgt = str(int(heights[tag][t][layer]))
+				lat, lon, area = str(vent[tag]['lat']), str(vent[tag]['lon']), str(vent[tag]['area'][t])
+				prefix = date.strftime('%Y %m %d %H ') + '00 0100 ' + lat + ' ' + lon + ' ' + hgt
+				text += prefix + ' ' + rate + ' ' + area + ' 0\n'
+				text += prefix + ' 0 ' + area + ' 0\n'
+
+	return text
+
+
+def test_round_trip(tmp_path):
+	#arrays as assembled by source.generate_emitimes: one location per source and layer
+	tags = list(vent)
+	lat = [vent[tag]['lat'] for tag in tags for layer in range(2)]
+	lon = [vent[tag]['lon'] for tag in tags for layer in range(2)]
+	hgt = np.array([[heights[tag][t][layer] for tag in tags for layer in range(2)] for t in range(3)])
+	frac = np.array([[fractions[tag][t][layer] for tag in tags for layer in range(2)] for t in range(3)])
+	rate = np.array([[to_mg_per_hr * so2[tag] for tag in tags for layer in range(2)] for t in range(3)])
+	area = [[vent[tag]['area'][t] for tag in tags for layer in range(2)] for t in range(3)]
+	rates = np.stack([(rate * frac).astype(int), np.zeros_like(rate, dtype=int)], axis=2)
+
+	path = str(tmp_path / 'EMITIMES')
+	emitimes.write_emitimes(path, dates, lat, lon, hgt, rates, area)
+	with open(path) as f:
+		assert f.read() == legacy_text()
+
+	records, headers = emitimes.read_emitimes(path)
+	assert [header['start'] for header in headers] == dates
+	assert [header['records'] for header in headers] == [8, 8, 8]
+	assert len(records['rate']) == 24
+	np.testing.assert_array_equal(records['rate'][::2], rates[:,:,0].ravel())
+	np.testing.assert_array_equal(records['rate'][1::2], 0)
+	np.testing.assert_array_equal(records['height'][::2], hgt.astype(int).ravel())
+	np.testing.assert_allclose(records['area'][::2], np.ravel(area))
+	np.testing.assert_array_equal(records['block'], np.repeat([0, 1, 2], 8))
@@ -0,0 +1,51 @@
+#Tests for ensemble statistics from synthetic member cdump files
+
+import numpy as np
+import netCDF4 as nc
+from pproc import ens_stats
+from test_hys_reader import write_cdump
+
+
+def test_open_members(tmp_path, caplog):
+	rng = np.random.default_rng(1)
+	conc = rng.random((4, 2, 2, 2, 3, 4)).astype(np.float32)
+	base = str(tmp_path / 'cdump')
+	write_cdump(f'{base}.001', conc[0], False)
+	#same pollutants in a different order
+	write_cdump(f'{base}.002', conc[1][:, ::-1], True, pollutants=['SO4', 'SO2'])
+	#inconsistent members: fewer output times, different levels
+	write_cdump(f'{base}.003', conc[2][:1], False)
+	write_cdump(f'{base}.004', conc[3], False, levels=[0, 500])
+
+	cdumps = ens_stats.open_members([1, 2, 3, 4, 5], base)
+	assert [cd.path for cd in cdumps] == [f'{base}.001', f'{base}.002']
+	assert 'cdump.003 does not match' in caplog.text and 'output times' in caplog.text
+	assert 'cdump.004 does not match' in caplog.text and 'levels' in caplog.text
+	assert 'unable to read' in caplog.text
+
+	#pollutants are located by name in each member
+	stats = ens_stats.compute_stats(cdumps, ['SO2', 'SO4'], {'SO2': 1., 'SO4': 2.}, {'SO2': [0.5]}, [50])
+	np.testing.assert_allclose(stats['SO2']['mean'], conc[:2, :, 0].mean(axis=0), rtol=1e-6)
+	np.testing.assert_allclose(stats['SO4']['mean'], 2 * conc[:2, :, 1].mean(axis=0), rtol=1e-6)
+	np.testing.assert_allclose(stats['SO2']['poe'][0], 100. * (conc[:2, :, 0] > 0.5).mean(axis=0))
+	for cd in cdumps:
+		cd.close()
+
+
+def test_write_product(tmp_path):
+	conc = np.random.default_rng(2).random((2, 2, 2, 2, 3, 4)).astype(np.float32)
+	base = str(tmp_path / 'cdump')
+	for m in range(2):
+		write_cdump(f'{base}.{m + 1:03d}', conc[m], False)
+	cdumps = ens_stats.open_members([1, 2], base)
+	stats = ens_stats.compute_stats(cdumps, ['SO2'], {'SO2': 1.}, {'SO2': [0.2, 0.8]}, [10, 90])
+
+	nc_path = str(tmp_path / 'vogcast_2026101700.nc')
+	ens_stats.write_product(nc_path, cdumps[0], stats, {'SO2': 'ppm'}, {'SO2': [0.2, 0.8]}, [10, 90])
+	assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith('vogcast')) == ['vogcast_2026101700.nc']
+	with nc.Dataset(nc_path) as ds:
+		assert ds.variables['SO2_poe'].shape == (2, 2, 2, 3, 4)
+		assert list(ds.variables['level'][:]) == [0, 100]
+		np.testing.assert_allclose(ds.variables['SO2_mean'][:], stats['SO2']['mean'])
+	for cd in cdumps:
+		cd.close()
@@ -0,0 +1,80 @@
+#Tests for thermal image mirroring against a stand-in HVO image server
+
+import os
+import datetime as dt
+import requests
+import pytest
+from plumerise import get_hvo_flir
+
+#image names are HST timestamps
+images = {'20261016230000_F1.npy': b'image-1' * 100,
+	'20261017000000_F1.npy': b'image-2' * 100,
+	'20261017010000_F1.npy': b'image-3' * 100,
+	'20261001000000_F1.npy': b'too-old' * 100}
+truncated = '20261017010000_F1.npy'
+
+
+@pytest.fixture
+def image_server(stand_in_server, monkeypatch):
+	'''
+	Serve a directory listing and images; one image connection drops mid-transfer
+	'''
+	monkeypatch.setattr(get_hvo_flir.time, 'sleep', lambda secs: None)
+	links = ''.join(f'<a href="{name}">{name}</a>' for name in list(images) + ['README.txt'])
+	stand_in_server.routes['/images'] = (200, 'text/html', f'<html><body>{links}</body></html>'.encode())
+	for name, data in images.items():
+		stand_in_server.routes[f'/images/{name}'] = (200, 'application/octet-stream', data)
+	stand_in_server.routes[f'/images/{truncated}'] = (200, 'application/octet-stream', images[truncated][:50], len(images[truncated]))
+
+	return stand_in_server
+
+
+def test_download_images(image_server, tmp_path):
+	flir_path = str(tmp_path / 'flir')
+	os.makedirs(flir_path)
+	catalog = get_hvo_flir.load_image_catalog(flir_path)
+	session = requests.Session()
+
+	listing = get_hvo_flir.get_dir_listing(image_server.url + 'images', session, 'npy')
+	assert sorted(os.path.basename(item) for item in listing) == sorted(images)
+
+	#window covers the 3 recent images (UTC), not the old one
+	window = (dt.datetime(2026, 10, 17, 8, tzinfo=dt.timezone.utc), dt.datetime(2026, 10, 17, 12, tzinfo=dt.timezone.utc))
+	downloaded = get_hvo_flir.download_images(listing, session, catalog, window)
+
+	#complete images land under their final name, the truncated one never does (nor do partial files)
+	assert sorted(downloaded) == ['20261016230000_F1.npy', '20261017000000_F1.npy']
+	assert sorted(os.listdir(flir_path)) == sorted(downloaded)
+	for name in downloaded:
+		with open(os.path.join(flir_path, name), 'rb') as f:
+			assert f.read() == images[name]
+	assert catalog['names'] == ['20261016230000_F1.npy', '20261017000000_F1.npy']
+	assert ('GET', '/images/20261001000000_F1.npy') not in image_server.requests
+
+	#images already available locally are not downloaded again
+	missing = get_hvo_flir.filter_listing(listing, catalog, window)
+	assert [os.path.basename(item) for item in missing] == [truncated]
+
+
+def test_catalog_rescan(tmp_path):
+	flir_path = str(tmp_path / 'flir')
+	os.makedirs(flir_path)
+	(tmp_path / 'flir' / '20261017000000_F1.npy').write_bytes(b'')
+	catalog = get_hvo_flir.load_image_catalog(flir_path)
+	assert catalog['names'] == ['20261017000000_F1.npy']
+
+	#image added within the same timestamp tick as the last scan: directory mtime is unchanged
+	dir_mtime = os.stat(flir_path).st_mtime
+	(tmp_path / 'flir' / '20261017010000_F1.npy').write_bytes(b'')
+	os.utime(flir_path, (dir_mtime, dir_mtime))
+	catalog = get_hvo_flir.load_image_catalog(flir_path)
+	assert catalog['names'] == ['20261017000000_F1.npy', '20261017010000_F1.npy']
+
+	#directory unchanged long before the last scan: stored catalog is used as is
+	old = dir_mtime - 3600
+	os.utime(flir_path, (old, old))
+	get_hvo_flir.update_image_catalog(catalog)
+	(tmp_path / 'flir' / '20261017020000_F1.npy').write_bytes(b'')
+	os.utime(flir_path, (old, old))
+	get_hvo_flir.update_image_catalog(catalog)
+	assert len(catalog['names']) == 2
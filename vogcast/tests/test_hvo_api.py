@@ -0,0 +1,91 @@
+#Tests for the HVO-API client layer against a local stand-in server
+
+import os
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import hvo_api
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch, stand_in_server):
+	'''
+	Point cache at a temporary run directory and return a keys file for the stand-in server
+	'''
+	monkeypatch.setenv('run_dir', str(tmp_path))
+	keypath = tmp_path / 'api.keys'
+	keypath.write_text(json.dumps({'hvo': {'user': 'user', 'pwd': 'pwd'}}))
+	return str(keypath), stand_in_server
+
+
+def test_cache_hit(api):
+	keypath, server = api
+	server.routes['/so2emissions/1d'] = (200, 'application/json', b'{"nr": 1, "results": [{"so2": 5}]}')
+
+	first = hvo_api.post(keypath, server.url + 'so2emissions/1d', {'channel': 'SUMDFW'})
+	second = hvo_api.post(keypath, server.url + 'so2emissions/1d', {'channel': 'SUMDFW'})
+	assert first == second == {'nr': 1, 'results': [{'so2': 5}]}
+	assert len(server.requests) == 1
+
+	#different request data is a different cache entry
+	hvo_api.post(keypath, server.url + 'so2emissions/1d', {'channel': 'OTHER'})
+	assert len(server.requests) == 2
+
+
+def test_concurrent_requests(api):
+	keypath, server = api
+	server.routes['/flyspec/1d'] = (200, 'application/json', json.dumps({'nr': 1, 'results': list(range(10000))}).encode())
+
+	#identical requests from a thread pool (as for emissions sources sharing a channel) all cache safely
+	with ThreadPoolExecutor(max_workers=8) as pool:
+		responses = list(pool.map(lambda n: hvo_api.post(keypath, server.url + 'flyspec/1d', {'channel': 'FLYA'}), range(8)))
+	assert all(response['results'] == list(range(10000)) for response in responses)
+	cache_file = hvo_api.get_cache_file(server.url + 'flyspec/1d', {'channel': 'FLYA'})
+	assert os.listdir(os.path.dirname(cache_file)) == [os.path.basename(cache_file)]
+
+
+def test_cache_expiry(api, monkeypatch):
+	keypath, server = api
+	server.routes['/so2emissions/1d'] = (200, 'application/json', b'{"nr": 0}')
+	hvo_api.post(keypath, server.url + 'so2emissions/1d', {})
+
+	#age the cached response past its lifetime: realtime entries are pulled again, permanent ones are not
+	cache_file = hvo_api.get_cache_file(server.url + 'so2emissions/1d', {})
+	old = os.path.getmtime(cache_file) - hvo_api.cache_ttl - 1
+	os.utime(cache_file, (old, old))
+	hvo_api.post(keypath, server.url + 'so2emissions/1d', {}, permanent=True)
+	assert len(server.requests) == 1
+	hvo_api.post(keypath, server.url + 'so2emissions/1d', {})
+	assert len(server.requests) == 2
+
+
+@pytest.mark.parametrize('status, body', [(502, b'<html>Bad Gateway</html>'), (401, b''), (200, b'<html>maintenance</html>')])
+def test_error_reply(api, status, body):
+	keypath, server = api
+	server.routes['/so2emissions/1d'] = (status, 'text/html', body)
+
+	with pytest.raises(SystemExit) as exit_info:
+		hvo_api.post(keypath, server.url + 'so2emissions/1d', {})
+	assert exit_info.value.code == 1
+	assert not os.path.isfile(hvo_api.get_cache_file(server.url + 'so2emissions/1d', {}))
+
+
+def test_search_window_doubling(api):
+	keypath, server = api
+	for days in [1, 2, 4]:
+		server.routes[f'/so2emissions/{days}d'] = (200, 'application/json', json.dumps({'nr': int(days == 4)}).encode())
+
+	response = hvo_api.search_window(lambda days: hvo_api.post(keypath, f'{server.url}so2emissions/{days}d', {}), \
+					lambda response: response['nr'] > 0)
+	assert response == {'nr': 1}
+	assert [path for method, path in server.requests] == ['/so2emissions/1d', '/so2emissions/2d', '/so2emissions/4d']
+
+
+def test_search_window_bounded(monkeypatch):
+	monkeypatch.setattr(hvo_api, 'max_search_days', 5)
+	windows = []
+
+	with pytest.raises(SystemExit) as exit_info:
+		hvo_api.search_window(lambda days: windows.append(days), lambda response: False)
+	assert exit_info.value.code == 1
+	assert windows == [1, 2, 4, 5]
@@ -0,0 +1,102 @@
+#Tests for the ensemble runner, using the fake hycs_ens executable in place of HYSPLIT
+
+import os
+import pytest
+import hys_ensemble
+import dispersion
+import carryover
+
+fake_hycs = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'hysplit', 'hycs_ens.fake')
+
+
+@pytest.fixture
+def hys_rundir(tmp_path, monkeypatch):
+	'''
+	HYSPLIT run directory with the fake executable linked in (as done by dispersion.link_hysplit)
+	'''
+	monkeypatch.chdir(tmp_path)
+	os.symlink(fake_hycs, 'hycs_ens')
+	monkeypatch.setenv('FAKE_HYCS_SLEEP', '0')
+	monkeypatch.delenv('FAKE_HYCS_FAIL', raising=False)
+	return tmp_path
+
+
+@pytest.mark.parametrize('setting, members', [(None, list(range(1, 28))), (3, [1, 2, 3]), ([5, 2, 2], [2, 5])])
+def test_get_members(setting, members):
+	assert hys_ensemble.get_members({} if setting is None else {'members': setting}) == members
+
+
+@pytest.mark.parametrize('setting', [0, 28, [0, 1], []])
+def test_get_members_invalid(setting):
+	with pytest.raises(ValueError):
+		hys_ensemble.get_members({'members': setting})
+
+
+def test_run_local(hys_rundir, monkeypatch):
+	monkeypatch.setenv('FAKE_HYCS_FAIL', '2')
+	results = hys_ensemble.run_local([1, 2, 3], workers=2)
+
+	assert [results[member]['exit'] for member in [1, 2, 3]] == [0, 1, 0]
+	assert os.path.isfile('hys_member.1.OK') and not os.path.isfile('hys_member.2.OK')
+	assert 'member 002 failed' in open(results[2]['log'] + '.err').read()
+
+	assert hys_ensemble.check_member(1, results[1])['status'] == 'ok'
+	failed = hys_ensemble.check_member(2, results[2])
+	assert failed['status'] == 'failed' and failed['missing'] == ['cdump.002', 'PARDUMP.002']
+
+	#outputs present but empty, or non-zero exit with outputs, are failures too
+	open('cdump.003', 'w').close()
+	assert hys_ensemble.check_member(3, results[3]) == dict(results[3], status='failed', missing=['cdump.003'])
+	assert hys_ensemble.check_member(1, dict(results[1], exit=1))['status'] == 'failed'
+
+
+def test_clean_member(hys_rundir):
+	hys_ensemble.run_local([1, 2], workers=2)
+	hys_ensemble.clean_member(1)
+
+	assert not any(os.path.exists(path) for path in ['hys_member.1.OK', 'cdump.001', 'PARDUMP.001'])
+	assert all(os.path.exists(path) for path in ['hys_member.2.OK', 'cdump.002', 'PARDUMP.002'])
+
+
+def test_unknown_executor(hys_rundir):
+	with pytest.raises(ValueError):
+		hys_ensemble.run_ensemble('pbs', [1])
+
+
+def test_run_tracked_retry(hys_rundir, monkeypatch):
+	#member 2 fails on the first attempt only
+	monkeypatch.setenv('FAKE_HYCS_FAIL', '2')
+	calls = []
+	run_ensemble = hys_ensemble.run_ensemble
+	def run_once_failing(executor, members, workers):
+		calls.append(list(members))
+		results = run_ensemble(executor, members, workers)
+		monkeypatch.delenv('FAKE_HYCS_FAIL', raising=False)
+		return results
+	monkeypatch.setattr(hys_ensemble, 'run_ensemble', run_once_failing)
+
+	summary = hys_ensemble.run_tracked('local', [1, 2, 3], workers=3, retries=1)
+	assert calls == [[1, 2, 3], [2]]
+	assert summary['failed'] == [] and summary['completed'] == 3
+	assert [summary['status'][m]['attempts'] for m in ['1', '2', '3']] == [1, 2, 1]
+	assert summary['status']['2']['status'] == 'ok'
+	assert hys_ensemble.read_json(hys_ensemble.summary_file) == summary
+
+
+def test_run_tracked_failed(hys_rundir, monkeypatch, tmp_path):
+	monkeypatch.setenv('FAKE_HYCS_FAIL', '2')
+	summary = hys_ensemble.run_tracked('local', [1, 2, 3], workers=3, retries=2)
+
+	assert summary['failed'] == [2] and summary['completed'] == 2
+	assert summary['status']['2'] == dict(summary['status']['2'], status='failed', exit=1, attempts=3, missing=['cdump.002', 'PARDUMP.002'])
+	assert hys_ensemble.read_json(hys_ensemble.summary_file)['status']['2']['status'] == 'failed'
+
+	#carryover is saved from completed members only
+	monkeypatch.setenv('forecast', '2026101700')
+	carryover_path = str(tmp_path / 'carryover')
+	json_data = {'user_defined': {'dispersion': {'members': [1, 2, 3], 'carryover_path': carryover_path, 'carryover_members': True}}}
+	dispersion.save_carryover(json_data, summary)
+	stored = sorted(os.listdir(carryover_path))
+	assert os.path.basename(carryover.get_carryover_file(carryover_path, '2026101700', 2)) not in stored
+	assert os.path.basename(carryover.get_carryover_file(carryover_path, '2026101700', 3)) in stored
+	assert os.path.basename(carryover.get_carryover_file(carryover_path, '2026101700')) in stored
@@ -0,0 +1,115 @@
+#Tests for native HYSPLIT cdump and PARDUMP readers, using small synthetic big-endian files
+
+import struct
+import datetime as dt
+import numpy as np
+import pytest
+from pproc import hys_reader
+
+levels = [0, 100]
+pollutants = ['SO2', 'SO4']
+
+
+def write_record(f, payload):
+	f.write(struct.pack('>i', len(payload)) + payload + struct.pack('>i', len(payload)))
+
+
+def write_cdump(path, conc, packed, pollutants=pollutants, levels=levels):
+	'''
+	Write cdump with concentrations of shape (ntimes, npollutants, nlevels, nlat, nlon), starting 2026-10-17 00Z
+	'''
+	nt, npol, nlev, nlat, nlon = conc.shape
+	with open(path, 'wb') as f:
+		write_record(f, b'NAMS' + struct.pack('>7i', 26, 10, 17, 0, 0, 1, int(packed)))
+		write_record(f, struct.pack('>4i3fi', 26, 10, 17, 0, 19.4, -155.3, 100., 0))
+		write_record(f, struct.pack('>2i4f', nlat, nlon, 0.1, 0.1, 19.0, -156.0))
+		write_record(f, struct.pack(f'>{nlev+1}i', nlev, *levels))
+		write_record(f, struct.pack('>i', npol) + b''.join(pol.ljust(4).encode() for pol in pollutants))
+		for t in range(nt):
+			write_record(f, struct.pack('>6i', 26, 10, 17, t, 0, t))
+			write_record(f, struct.pack('>6i', 26, 10, 17, t + 1, 0, t + 1))
+			for lvl in range(nlev):
+				for p in range(npol):
+					grid = conc[t, p, lvl]
+					header = pollutants[p].ljust(4).encode() + struct.pack('>i', levels[lvl])
+					if packed:
+						j, i = np.nonzero(grid)
+						points = np.zeros(len(i), dtype=hys_reader.Cdump.packed_dtype)
+						points['i'], points['j'], points['conc'] = i + 1, j + 1, grid[j, i]
+						write_record(f, header + struct.pack('>i', len(i)) + points.tobytes())
+					else:
+						write_record(f, header + grid.astype('>f4').tobytes())
+
+
+def write_pardump(path, dumps):
+	'''
+	Write PARDUMP with one block per (hour, mass (npar, npol), positions (npar, 3)) entry
+	'''
+	with open(path, 'wb') as f:
+		for hour, mass, positions in dumps:
+			npar, npol = mass.shape
+			write_record(f, struct.pack('>7i', npar, npol, 26, 10, 17, hour, 0))
+			for k in range(npar):
+				write_record(f, mass[k].astype('>f4').tobytes())
+				write_record(f, np.array(list(positions[k]) + [1, 2, 3], dtype='>f4').tobytes())
+				write_record(f, struct.pack('>5i', k, 0, 0, 1, k))
+
+
+@pytest.fixture
+def conc():
+	rng = np.random.default_rng(0)
+	values = rng.random((2, 2, 2, 3, 4)).astype(np.float32)
+	values[values < 0.5] = 0
+	return values
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_cdump(tmp_path, conc, packed):
+	path = str(tmp_path / 'cdump.001')
+	write_cdump(path, conc, packed)
+
+	with hys_reader.Cdump(path) as cd:
+		assert cd.packed == packed
+		assert cd.start == dt.datetime(2026, 10, 17, 0)
+		assert cd.levels == levels
+		assert cd.pollutants == pollutants
+		assert cd.shape == (3, 4)
+		np.testing.assert_allclose(cd.lats, [19.0, 19.1, 19.2], rtol=1e-6)
+		assert cd.times == [(dt.datetime(2026, 10, 17, t), dt.datetime(2026, 10, 17, t + 1)) for t in range(2)]
+		np.testing.assert_array_equal(cd.get(1, 'SO4', 1), conc[1, 1, 1])
+		np.testing.assert_array_equal(cd.get(0, 0, 0), conc[0, 0, 0])
+		np.testing.assert_array_equal(cd.get_all('SO2'), conc[:, 0])
+		np.testing.assert_array_equal(cd.get_all(1), conc[:, 1])
+
+
+def test_pardump(tmp_path):
+	path = str(tmp_path / 'PARDUMP.001')
+	mass = [np.array([[1., 2.], [3., 4.], [5., 6.]]), np.array([[7., 8.]])]
+	positions = [np.array([[19.1, -155.1, 10.], [19.2, -155.2, 20.], [19.3, -155.3, 30.]]), np.array([[19.4, -155.4, 40.]])]
+	write_pardump(path, [(0, mass[0], positions[0]), (1, mass[1], positions[1])])
+
+	pd = hys_reader.Pardump(path)
+	assert pd.times == [dt.datetime(2026, 10, 17, 0), dt.datetime(2026, 10, 17, 1)]
+	for t in range(2):
+		particles = pd.get(t)
+		assert len(particles) == len(mass[t])
+		np.testing.assert_allclose(particles['mass'], mass[t], rtol=1e-6)
+		np.testing.assert_allclose(particles['lat'], positions[t][:, 0], rtol=1e-6)
+		np.testing.assert_allclose(particles['height'], positions[t][:, 2], rtol=1e-6)
+	np.testing.assert_array_equal(pd.get(0)['nsort'], [0, 1, 2])
+	del particles
+	pd.close()
+
+
+def test_corrupt_record_marker(tmp_path, conc):
+	path = tmp_path / 'cdump.001'
+	write_cdump(str(path), conc, False)
+
+	#break the trailing marker of the first (header) record
+	data = bytearray(path.read_bytes())
+	length, = struct.unpack_from('>i', data, 0)
+	struct.pack_into('>i', data, 4 + length, length + 1)
+	path.write_bytes(bytes(data))
+
+	with pytest.raises(ValueError, match='corrupt fortran record'):
+		hys_reader.Cdump(str(path))
@@ -0,0 +1,98 @@
+#Tests for the pipeline scheduler, with stub stage functions in a temporary run directory
+
+import os
+import json
+import pytest
+import pipeline
+
+vog_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+settings = {stage: {'option': 1} for stage in pipeline.stages}
+settings.update({'runhrs': 24, 'spinup': 0, 'max_dom': 1, 'keys': 'keys.json'})
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+	'''
+	Run the pipeline with stub stages writing their declared outputs (which depend on stage config); returns the list of stages run
+	'''
+	monkeypatch.setenv('vog_root', vog_root)
+	monkeypatch.setenv('run_path', str(tmp_path))
+	monkeypatch.setenv('json_path', str(tmp_path / 'vog_run.json'))
+	(tmp_path / 'vog_run.json').write_text(json.dumps({}))
+	(tmp_path / 'hysplit').mkdir()
+	log, fail = [], set()
+	outputs = {'meteorology': 'hysplit/d01.arl', 'source': 'hysplit/EMITIMES', 'dispersion': 'hysplit/cdump.001', \
+			'post_process': 'hysplit/vogcast_2026101700.nc'}
+
+	def read_output(stage):
+		if stage == 'emissions':
+			return json.loads((tmp_path / 'vog_run.json').read_text()).get('emissions')
+		return (tmp_path / outputs[stage]).read_text() if stage in outputs else None
+
+	def stub(stage, config):
+		def stage_func():
+			log.append(stage)
+			if stage in fail:
+				raise SystemExit(1)
+			#outputs depend on stage config and upstream outputs
+			result = json.dumps([config[stage]] + [read_output(dep) for dep in pipeline.stages[stage]['after']])
+			if stage in outputs:
+				(tmp_path / outputs[stage]).write_text(result)
+			elif stage == 'emissions':
+				(tmp_path / 'vog_run.json').write_text(json.dumps({'emissions': result}))
+		return stage_func
+
+	def run_pipeline(config=settings, **kwargs):
+		log.clear()
+		pipeline.run({stage: stub(stage, config) for stage in pipeline.stages}, config, **kwargs)
+		return list(log)
+
+	run_pipeline.fail = fail
+	return run_pipeline
+
+
+def test_unchanged_rerun(run):
+	assert run(fresh=True) == list(pipeline.stages)
+	assert run() == []
+
+
+def test_config_change(run):
+	run(fresh=True)
+	changed = dict(settings, post_process={'option': 2})
+	assert run(changed) == ['post_process', 'extras']
+	assert run(changed) == []
+
+
+def test_output_change(run, tmp_path):
+	run(fresh=True)
+	#same size, different content: downstream stages rerun
+	emitimes = tmp_path / 'hysplit' / 'EMITIMES'
+	emitimes.write_text(emitimes.read_text().replace('1', '3'))
+	assert run(modules=['dispersion', 'post_process', 'extras']) == ['dispersion', 'post_process', 'extras']
+
+
+def test_failed_stage(run, tmp_path):
+	run(fresh=True)
+	changed = dict(settings, dispersion={'option': 2})
+	state = pipeline.read_state(str(tmp_path / pipeline.state_file))
+	run.fail.add('dispersion')
+	with pytest.raises(SystemExit):
+		run(changed)
+	assert pipeline.read_state(str(tmp_path / pipeline.state_file)) == state
+
+	#failed stage is rerun, and downstream stages after it
+	run.fail.clear()
+	assert run(changed) == ['dispersion', 'post_process', 'extras']
+
+
+def test_force_and_modules(run):
+	run(fresh=True)
+	#forced stage with unchanged outputs does not trigger downstream stages
+	assert run(force=['source']) == ['source']
+	assert run(force=['dispersion', 'extras']) == ['dispersion', 'extras']
+	assert run(force=['meteorology'], modules=['emissions', 'post_process']) == []
+
+	changed = dict(settings, emissions={'option': 2})
+	assert run(changed, modules=['emissions']) == ['emissions']
+	#stages left out earlier still see the changed upstream output
+	assert run(changed) == ['source', 'dispersion', 'post_process', 'extras']
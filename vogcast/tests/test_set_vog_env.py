@@ -0,0 +1,22 @@
+#Tests for shared run environment helpers
+
+import pytest
+from set_vog_env import atomic_write
+
+
+def test_atomic_write(tmp_path):
+	path = str(tmp_path / 'EMITIMES')
+	with atomic_write(path) as tmp:
+		with open(tmp, 'w') as f:
+			f.write('complete')
+		assert not (tmp_path / 'EMITIMES').exists()
+	assert (tmp_path / 'EMITIMES').read_text() == 'complete'
+
+	#failed write leaves the previous file and no temporary file
+	with pytest.raises(RuntimeError):
+		with atomic_write(path) as tmp:
+			with open(tmp, 'w') as f:
+				f.write('partial')
+			raise RuntimeError('interrupted')
+	assert (tmp_path / 'EMITIMES').read_text() == 'complete'
+	assert sorted(p.name for p in tmp_path.iterdir()) == ['EMITIMES']